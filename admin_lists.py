@@ -0,0 +1,95 @@
+# admin_lists.py
+"""
+Paged, searchable user and membership lists for the admin pages.
+
+Pages are keyset-paginated: the next page starts after the last row's
+(name, id), so every page is one index range read however far in it is,
+and rows added meanwhile don't shift pages. Search is a case-insensitive
+prefix on username / display name, answered from the NOCASE indexes as a
+range (`name >= 'ab' AND name < 'ab\\U0010ffff'`).
+"""
+
+PAGE_SIZE = 50
+SUGGEST_LIMIT = 20
+
+# Sorts after every character, so [q, q + _MAX_CHAR) is "starts with q"
+_MAX_CHAR = "\U0010ffff"
+
+
+def _prefix(q: str):
+    q = (q or "").strip()
+    return (q, q + _MAX_CHAR) if q else None
+
+def _cursor(after: str | None, after_id) -> tuple | None:
+    if after is None or not str(after_id or "").isdigit():
+        return None
+    return after, int(after_id)
+
+def _page(rows, name_col: str, size: int):
+    """(rows, next cursor {after, after_id} or None)."""
+    rows = list(rows)
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, {"after": rows[-1][name_col], "after_id": rows[-1]["id"]}
+
+
+def users_page(db, q: str = "", after=None, after_id=None, size: int = PAGE_SIZE):
+    """One page of live users ordered by username (case-insensitive), optionally by prefix."""
+    where, params = ["deleted_at IS NULL"], []
+    rng = _prefix(q)
+    if rng:
+        where.append("username >= ? COLLATE NOCASE AND username < ? COLLATE NOCASE")
+        params.extend(rng)
+    cur = _cursor(after, after_id)
+    if cur:
+        # The plain >= lets SQLite seek the index; the row value breaks ties by id
+        where.append("username >= ? COLLATE NOCASE AND (username COLLATE NOCASE, id) > (?, ?)")
+        params.extend((cur[0], *cur))
+    rows = db.execute(f"""
+        SELECT id, username, is_admin, active FROM users
+        WHERE {" AND ".join(where)}
+        ORDER BY username COLLATE NOCASE, id LIMIT ?
+    """, (*params, size + 1)).fetchall()
+    return _page(rows, "username", size)
+
+def memberships_page(db, q: str = "", carpool_id=None, after=None, after_id=None, size: int = PAGE_SIZE):
+    """
+    One page of memberships ordered by display name, optionally for one carpool
+    and/or by a display name or username prefix.
+    """
+    where, params = ["c.deleted_at IS NULL"], []
+    if carpool_id:
+        where.append("cm.carpool_id = ?")
+        params.append(int(carpool_id))
+    rng = _prefix(q)
+    if rng:
+        where.append("""(
+            (cm.display_name >= ? COLLATE NOCASE AND cm.display_name < ? COLLATE NOCASE)
+            OR cm.user_id IN (SELECT id FROM users WHERE username >= ? COLLATE NOCASE AND username < ? COLLATE NOCASE)
+        )""")
+        params.extend((*rng, *rng))
+    cur = _cursor(after, after_id)
+    if cur:
+        where.append("cm.display_name >= ? COLLATE NOCASE AND (cm.display_name COLLATE NOCASE, cm.id) > (?, ?)")
+        params.extend((cur[0], *cur))
+    rows = db.execute(f"""
+        SELECT cm.id, cm.carpool_id, c.name AS carpool, u.username, cm.member_key, cm.display_name, cm.active
+        FROM carpool_memberships cm
+        JOIN carpools c ON c.id = cm.carpool_id
+        JOIN users u ON u.id = cm.user_id
+        WHERE {" AND ".join(where)}
+        ORDER BY cm.display_name COLLATE NOCASE, cm.id LIMIT ?
+    """, (*params, size + 1)).fetchall()
+    return _page(rows, "display_name", size)
+
+def suggest_users(db, q: str, limit: int = SUGGEST_LIMIT) -> list:
+    """Usernames starting with `q` (typeahead); empty for an empty query."""
+    rng = _prefix(q)
+    if not rng:
+        return []
+    return [r["username"] for r in db.execute("""
+        SELECT username FROM users
+        WHERE username >= ? COLLATE NOCASE AND username < ? COLLATE NOCASE AND deleted_at IS NULL
+        ORDER BY username COLLATE NOCASE LIMIT ?
+    """, (*rng, int(limit)))]
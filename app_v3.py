@@ -13,6 +13,9 @@ from routes_history import historybp
 from routes_admin import adminbp
 from routes_account import accountbp
 from routes_carpools import carpoolsbp
+from routes_api import apibp
+from routes_calendar import calendarbp
+from routes_dashboard import dashboardbp
 
 
 def create_app():
@@ -36,6 +39,8 @@ def create_app():
     # Initialize Flask-Login
     login_manager.init_app(app)
     login_manager.login_view = "authbp.login"
+    # API clients get a 401 instead of a redirect to the login form
+    login_manager.blueprint_login_views["apibp"] = None
 
     # In-memory templates
     app.jinja_loader = DictLoader({
@@ -58,6 +63,9 @@ def create_app():
     app.register_blueprint(historybp)
     app.register_blueprint(adminbp)
     app.register_blueprint(carpoolsbp)
+    app.register_blueprint(apibp)
+    app.register_blueprint(calendarbp)
+    app.register_blueprint(dashboardbp)
 
     with app.app_context():
         # Run migrations once on startup to avoid per-request races
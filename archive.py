@@ -0,0 +1,319 @@
+# archive.py
+"""
+Cold archive of closed years (`manage.py archive`).
+
+Archiving a year of a carpool moves its entries into their own SQLite file,
+archive/carpool<id>-<year>.db next to the main DB, in the compact layout
+(compact_layout.py), and records in the main DB:
+
+  entry_archives      which (carpool, year) live in which file
+  credit_checkpoints  every member's balance after Dec 31 of that year, and
+                      the last driver up to then
+
+Years go oldest first, so a carpool's archived years are always everything
+before one boundary day (Jan 1 after the newest archived year). Credits for a
+later day start from the newest checkpoint before it and only read `entries`
+from there on; weekly-pattern days of archived years are already counted in
+the checkpoint. Readers whose range reaches before the boundary (/history,
+/stats/<who>, exports) ATTACH the files they need, one at a time, and add
+their rows. Archived days are read-only; restore_year() moves the newest
+year back if one has to change.
+"""
+import os
+from contextlib import contextmanager
+from datetime import date
+
+from db import db_file, transaction
+from entry_store import entries_changed
+from compact_layout import create_schema, copy_range, diff_counts, day_num, CODE_TO_ROLE, NUM_TO_DAY
+from schedule_patterns import load_patterns, overlay
+
+ARCHIVE_DIRNAME = "archive"
+
+
+def archive_dir(db) -> str:
+    """The archive/ directory next to the main DB file (also for sharded carpools)."""
+    return os.path.join(os.path.dirname(db_file(db)), ARCHIVE_DIRNAME)
+
+def _file_name(cid: int, year: int) -> str:
+    return f"carpool{int(cid)}-{int(year)}.db"
+
+def archived_years(db, cid) -> list:
+    return [r[0] for r in db.execute(
+        "SELECT year FROM entry_archives WHERE carpool_id=? ORDER BY year", (int(cid),)
+    ).fetchall()]
+
+def archive_boundary(db, cid) -> date | None:
+    """First day still in `entries` (Jan 1 after the newest archived year); None if nothing is archived."""
+    row = db.execute("SELECT MAX(year) FROM entry_archives WHERE carpool_id=?", (int(cid),)).fetchone()
+    return date(row[0] + 1, 1, 1) if row[0] is not None else None
+
+def is_archived(db, cid, day: date) -> bool:
+    boundary = archive_boundary(db, cid)
+    return boundary is not None and day < boundary
+
+def archives(db, cid=None, lo: date | None = None, hi: date | None = None) -> list:
+    """[(carpool_id, year)] archived with a year in [lo, hi] (inclusive dates, None = open)."""
+    where, params = [], []
+    if cid is not None:
+        where.append("carpool_id = ?")
+        params.append(int(cid))
+    if lo is not None:
+        where.append("year >= ?")
+        params.append(lo.year)
+    if hi is not None:
+        where.append("year <= ?")
+        params.append(hi.year)
+    return [(r[0], r[1]) for r in db.execute(f"""
+        SELECT carpool_id, year FROM entry_archives
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY carpool_id, year
+    """, params).fetchall()]
+
+@contextmanager
+def attached(db, cid: int, year: int):
+    """ATTACH one archive file for the block; yields its schema name."""
+    schema = f"archive_{int(cid)}_{int(year)}"
+    db.execute("ATTACH DATABASE ? AS " + schema, (os.path.join(archive_dir(db), _file_name(cid, year)),))
+    try:
+        yield schema
+    finally:
+        db.execute("DETACH DATABASE " + schema)
+
+def archived_rows(db, cid, lo: date | None = None, hi: date | None = None, who: int | None = None) -> list:
+    """Archived (day, who, role) rows of a carpool with day in [lo, hi) (dates, None = open)."""
+    out = []
+    last = None if hi is None else date.fromordinal(hi.toordinal() - 1)
+    for _cid, year in archives(db, cid, lo, last):
+        with attached(db, cid, year) as s:
+            out.extend(_select(db, s, cid, lo, hi, who))
+    return out
+
+def _select(db, schema, cid, lo, hi, who=None):
+    where, params = ["carpool_id = ?"], [int(cid)]
+    if lo is not None:
+        where.append("day >= ?")
+        params.append(day_num(lo))
+    if hi is not None:
+        where.append("day < ?")
+        params.append(day_num(hi))
+    if who is not None:
+        where.append("user_id = ?")
+        params.append(int(who))
+    return db.execute(f"""
+        SELECT {NUM_TO_DAY.format(col="day")} AS day, user_id AS who, {CODE_TO_ROLE.format(col="role")} AS role
+        FROM {schema}.entries_c WHERE {" AND ".join(where)}
+        ORDER BY day, user_id
+    """, params).fetchall()
+
+def archived_roles(db, cid, day: date):
+    """{user_id: role} saved on an archived day; None if the day isn't archived."""
+    if not is_archived(db, cid, day):
+        return None
+    with attached(db, cid, day.year) as s:
+        return {r["who"]: r["role"] for r in _select(db, s, cid, day, date.fromordinal(day.toordinal() + 1))}
+
+def archived_role_counts(db, cid, user_id) -> dict:
+    """{role: days} of one member over every archived year."""
+    counts = {}
+    for _cid, year in archives(db, cid):
+        with attached(db, cid, year) as s:
+            for r in db.execute(f"""
+                SELECT {CODE_TO_ROLE.format(col="role")} AS role, COUNT(*) AS n
+                FROM {s}.entries_c WHERE carpool_id=? AND user_id=? GROUP BY role
+            """, (int(cid), int(user_id))).fetchall():
+                counts[r["role"]] = counts.get(r["role"], 0) + r["n"]
+    return counts
+
+
+# --- Credit checkpoints ----------------------------------------------------------
+def _checkpoint(db, cid, year):
+    credits, last = {}, None
+    for r in db.execute(
+        "SELECT user_id, credits, last_driver FROM credit_checkpoints WHERE carpool_id=? AND year=?", (cid, year)
+    ).fetchall():
+        if r["credits"]:
+            credits[r["user_id"]] = r["credits"]
+        if r["last_driver"]:
+            last = r["user_id"]
+    return credits, last
+
+def credit_start(db, cid, day: date):
+    """
+    Where a credit computation for the days before `day` starts:
+    (credits, last_driver, lo, rows). The balances are the newest checkpoint
+    before `day`; the caller adds `entries` days in [lo, day) plus `rows`
+    (archived rows of `day`'s own year when that year is archived) and
+    overlays weekly patterns from `lo`.
+    """
+    years = archived_years(db, cid)
+    if not years:
+        return {}, None, None, []
+    closed = [y for y in years if date(y + 1, 1, 1) <= day]
+    credits, last, lo = {}, None, None
+    if closed:
+        credits, last = _checkpoint(db, cid, closed[-1])
+        lo = date(closed[-1] + 1, 1, 1)
+    rows = []
+    if day.year in years and day > date(day.year, 1, 1):
+        with attached(db, cid, day.year) as s:
+            rows = _select(db, s, cid, date(day.year, 1, 1), day)
+    return credits, last, lo, rows
+
+def _year_base(db, schema, cid, year, patterns, credits: dict, last, *, first: bool):
+    """
+    Checkpoint after `year` from the one before it and the year's archived
+    rows plus pattern days; the first archived year also takes the pattern
+    days before it.
+    """
+    from routes_today import _base_from_rows
+    lo, hi = date(year, 1, 1), date(year + 1, 1, 1)
+    rows = overlay(_select(db, schema, cid, lo, hi), patterns, None if first else lo, hi)
+    year_credits, year_last = _base_from_rows(rows)
+    out = dict(credits)
+    for who, n in year_credits.items():
+        out[who] = out.get(who, 0) + n
+    return out, (year_last if year_last is not None else last)
+
+def _write_checkpoint(db, cid, year, credits: dict, last):
+    db.execute("DELETE FROM credit_checkpoints WHERE carpool_id=? AND year=?", (cid, year))
+    who = set(credits) | ({last} if last is not None else set())
+    db.executemany(
+        "INSERT INTO credit_checkpoints(carpool_id, year, user_id, credits, last_driver) VALUES (?,?,?,?,?)",
+        [(cid, year, w, credits.get(w, 0), int(w == last)) for w in who]
+    )
+
+def rebuild_checkpoints(db, cid):
+    """Recompute every checkpoint of a carpool from its archive files (after rows were removed)."""
+    patterns = load_patterns(db, cid)
+    credits, last, out = {}, None, []
+    for i, year in enumerate(archived_years(db, cid)):
+        with attached(db, cid, year) as s:
+            credits, last = _year_base(db, s, cid, year, patterns, credits, last, first=i == 0)
+        out.append((year, credits, last))
+    with transaction(db):
+        for year, credits, last in out:
+            _write_checkpoint(db, cid, year, credits, last)
+        entries_changed(db, cid, None, ride_stats=False)
+
+
+# --- Archiving -----------------------------------------------------------------
+def archive_year(db, cid, year: int) -> int:
+    """
+    Move one closed year of a carpool into its archive file. Years go oldest
+    first. The file is written and checked before `entries` is touched; the
+    checkpoint and the delete from `entries` are one transaction. Returns
+    the rows archived; raises ValueError if the year can't be archived.
+    """
+    cid, year = int(cid), int(year)
+    if year >= date.today().year:
+        raise ValueError(f"{year} is not closed yet")
+    years = archived_years(db, cid)
+    if year in years:
+        raise ValueError(f"{year} is already archived")
+    lo, hi = f"{year}-01-01", f"{year + 1}-01-01"
+    older = db.execute("SELECT MIN(day) FROM entries WHERE carpool_id=? AND day < ?", (cid, lo)).fetchone()[0]
+    if older:
+        raise ValueError(f"archive {older[:4]} first (years are archived oldest first)")
+    boundary = archive_boundary(db, cid)
+    if boundary is not None and boundary.year != year:
+        # A gap would leave years that are neither checkpointed nor in entries
+        raise ValueError(f"archive {boundary.year} first (years are archived oldest first)")
+
+    os.makedirs(archive_dir(db), exist_ok=True)
+    path = os.path.join(archive_dir(db), _file_name(cid, year))
+    if os.path.exists(path):
+        os.remove(path)  # left over from an interrupted run; it was never registered
+    with attached(db, cid, year) as s:
+        create_schema(db, s)
+        with transaction(db):
+            n = copy_range(db, s, cid, lo, hi)
+        if diff_counts(db, s, cid, lo, hi) != (0, 0):
+            raise RuntimeError(f"archive of carpool {cid} {year} does not match entries")
+        credits, last = _checkpoint(db, cid, year - 1)
+        credits, last = _year_base(db, s, cid, year, load_patterns(db, cid), credits, last, first=not years)
+        with transaction(db):
+            db.execute(
+                "INSERT INTO entry_archives(carpool_id, year, path, rows) VALUES (?,?,?,?)",
+                (cid, year, _file_name(cid, year), n)
+            )
+            _write_checkpoint(db, cid, year, credits, last)
+            db.execute("DELETE FROM entries WHERE carpool_id=? AND day >= ? AND day < ?", (cid, lo, hi))
+            # Nothing changed for readers, but credit caches must not mix old and new sources
+            entries_changed(db, cid, None, ride_stats=False)
+    return n
+
+def archive_through(db, cid, year: int, report=None) -> int:
+    """Archive every year of a carpool up to and including `year`, oldest first. Returns rows archived."""
+    first = db.execute(
+        "SELECT CAST(substr(MIN(day), 1, 4) AS INTEGER) FROM entries WHERE carpool_id=? AND julianday(day) IS NOT NULL",
+        (int(cid),)
+    ).fetchone()[0]
+    boundary = archive_boundary(db, cid)
+    start = boundary.year if boundary else first
+    total = 0
+    for y in range(start or year + 1, year + 1):
+        n = archive_year(db, cid, y)
+        total += n
+        if report:
+            report(cid, y, n)
+    return total
+
+def restore_year(db, cid) -> int | None:
+    """Move a carpool's newest archived year back into `entries`. Returns its rows, None if none."""
+    cid = int(cid)
+    years = archived_years(db, cid)
+    if not years:
+        return None
+    year = years[-1]
+    with attached(db, cid, year) as s:
+        with transaction(db):
+            n = db.execute(f"""
+                INSERT INTO entries(carpool_id, day, user_id, member_key, role, update_user, update_ts, update_date)
+                SELECT c.carpool_id, {NUM_TO_DAY.format(col="c.day")}, c.user_id,
+                       COALESCE(m.member_key, 'u' || c.user_id), {CODE_TO_ROLE.format(col="c.role")},
+                       COALESCE(a.name, 'archive'), datetime(meta.update_ts, 'unixepoch'), date(meta.update_ts, 'unixepoch')
+                FROM {s}.entries_c c
+                LEFT JOIN {s}.entry_meta meta USING (carpool_id, day, user_id)
+                LEFT JOIN {s}.entry_actors a ON a.id = meta.actor_id
+                LEFT JOIN carpool_memberships m ON m.carpool_id = c.carpool_id AND m.user_id = c.user_id
+                WHERE c.carpool_id = ?
+                ON CONFLICT(carpool_id, day, user_id) DO NOTHING
+            """, (cid,)).rowcount
+            db.execute("DELETE FROM credit_checkpoints WHERE carpool_id=? AND year=?", (cid, year))
+            db.execute("DELETE FROM entry_archives WHERE carpool_id=? AND year=?", (cid, year))
+            entries_changed(db, cid, None, ride_stats=False)
+    os.remove(os.path.join(archive_dir(db), _file_name(cid, year)))
+    return n
+
+
+# --- Purge -----------------------------------------------------------------------
+def drop_carpool(db, cid):
+    """Forget a purged carpool's archives and checkpoints and delete their files."""
+    years = archived_years(db, cid)
+    with transaction(db):
+        db.execute("DELETE FROM credit_checkpoints WHERE carpool_id=?", (int(cid),))
+        db.execute("DELETE FROM entry_archives WHERE carpool_id=?", (int(cid),))
+    for year in years:
+        path = os.path.join(archive_dir(db), _file_name(cid, year))
+        if os.path.exists(path):
+            os.remove(path)
+
+def drop_user(db, uid) -> int:
+    """Remove a purged user's rows from every archive, then recompute the affected checkpoints."""
+    removed = 0
+    touched = {r[0] for r in db.execute(
+        "SELECT DISTINCT carpool_id FROM credit_checkpoints WHERE user_id=?", (int(uid),)
+    ).fetchall()}
+    for cid, year in archives(db):
+        with attached(db, cid, year) as s:
+            with transaction(db):
+                n = db.execute(f"DELETE FROM {s}.entries_c WHERE user_id=?", (int(uid),)).rowcount
+                db.execute(f"DELETE FROM {s}.entry_meta WHERE user_id=?", (int(uid),))
+            if n:
+                db.execute("UPDATE entry_archives SET rows = rows - ? WHERE carpool_id=? AND year=?", (n, cid, year))
+                removed += n
+                touched.add(cid)
+    for cid in touched:
+        rebuild_checkpoints(db, cid)
+    return removed
@@ -3,6 +3,7 @@ from flask import Blueprint, request, redirect, url_for, render_template_string,
 from hashlib import sha256
 from templates import LOGIN_TMPL
 from db import get_db
+from cache import VersionedCache
 
 # Flask-Login
 from flask_login import (
@@ -25,16 +26,32 @@ class User(UserMixin):
         # normalize 0/1 or "0"/"1" to a real boolean
         self.is_admin = (int(is_admin) == 1)
 
+# load_user runs on every authenticated request; keep recent users in memory.
+# Admin changes call invalidate_user(), which also bumps the 'users' version so
+# other workers drop their copies within `recheck` seconds.
+user_cache = VersionedCache("users", maxsize=512, ttl=300.0, recheck=2.0)
+
+def invalidate_user(db, user_id=None):
+    """Forget a cached user (or all users) in this and every other worker."""
+    user_cache.invalidate(db, None if user_id is None else str(user_id))
+
 @login_manager.user_loader
 def load_user(user_id: str):
+    user_cache.sync(get_db)
+    user = user_cache.get(str(user_id))
+    if user is not None:
+        return user
     db = get_db()
     row = db.execute(
-        "SELECT id, username, is_admin FROM users WHERE id = ?",
+        "SELECT id, username, is_admin, active FROM users WHERE id = ?",
         (user_id,)
     ).fetchone()
-    if not row:
+    # Deactivated users are treated as logged out
+    if not row or int(row["active"] or 0) != 1:
         return None
-    return User(row["id"], row["username"], row["is_admin"])
+    user = User(row["id"], row["username"], row["is_admin"])
+    user_cache.set(str(user_id), user)
+    return user
 
 
 # ---- Routes ----
@@ -0,0 +1,101 @@
+# cache.py
+"""
+Small in-process caches with cross-worker invalidation.
+
+Each worker keeps its own TTL/LRU cache. Writers bump a named counter in the
+cache_versions table; readers compare that counter (at most every
+`recheck` seconds) and drop their local entries when it moved, so changes
+made by one worker reach the others within a couple of seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from db import ShardConnection, SHARD_VERSIONS
+
+
+def _versions_table(db, name: str) -> str:
+    # A shard keeps its carpool's data counters; the global ones live in the catalog
+    if isinstance(db, ShardConnection) and not name.startswith(SHARD_VERSIONS):
+        return "catalog.cache_versions"
+    return "cache_versions"
+
+def get_version(db, name: str) -> int:
+    row = db.execute(f"SELECT version FROM {_versions_table(db, name)} WHERE name=?", (name,)).fetchone()
+    return int(row["version"]) if row else 0
+
+def bump_version(db, name: str):
+    db.execute(f"""
+        INSERT INTO {_versions_table(db, name)}(name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """, (name,))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class VersionedCache(TTLCache):
+    """
+    TTLCache tied to a cache_versions counter. Call sync(get_db) before
+    reading: every `recheck` seconds it re-reads the counter and clears the
+    cache if another worker bumped it.
+    """
+
+    def __init__(self, name: str, maxsize: int = 256, ttl: float = 60.0, recheck: float = 2.0):
+        super().__init__(maxsize, ttl)
+        self.name = name
+        self.recheck = recheck
+        self._version = None
+        self._checked = 0.0
+
+    def sync(self, get_db):
+        now = time.monotonic()
+        if now - self._checked < self.recheck:
+            return
+        version = get_version(get_db(), self.name)
+        if version != self._version:
+            self.clear()
+            self._version = version
+        self._checked = now
+
+    def invalidate(self, db, key=None):
+        """Drop one key (or everything) locally and tell the other workers."""
+        if key is None:
+            self.clear()
+        else:
+            self.pop(key)
+        bump_version(db, self.name)
@@ -0,0 +1,116 @@
+# carpool_analytics.py
+"""
+Per-carpool health numbers for the admin analytics page.
+
+Everything is computed with grouped SQL over `entries` and
+`carpool_memberships` (one query per figure for all stale carpools of a
+database at once) and kept per carpool against its entries version plus the
+membership version, so a page load with hundreds of carpools only recomputes the ones that
+changed since the last load.
+
+Figures follow the credit rule: only days up to today count, a day is a ride
+day when it has exactly one Driver and at least one Rider, and days with zero
+or several Drivers are "unscored" (the credit rule ignores them). Weekly
+patterns are not included; these are saved entries only. Neither are years
+moved out by `manage.py archive` (archive.py): their ride days, unscored days
+and credits drop out of the figures.
+"""
+from datetime import date, timedelta
+
+from db import carpool_dbs
+from cache import TTLCache, get_version
+from entry_store import carpool_versions
+from template_helpers import carpool_options_cache
+
+# cid -> (version key, snapshot)
+_snapshot_cache = TTLCache(maxsize=4096, ttl=3600.0)
+
+# One row per (carpool, day) up to today with its driver/rider counts
+_DAYS_CTE = """
+    WITH d AS (
+      SELECT carpool_id, substr(day, 1, 10) AS day,
+             SUM(role = 'D') AS nd, SUM(role = 'R') AS nr
+      FROM entries
+      WHERE carpool_id IN ({marks}) AND day < ?
+      GROUP BY carpool_id, substr(day, 1, 10)
+    )
+"""
+
+
+def _compute(db, cids, tomorrow: str) -> dict:
+    """Fresh snapshots for `cids`: {cid: {...}}."""
+    marks = ",".join("?" * len(cids))
+    params = (*cids, tomorrow)
+    out = {cid: {"members": 0, "months": [], "ride_days": 0, "unscored_days": 0,
+                 "first_day": None, "last_day": None, "credits": {}, "spread": 0}
+           for cid in cids}
+
+    active = {cid: [] for cid in cids}
+    for r in db.execute(f"""
+        SELECT carpool_id, user_id FROM carpool_memberships
+        WHERE carpool_id IN ({marks}) AND active = 1
+    """, tuple(cids)).fetchall():
+        active[r["carpool_id"]].append(r["user_id"])
+
+    for r in db.execute(_DAYS_CTE.format(marks=marks) + """
+        SELECT carpool_id, substr(day, 1, 7) AS month,
+               SUM(nd = 1 AND nr > 0) AS ride_days, SUM(nd <> 1) AS unscored,
+               MIN(day) AS first_day, MAX(day) AS last_day
+        FROM d GROUP BY carpool_id, month ORDER BY carpool_id, month
+    """, params).fetchall():
+        s = out[r["carpool_id"]]
+        s["months"].append({"month": r["month"], "ride_days": r["ride_days"], "unscored_days": r["unscored"]})
+        s["ride_days"] += r["ride_days"]
+        s["unscored_days"] += r["unscored"]
+        s["first_day"] = s["first_day"] or r["first_day"]
+        s["last_day"] = r["last_day"]
+
+    for r in db.execute(_DAYS_CTE.format(marks=marks) + """
+        SELECT e.carpool_id, e.user_id,
+               SUM(CASE e.role WHEN 'D' THEN d.nr WHEN 'R' THEN -1 ELSE 0 END) AS credits
+        FROM d JOIN entries e
+          ON e.carpool_id = d.carpool_id AND substr(e.day, 1, 10) = d.day
+        WHERE d.nd = 1
+        GROUP BY e.carpool_id, e.user_id
+    """, params).fetchall():
+        out[r["carpool_id"]]["credits"][r["user_id"]] = r["credits"]
+
+    # Fairness among current members (no entries yet = 0 credits)
+    for cid, s in out.items():
+        balances = [s["credits"].get(uid, 0) for uid in active[cid]]
+        s["members"] = len(balances)
+        s["spread"] = max(balances) - min(balances) if balances else 0
+    return out
+
+def carpool_snapshots(db, today: date | None = None) -> list:
+    """
+    One snapshot per carpool, ordered by name:
+    {id, name, members, ride_days, unscored_days, first_day, last_day,
+     months: [{month, ride_days, unscored_days}], credits: {user_id: n}, spread}.
+    """
+    today = today or date.today()
+    carpools = db.execute("SELECT id, name FROM carpools WHERE deleted_at IS NULL ORDER BY name").fetchall()
+    cids = [c["id"] for c in carpools]
+    if not cids:
+        return []
+    versions = carpool_versions(cids)
+    # Membership edits bump carpool_options; credits only count days <= today
+    shared = (get_version(db, carpool_options_cache.name), today.isoformat())
+
+    snaps, stale = {}, []
+    for cid in cids:
+        key = (versions[cid], *shared)
+        hit = _snapshot_cache.get(cid)
+        if hit is not None and hit[0] == key:
+            snaps[cid] = hit[1]
+        else:
+            stale.append(cid)
+    # Keep the IN lists well under SQLite's host-parameter limit
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    for conn, group in carpool_dbs(stale):
+        for i in range(0, len(group), 500):
+            for cid, snap in _compute(conn, group[i:i + 500], tomorrow).items():
+                snaps[cid] = snap
+                _snapshot_cache.set(cid, ((versions[cid], *shared), snap))
+
+    return [{"id": c["id"], "name": c["name"], **snaps[c["id"]]} for c in carpools]
@@ -0,0 +1,274 @@
+# compact_layout.py
+"""
+Compact storage layout for entries, and tools to measure it
+(`manage.py compact-entries`, `manage.py bench-layout`).
+
+`entries` carries a lot per row: an AUTOINCREMENT rowid plus a separate
+unique index on (carpool_id, day, user_id), `day` as 10 bytes of text, `role`
+as text, `member_key` (a copy of the membership's key) and three audit text
+columns, plus four more indexes. The compact layout keeps only what the
+schedule needs, clustered on its natural key:
+
+  entries_c     (carpool_id, day, user_id) -> role   WITHOUT ROWID
+                day = days since 1970-01-01, role = 1 D / 2 R / 3 O
+  entry_meta    same key -> actor_id, update_ts (unix seconds)   WITHOUT ROWID
+  entry_actors  actor_id -> name (usernames, 'import', 'legacy_migration', ...)
+
+member_key and update_date are derivable (memberships, update_ts) and are
+dropped. The entries_c_text view decodes rows back to the text layout.
+
+The live app still reads and writes `entries`; compact files are built next
+to it (compact-entries) and used for the per-year archives (archive.py).
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+# julianday('1970-01-01'); day numbers are julianday(day) - this
+_JD_EPOCH = 2440587.5
+_EPOCH = date(1970, 1, 1)
+
+ROLE_CODES = {"D": 1, "R": 2, "O": 3}
+ROLE_NAMES = {v: k for k, v in ROLE_CODES.items()}
+
+# SQL expressions: text day/role -> compact, and back
+DAY_TO_NUM = f"CAST(julianday({{col}}) - {_JD_EPOCH} AS INTEGER)"
+NUM_TO_DAY = f"date({_JD_EPOCH} + {{col}})"
+ROLE_TO_CODE = "CASE {col} WHEN 'D' THEN 1 WHEN 'R' THEN 2 WHEN 'O' THEN 3 END"
+CODE_TO_ROLE = "CASE {col} WHEN 1 THEN 'D' WHEN 2 THEN 'R' ELSE 'O' END"
+
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS {{s}}entries_c (
+      carpool_id INTEGER NOT NULL,
+      day        INTEGER NOT NULL,                  -- days since 1970-01-01
+      user_id    INTEGER NOT NULL,
+      role       INTEGER NOT NULL CHECK(role IN (1, 2, 3)),  -- 1 D, 2 R, 3 O
+      PRIMARY KEY (carpool_id, day, user_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS {{s}}entry_actors (
+      id   INTEGER PRIMARY KEY,
+      name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS {{s}}entry_meta (
+      carpool_id INTEGER NOT NULL,
+      day        INTEGER NOT NULL,
+      user_id    INTEGER NOT NULL,
+      actor_id   INTEGER,
+      update_ts  INTEGER,                           -- unix seconds
+      PRIMARY KEY (carpool_id, day, user_id)
+    ) WITHOUT ROWID;
+    CREATE VIEW IF NOT EXISTS {{s}}entries_c_text AS
+      SELECT carpool_id, {NUM_TO_DAY.format(col="day")} AS day, user_id,
+             {CODE_TO_ROLE.format(col="role")} AS role
+      FROM entries_c;
+"""
+
+
+def day_num(d) -> int:
+    """date or 'YYYY-MM-DD' -> days since 1970-01-01."""
+    if not isinstance(d, date):
+        d = date.fromisoformat(str(d)[:10])
+    return (d - _EPOCH).days
+
+def num_day(n: int) -> date:
+    return _EPOCH + timedelta(days=int(n))
+
+def create_schema(db, schema: str = "main"):
+    db.executescript(SCHEMA.format(s=f"{schema}."))
+
+
+# --- Migration -----------------------------------------------------------------
+def copy_range(db, schema: str, carpool_id: int, lo: str | None = None, hi: str | None = None) -> int:
+    """
+    INSERT...SELECT one carpool's entries with day in [lo, hi) (ISO strings,
+    None = open) into the compact tables of the attached `schema`, actors
+    included. The caller owns the transaction. Returns rows copied.
+    """
+    where = ["e.carpool_id = ?", "e.user_id IS NOT NULL", "julianday(e.day) IS NOT NULL"]
+    params = [carpool_id]
+    if lo:
+        where.append("e.day >= ?")
+        params.append(lo)
+    if hi:
+        where.append("e.day < ?")
+        params.append(hi)
+    where = " AND ".join(where)
+    day_sql = DAY_TO_NUM.format(col="e.day")
+    db.execute(f"""
+        INSERT OR IGNORE INTO {schema}.entry_actors(name)
+        SELECT DISTINCT e.update_user FROM entries e WHERE {where} AND e.update_user IS NOT NULL
+    """, params)
+    n = db.execute(f"""
+        INSERT INTO {schema}.entries_c(carpool_id, day, user_id, role)
+        SELECT e.carpool_id, {day_sql}, e.user_id, {ROLE_TO_CODE.format(col="e.role")}
+        FROM entries e WHERE {where}
+        ORDER BY e.carpool_id, e.day, e.user_id
+    """, params).rowcount
+    db.execute(f"""
+        INSERT INTO {schema}.entry_meta(carpool_id, day, user_id, actor_id, update_ts)
+        SELECT e.carpool_id, {day_sql}, e.user_id, a.id, CAST(strftime('%s', e.update_ts) AS INTEGER)
+        FROM entries e LEFT JOIN {schema}.entry_actors a ON a.name = e.update_user
+        WHERE {where}
+        ORDER BY e.carpool_id, e.day, e.user_id
+    """, params)
+    return n
+
+def copy_entries(db, dest_path: str, report=print) -> dict:
+    """
+    Copy every carpool's entries from `db` (the live DB) into the compact
+    layout in `dest_path`, one carpool per transaction. Rows with a day that
+    isn't YYYY-MM-DD, or without carpool/user, are skipped and counted.
+    Returns {"copied", "skipped", "carpools"}.
+    """
+    db.execute("ATTACH DATABASE ? AS compact", (dest_path,))
+    try:
+        create_schema(db, "compact")
+        stats = {"copied": 0, "carpools": 0}
+        stats["skipped"] = db.execute(
+            "SELECT COUNT(*) FROM entries WHERE carpool_id IS NULL OR user_id IS NULL OR julianday(day) IS NULL"
+        ).fetchone()[0]
+        for (cid,) in db.execute("SELECT DISTINCT carpool_id FROM entries WHERE carpool_id IS NOT NULL").fetchall():
+            db.execute("BEGIN")
+            try:
+                db.execute("DELETE FROM compact.entries_c WHERE carpool_id=?", (cid,))
+                db.execute("DELETE FROM compact.entry_meta WHERE carpool_id=?", (cid,))
+                n = copy_range(db, "compact", cid)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            stats["copied"] += n
+            stats["carpools"] += 1
+            report(f"carpool {cid}: {n} rows")
+    finally:
+        db.execute("DETACH DATABASE compact")
+    return stats
+
+def diff_counts(db, schema: str, carpool_id=None, lo: str | None = None, hi: str | None = None) -> tuple:
+    """(rows of entries missing from `schema`, rows only in `schema`), optionally one carpool's [lo, hi)."""
+    where, params = ["carpool_id IS NOT NULL", "user_id IS NOT NULL", "julianday(day) IS NOT NULL"], []
+    if carpool_id is not None:
+        where.append("carpool_id = ?")
+        params.append(carpool_id)
+    if lo:
+        where.append("day >= ?")
+        params.append(lo)
+    if hi:
+        where.append("day < ?")
+        params.append(hi)
+    where = " AND ".join(where)
+    live = f"SELECT carpool_id, day, user_id, role FROM main.entries WHERE {where}"
+    copy = f"SELECT carpool_id, day, user_id, role FROM {schema}.entries_c_text WHERE {where}"
+    missing = db.execute(f"SELECT COUNT(*) FROM ({live} EXCEPT {copy})", params * 2).fetchone()[0]
+    extra = db.execute(f"SELECT COUNT(*) FROM ({copy} EXCEPT {live})", params * 2).fetchone()[0]
+    return missing, extra
+
+def verify_copy(db, dest_path: str) -> dict:
+    """Rows of `entries` missing from the compact copy and vice versa (both 0 = identical)."""
+    db.execute("ATTACH DATABASE ? AS compact", (dest_path,))
+    try:
+        missing, extra = diff_counts(db, "compact")
+    finally:
+        db.execute("DETACH DATABASE compact")
+    return {"missing": missing, "extra": extra, "ok": missing == 0 and extra == 0}
+
+
+# --- Benchmark -----------------------------------------------------------------
+def _generate(rows: int, carpools: int, members: int, seed: int = 1):
+    """Yield (carpool_id, day, user_id, role, update_user, update_ts) like real schedules."""
+    rnd = random.Random(seed)
+    days = max(rows // (carpools * members), 1)
+    start = date(2015, 1, 1)
+    for cid in range(1, carpools + 1):
+        uids = [cid * 100 + i for i in range(members)]
+        d = start
+        for _ in range(days):
+            driver = rnd.choice(uids)
+            ts = f"{d.isoformat()} {rnd.randrange(6, 10):02d}:{rnd.randrange(60):02d}:00"
+            for uid in uids:
+                role = "D" if uid == driver else ("O" if rnd.random() < 0.15 else "R")
+                yield cid, d.isoformat(), uid, role, f"user{uid}", ts
+            d += timedelta(days=1)
+
+def _best(fn, repeat: int = 3) -> float:
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best
+
+def compare_layouts(db, rows: int = 200_000, carpools: int = 10, members: int = 6, report=print) -> list:
+    """
+    Build the same generated schedule in the live `entries` schema (DDL and
+    indexes read from `db`) and in the compact layout, in two temp files, and
+    compare file size and typical scans. Returns [(measure, current, compact)].
+    """
+    ddl = [r[0] for r in db.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name='entries' AND sql IS NOT NULL ORDER BY type DESC"
+    ).fetchall()]
+    data = list(_generate(rows, carpools, members))
+    with tempfile.TemporaryDirectory() as tmp:
+        cur_path, cmp_path = os.path.join(tmp, "current.db"), os.path.join(tmp, "compact.db")
+        cur = sqlite3.connect(cur_path)
+        for stmt in ddl:
+            cur.execute(stmt)
+        t0 = time.perf_counter()
+        with cur:
+            cur.executemany("""
+                INSERT INTO entries(carpool_id, day, user_id, member_key, role, update_user, update_ts, update_date)
+                VALUES (?,?,?,?,?,?,?,substr(?, 1, 10))
+            """, ((c, d, u, f"K{u}", r, who, ts, ts) for c, d, u, r, who, ts in data))
+        cur_load = time.perf_counter() - t0
+
+        cmp = sqlite3.connect(cmp_path)
+        create_schema(cmp)
+        actors = {}
+        t0 = time.perf_counter()
+        with cmp:
+            for who in sorted({row[4] for row in data}):
+                actors[who] = cmp.execute("INSERT INTO entry_actors(name) VALUES (?)", (who,)).lastrowid
+            cmp.executemany("INSERT INTO entries_c VALUES (?,?,?,?)",
+                            ((c, day_num(d), u, ROLE_CODES[r]) for c, d, u, r, _w, _ts in data))
+            cmp.executemany("INSERT INTO entry_meta VALUES (?,?,?,?,strftime('%s', ?))",
+                            ((c, day_num(d), u, actors[w], ts) for c, d, u, _r, w, ts in data))
+        cmp_load = time.perf_counter() - t0
+        for conn in (cur, cmp):
+            conn.execute("VACUUM")
+
+        mid = carpools // 2 + 1
+        month_lo, month_hi = "2016-03-01", "2016-04-01"
+        cases = [
+            ("rows", lambda c: len(data), lambda c: len(data)),
+            ("file size (KiB)", lambda c: os.path.getsize(cur_path) // 1024, lambda c: os.path.getsize(cmp_path) // 1024),
+            ("load (s)", lambda c: round(cur_load, 3), lambda c: round(cmp_load, 3)),
+            ("scan one carpool (ms)",
+             lambda c: 1000 * _best(lambda: c.execute(
+                 "SELECT day, user_id, role FROM entries WHERE carpool_id=? ORDER BY day", (mid,)).fetchall()),
+             lambda c: 1000 * _best(lambda: c.execute(
+                 "SELECT day, user_id, role FROM entries_c WHERE carpool_id=? ORDER BY day", (mid,)).fetchall())),
+            ("one month, one carpool (ms)",
+             lambda c: 1000 * _best(lambda: c.execute(
+                 "SELECT day, user_id, role FROM entries WHERE carpool_id=? AND day >= ? AND day < ?",
+                 (mid, month_lo, month_hi)).fetchall()),
+             lambda c: 1000 * _best(lambda: c.execute(
+                 "SELECT day, user_id, role FROM entries_c WHERE carpool_id=? AND day >= ? AND day < ?",
+                 (mid, day_num(month_lo), day_num(month_hi))).fetchall())),
+            ("drive counts, all carpools (ms)",
+             lambda c: 1000 * _best(lambda: c.execute(
+                 "SELECT carpool_id, user_id, COUNT(*) FROM entries WHERE role='D' GROUP BY 1, 2").fetchall()),
+             lambda c: 1000 * _best(lambda: c.execute(
+                 "SELECT carpool_id, user_id, COUNT(*) FROM entries_c WHERE role=1 GROUP BY 1, 2").fetchall())),
+        ]
+        results = []
+        for name, f_cur, f_cmp in cases:
+            a, b = f_cur(cur), f_cmp(cmp)
+            results.append((name, a, b))
+            report(f"{name:<34} {a:>12,.1f} {b:>12,.1f}" if isinstance(a, float) else f"{name:<34} {a:>12,} {b:>12,}")
+        cur.close()
+        cmp.close()
+    return results
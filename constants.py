@@ -5,6 +5,13 @@ APP_SECRET  = os.environ.get("APP_SECRET", "dev-secret-change-me")
 DATABASE_URL = os.path.abspath("np_data.db") 
 ROLE_CHOICES = {"D","R","O"}
 
+# Live Today-page streams (SSE) each hold a request thread for minutes, so they
+# are off unless enabled (0 = the page polls /api/v1/today instead). Only useful
+# on a threaded server: NP_WORKER_THREADS is its request threads per process,
+# and one is always left for ordinary requests.
+LIVE_MAX_STREAMS = max(0, min(int(os.environ.get("NP_LIVE_MAX_STREAMS", "0")),
+                              int(os.environ.get("NP_WORKER_THREADS", "1")) - 1))
+
 # TEMPORARY fallback for legacy routes still expecting these
 MEMBERS = {"CA": "Christian", "ER": "Eric", "SJ": "Sean"}
 MEMBER_ORDER = ["CA", "ER", "SJ"]
\ No newline at end of file
@@ -1,6 +1,7 @@
 # db.py
 import os
 import sqlite3
+from contextlib import contextmanager
 from hashlib import sha256
 from flask import g, current_app
 
@@ -25,13 +26,14 @@ def _resolve_db_path() -> str:
         pass
     return os.path.join(os.path.dirname(__file__), "np_data.db")
 
-def _connect(db_path: str) -> sqlite3.Connection:
+def _connect(db_path: str, factory=sqlite3.Connection) -> sqlite3.Connection:
     conn = sqlite3.connect(
         db_path,
         detect_types=sqlite3.PARSE_DECLTYPES,
         check_same_thread=False,
         timeout=10.0,
         isolation_level=None,
+        factory=factory,
     )
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL;")
@@ -40,7 +42,12 @@ def _connect(db_path: str) -> sqlite3.Connection:
     conn.execute("PRAGMA foreign_keys=ON;")
     return conn
 
-def get_db():
+def get_db(carpool_id=None):
+    """
+    The request's connection. With a carpool id, the connection that holds
+    that carpool's data: its shard if it has one (see sharding.py), else the
+    main DB, which is also the catalog of users, carpools and memberships.
+    """
     if "db" not in g:
         db_path = _resolve_db_path()
         g.db = _connect(db_path)
@@ -52,7 +59,48 @@ def get_db():
         _migrate_v3_multicarpool(g.db)
         _migrate_v4_user_carpool_prefs(g.db)
         _migrate_v5_mpg_per_carpool(g.db)
-    return g.db
+        _migrate_v6_entries_indexes(g.db)
+        _migrate_v7_user_ride_stats(g.db)
+        _migrate_v8_gas_price_history(g.db)
+        _migrate_v9_cache_versions(g.db)
+        _migrate_v10_carpools_active(g.db)
+        _migrate_v11_entry_changes(g.db)
+        _migrate_v12_weekly_patterns(g.db)
+        _migrate_v13_legacy_migrations(g.db)
+        _migrate_v14_soft_delete(g.db)
+        _migrate_v15_username_nocase(g.db)
+        _migrate_v16_membership_indexes(g.db)
+        _migrate_v17_entry_events(g.db)
+        _migrate_v18_entry_events_seq(g.db)
+        _migrate_v19_archives(g.db)
+        _migrate_v20_carpool_shards(g.db)
+    if carpool_id is None:
+        return g.db
+    return _shard(int(carpool_id)) or g.db
+
+@contextmanager
+def transaction(db: sqlite3.Connection):
+    """
+    Run a block of writes as one transaction. Connections are opened in
+    autocommit mode (isolation_level=None), so without this every statement
+    commits on its own. Nested use joins the outer transaction.
+    """
+    if db.in_transaction:
+        yield db
+        return
+    if isinstance(db, ShardConnection):
+        # BEGIN IMMEDIATE would lock the attached catalog too and serialize
+        # every shard again; a no-op write takes only the shard's write lock
+        db.execute("BEGIN")
+        db.execute("UPDATE main.cache_versions SET version = version WHERE 0")
+    else:
+        db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
 
 def _ensure_schema(db: sqlite3.Connection):
     db.executescript("""
@@ -212,10 +260,317 @@ def _migrate_v5_mpg_per_carpool(db):
     if "avg_mpg" not in cols:
         db.execute("ALTER TABLE user_carpool_prefs ADD COLUMN avg_mpg REAL")
 
+def _migrate_v6_entries_indexes(db):
+    """
+    Indexes for per-user aggregates (rides on /account) and for probing
+    the roles of a single (carpool, day) without touching the table rows.
+    """
+    db.executescript("""
+        CREATE INDEX IF NOT EXISTS ix_entries_user_role_day   ON entries(user_id, role, day);
+        CREATE INDEX IF NOT EXISTS ix_entries_cid_day_role    ON entries(carpool_id, day, role);
+        CREATE INDEX IF NOT EXISTS ix_entries_member_role_day ON entries(member_key, role, day);
+    """)
+
+def _migrate_v7_user_ride_stats(db):
+    """
+    Materialized ride counts per (user, carpool, month); see ride_stats.py.
+    Backfilled from entries the first time the table is created.
+    """
+    exists = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='user_ride_stats'"
+    ).fetchone()
+    if exists:
+        return
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS user_ride_stats (
+          user_id    INTEGER NOT NULL,
+          carpool_id INTEGER NOT NULL,
+          month      TEXT NOT NULL,          -- YYYY-MM
+          rides      INTEGER NOT NULL DEFAULT 0,
+          PRIMARY KEY (user_id, carpool_id, month),
+          FOREIGN KEY (user_id)    REFERENCES users(id)    ON DELETE CASCADE,
+          FOREIGN KEY (carpool_id) REFERENCES carpools(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS ix_user_ride_stats_cid_month ON user_ride_stats(carpool_id, month);
+    """)
+    from ride_stats import rebuild_ride_stats
+    with transaction(db):
+        rebuild_ride_stats(db)
+
+def _migrate_v8_gas_price_history(db):
+    """
+    Effective-dated gas prices per user (carpool_id NULL = all carpools).
+    Seeded with each user's current gas_price as the price since the beginning,
+    which is what /account assumed before.
+    """
+    exists = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='gas_price_history'"
+    ).fetchone()
+    if exists:
+        return
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS gas_price_history (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id    INTEGER NOT NULL,
+          carpool_id INTEGER,                -- NULL = applies to all carpools
+          effective_from TEXT NOT NULL,      -- YYYY-MM-DD
+          price REAL NOT NULL,
+          FOREIGN KEY (user_id)    REFERENCES users(id)    ON DELETE CASCADE,
+          FOREIGN KEY (carpool_id) REFERENCES carpools(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS ix_gas_price_history_user ON gas_price_history(user_id, effective_from);
+        INSERT INTO gas_price_history(user_id, carpool_id, effective_from, price)
+        SELECT user_id, NULL, '0001-01-01', gas_price FROM user_prefs;
+    """)
+
+def _migrate_v9_cache_versions(db):
+    """
+    Named counters bumped on writes so every worker can tell when its
+    in-process caches are stale (see cache.py).
+    """
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS cache_versions (
+          name    TEXT PRIMARY KEY,
+          version INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+
+def _migrate_v10_carpools_active(db):
+    """
+    carpools.active was only added by update_prod_db.py; the carpool selector
+    and /switch filter on it, so make sure fresh databases have it too.
+    """
+    cols = {r["name"] for r in db.execute("PRAGMA table_info(carpools)").fetchall()}
+    if "active" not in cols:
+        db.execute("ALTER TABLE carpools ADD COLUMN active INTEGER NOT NULL DEFAULT 1")
+
+def _migrate_v11_entry_changes(db):
+    """
+    Which days each bump of a carpool's entries version touched, so live
+    Today pages can be told "day X changed". Short rolling window; see
+    entry_store.entries_changed().
+    """
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS entry_changes (
+          carpool_id INTEGER NOT NULL,
+          version    INTEGER NOT NULL,
+          days       TEXT,              -- comma-separated YYYY-MM-DD; NULL = many/unknown
+          PRIMARY KEY (carpool_id, version)
+        ) WITHOUT ROWID;
+    """)
+
+def _migrate_v12_weekly_patterns(db):
+    """
+    Recurring weekly roles per membership, overlaid on `entries` at read
+    time (see schedule_patterns.py). end_day is inclusive; NULL = open-ended.
+    """
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS weekly_patterns (
+          id         INTEGER PRIMARY KEY AUTOINCREMENT,
+          carpool_id INTEGER NOT NULL,
+          user_id    INTEGER NOT NULL,
+          weekday    INTEGER NOT NULL CHECK(weekday BETWEEN 0 AND 6),  -- 0 = Monday
+          role       TEXT NOT NULL CHECK(role IN ('D','R','O')),
+          start_day  TEXT NOT NULL,
+          end_day    TEXT,
+          FOREIGN KEY (carpool_id) REFERENCES carpools(id) ON DELETE CASCADE,
+          FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS ix_weekly_patterns_member ON weekly_patterns(carpool_id, user_id, start_day);
+    """)
+
+def _migrate_v13_legacy_migrations(db):
+    """
+    Progress of `manage.py migrate-legacy` per (legacy DB, carpool): the last
+    source rowid copied, so an interrupted run resumes after it.
+    """
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS legacy_migrations (
+          source      TEXT NOT NULL,               -- absolute path of the legacy DB
+          carpool_id  INTEGER NOT NULL,
+          last_rowid  INTEGER NOT NULL DEFAULT 0,
+          copied      INTEGER NOT NULL DEFAULT 0,
+          skipped     INTEGER NOT NULL DEFAULT 0,
+          updated_ts  TEXT,
+          PRIMARY KEY (source, carpool_id)
+        ) WITHOUT ROWID;
+    """)
+
+
+def _migrate_v14_soft_delete(db):
+    """
+    Deleting a carpool or user only marks it (deleted_at) and queues a
+    purge_jobs row; purge.py removes its entries in small batches afterwards.
+    """
+    for table in ("carpools", "users"):
+        cols = {r["name"] for r in db.execute(f"PRAGMA table_info({table})").fetchall()}
+        if "deleted_at" not in cols:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN deleted_at TEXT")
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS purge_jobs (
+          id          INTEGER PRIMARY KEY AUTOINCREMENT,
+          kind        TEXT NOT NULL CHECK(kind IN ('carpool','user')),
+          target_id   INTEGER NOT NULL,
+          label       TEXT NOT NULL,             -- name before it was marked deleted
+          total       INTEGER NOT NULL DEFAULT 0,  -- entries to purge when queued
+          done        INTEGER NOT NULL DEFAULT 0,
+          created_ts  TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+          started_ts  TEXT,
+          finished_ts TEXT,
+          error       TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ix_purge_jobs_pending ON purge_jobs(finished_ts, id);
+    """)
+
+def _migrate_v15_username_nocase(db):
+    """
+    Case-insensitive username lookups (`username = ? COLLATE NOCASE`) can use
+    this index; LOWER(username) can't use UNIQUE(username).
+    """
+    db.execute("CREATE INDEX IF NOT EXISTS ix_users_username_nocase ON users(username COLLATE NOCASE)")
+
+def _migrate_v16_membership_indexes(db):
+    """Keyset pages and prefix search of memberships by display name (admin_lists.py)."""
+    db.executescript("""
+        CREATE INDEX IF NOT EXISTS ix_memberships_display_name ON carpool_memberships(display_name COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS ix_memberships_carpool_name ON carpool_memberships(carpool_id, display_name COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS ix_memberships_user ON carpool_memberships(user_id);
+    """)
+
+def _migrate_v17_entry_events(db):
+    """
+    Append-only journal of role changes (entry_store.log_entry_events), written
+    in the same transaction as the entries write. ids grow with ts, so pruning
+    whole months is a delete of the lowest id range.
+    """
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS entry_events (
+          id         INTEGER PRIMARY KEY,             -- increasing; doubles as a change sequence
+          carpool_id INTEGER NOT NULL,
+          ts         TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+          day        TEXT NOT NULL,                   -- YYYY-MM-DD
+          user_id    INTEGER NOT NULL,
+          old_role   TEXT,                            -- NULL = no row before (insert)
+          new_role   TEXT,                            -- NULL = row deleted
+          actor      TEXT
+        );
+        CREATE INDEX IF NOT EXISTS ix_entry_events_cid_ts ON entry_events(carpool_id, ts);
+    """)
+
+def _migrate_v18_entry_events_seq(db):
+    """Delta sync reads a carpool's events after a sequence number (/api/v1/sync)."""
+    db.execute("CREATE INDEX IF NOT EXISTS ix_entry_events_cid_id ON entry_events(carpool_id, id)")
+
+
+def _migrate_v19_archives(db):
+    """
+    Closed years moved out of entries into per-carpool, per-year files
+    (archive.py), and each archived year's closing credit balances.
+    """
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS entry_archives (
+          carpool_id  INTEGER NOT NULL,
+          year        INTEGER NOT NULL,
+          path        TEXT NOT NULL,                 -- file name in the archive/ dir next to the DB
+          rows        INTEGER NOT NULL DEFAULT 0,
+          archived_ts TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+          PRIMARY KEY (carpool_id, year)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS credit_checkpoints (
+          carpool_id  INTEGER NOT NULL,
+          year        INTEGER NOT NULL,              -- balances after Dec 31 of this year
+          user_id     INTEGER NOT NULL,
+          credits     INTEGER NOT NULL,
+          last_driver INTEGER NOT NULL DEFAULT 0,    -- 1 = the latest driver up to then
+          PRIMARY KEY (carpool_id, year, user_id)
+        ) WITHOUT ROWID;
+    """)
+
+def _migrate_v20_carpool_shards(db):
+    """Carpools whose data lives in their own file (sharding.py)."""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS carpool_shards (
+          carpool_id INTEGER PRIMARY KEY,
+          path       TEXT NOT NULL,                  -- file name in the shards/ dir next to the DB
+          sharded_ts TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP)
+        )
+    """)
+
+
+# --- Shards --------------------------------------------------------------------
+# Tables whose rows belong to one carpool. A shard file holds exactly these
+# for its carpool; everything else stays in the main DB (the catalog), which
+# each shard connection attaches as `catalog`, so queries that join entries
+# to users or memberships run unchanged on either connection.
+SHARD_TABLES = ("entries", "entry_events", "entry_changes", "weekly_patterns", "user_ride_stats",
+                "entry_archives", "credit_checkpoints", "cache_versions")
+# cache_versions counters kept in the shard; every other counter is global
+SHARD_VERSIONS = ("entries:", "entry_events:")
+SHARDS_DIRNAME = "shards"
+
+
+class ShardConnection(sqlite3.Connection):
+    """Connection to one carpool's shard file, with the catalog attached."""
+    carpool_id = None
+
+
+def db_file(db) -> str:
+    """Path of the catalog (main DB) file behind a connection."""
+    files = {r[1]: r[2] for r in db.execute("PRAGMA database_list").fetchall()}
+    return os.path.abspath(files.get("catalog") or files["main"])
+
+def shards_dir(db) -> str:
+    return os.path.join(os.path.dirname(db_file(db)), SHARDS_DIRNAME)
+
+def open_shard(catalog_path: str, shard_path: str, carpool_id: int) -> ShardConnection:
+    conn = _connect(shard_path, ShardConnection)
+    conn.execute("ATTACH DATABASE ? AS catalog", (catalog_path,))
+    conn.carpool_id = int(carpool_id)
+    return conn
+
+def shard_paths(db) -> dict:
+    """{carpool_id: shard file} of every sharded carpool."""
+    base = shards_dir(db)
+    return {r[0]: os.path.join(base, r[1]) for r in db.execute("SELECT carpool_id, path FROM carpool_shards")}
+
+def _shard(carpool_id: int):
+    if "shard_paths" not in g:
+        g.shard_paths = shard_paths(g.db)
+    path = g.shard_paths.get(carpool_id)
+    if path is None:
+        return None
+    shards = g.setdefault("shards", {})
+    if carpool_id not in shards:
+        shards[carpool_id] = open_shard(db_file(g.db), path, carpool_id)
+    return shards[carpool_id]
+
+def carpool_dbs(carpool_ids) -> list:
+    """
+    [(db, [carpool ids])]: the carpools grouped by the connection that holds
+    their data, the main DB first, for queries that span carpools.
+    """
+    groups = {}
+    for cid in carpool_ids:
+        db = get_db(cid)
+        groups.setdefault(id(db), (db, []))[1].append(cid)
+    return sorted(groups.values(), key=lambda grp: isinstance(grp[0], ShardConnection))
+
+def all_dbs() -> list:
+    """The main DB and every shard, for admin queries over all carpools."""
+    db = get_db()
+    if "shard_paths" not in g:
+        g.shard_paths = shard_paths(db)
+    return [db] + [get_db(cid) for cid in sorted(g.shard_paths)]
 
+def forget_shards():
+    """Close the request's shard connections and re-read carpool_shards (after (un)sharding)."""
+    for conn in g.pop("shards", {}).values():
+        conn.close()
+    g.pop("shard_paths", None)
 
 
 def close_db(_error=None):
+    forget_shards()
     db = g.pop("db", None)
     if db is not None:
         db.close()
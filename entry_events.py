@@ -0,0 +1,163 @@
+# entry_events.py
+"""
+Reading and pruning the entry_events journal (written by entry_store).
+
+Each event is one role change of one member on one day: old_role -> new_role
+(None on either side for an insert or a delete), who made it and when. Unlike
+`entries`, which keeps only the latest role, the journal keeps every change.
+
+ids are assigned in write order, so they grow with ts: a month of events is
+one id range, and pruning whole months deletes the lowest ids, like dropping
+the oldest partition.
+
+The id is also the sync sequence (/api/v1/sync): a client that has seen a
+carpool's events up to N asks for the ones after N. new_role None is a
+tombstone. Pruning records the highest id it removed, so a client whose
+sequence is older than that knows it missed events and resyncs.
+"""
+from db import transaction
+from cache import get_version
+
+CHANGES_PAGE = 100
+PRUNE_BATCH = 5000
+
+# cache_versions counter: highest event id removed by prune_events()
+PRUNED_MARK = "entry_events:pruned"
+
+
+_EVENTS_SELECT = """
+    SELECT ev.id, ev.ts, ev.carpool_id, c.name AS carpool, ev.day, ev.user_id,
+           COALESCE(m.display_name, u.username, '#' || ev.user_id) AS member,
+           ev.old_role, ev.new_role, ev.actor
+    FROM entry_events ev
+    LEFT JOIN carpools c ON c.id = ev.carpool_id
+    LEFT JOIN carpool_memberships m ON m.carpool_id = ev.carpool_id AND m.user_id = ev.user_id
+    LEFT JOIN users u ON u.id = ev.user_id
+"""
+
+
+def recent_events(db, carpool_id=None, before_ts=None, before_id=None, limit: int = CHANGES_PAGE):
+    """
+    Newest events first, optionally for one carpool. Keyset-paged: by
+    (ts, id) along the (carpool_id, ts) index for one carpool, by id for all.
+    Returns (rows, next cursor {before_ts, before_id} or None).
+    """
+    where, params = [], []
+    has_cursor = bool(before_ts) and str(before_id or "").isdigit()
+    if carpool_id:
+        where.append("ev.carpool_id = ?")
+        params.append(int(carpool_id))
+        if has_cursor:
+            # ts <= lets the index seek; the row value breaks ties by id
+            where.append("ev.ts <= ? AND (ev.ts, ev.id) < (?, ?)")
+            params.extend((before_ts, before_ts, int(before_id)))
+        order = "ev.ts DESC, ev.id DESC"
+    else:
+        if has_cursor:
+            where.append("ev.id < ?")
+            params.append(int(before_id))
+        order = "ev.id DESC"
+    rows = db.execute(_EVENTS_SELECT + f"""
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY {order} LIMIT ?
+    """, (*params, limit + 1)).fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, {"before_ts": rows[-1]["ts"], "before_id": rows[-1]["id"]}
+
+def recent_events_merged(dbs: dict, before: str | None = None, limit: int = CHANGES_PAGE):
+    """
+    recent_events() for all carpools when some are sharded: each database
+    ({key: db}) is paged by id as above and the pages are merged newest
+    first. The cursor {before: "key:id,..."} keeps each database's place
+    (id 0 = nothing older). Returns (rows, next cursor or None).
+    """
+    pos = {}
+    for part in (before or "").split(","):
+        key, _, last = part.partition(":")
+        if key.isdigit() and last.isdigit():
+            pos[int(key)] = int(last)
+    fetched = {}
+    for key, db in dbs.items():
+        if pos.get(key) == 0:
+            continue
+        where, params = ("WHERE ev.id < ?", (pos[key],)) if key in pos else ("", ())
+        fetched[key] = db.execute(_EVENTS_SELECT + where + " ORDER BY ev.id DESC LIMIT ?",
+                                  (*params, limit + 1)).fetchall()
+    # ids grow with ts in each database, so what a page takes from one is a prefix
+    merged = sorted(((r["ts"], key, r["id"], r) for key, rows in fetched.items() for r in rows),
+                    key=lambda x: x[:3], reverse=True)[:limit]
+    taken = {key: 0 for key in fetched}
+    for _ts, key, _id, _r in merged:
+        taken[key] += 1
+    for key, n in taken.items():
+        if n == len(fetched[key]) <= limit:
+            pos[key] = 0
+        elif n:
+            pos[key] = fetched[key][n - 1]["id"]
+    rows = [r for _ts, _key, _id, r in merged]
+    if all(pos.get(key) == 0 for key in dbs):
+        return rows, None
+    return rows, {"before": ",".join(f"{k}:{v}" for k, v in sorted(pos.items()))}
+
+def prune_boundary(db, before_month: str) -> int:
+    """Highest event id written before the first day of `before_month` (YYYY-MM); 0 if none."""
+    cutoff = f"{before_month}-01"
+    top = 0
+    # One index probe per carpool on (carpool_id, ts); a purged carpool's events are gone with it
+    for (cid,) in db.execute("SELECT id FROM carpools").fetchall():
+        row = db.execute(
+            "SELECT MAX(id) FROM entry_events WHERE carpool_id=? AND ts < ?", (cid, cutoff)
+        ).fetchone()
+        top = max(top, row[0] or 0)
+    return top
+
+def prune_events(db, before_month: str, batch: int = PRUNE_BATCH, report=None) -> int:
+    """
+    Drop every event before `before_month` (YYYY-MM), oldest first, `batch`
+    ids per transaction. Returns the number of events deleted.
+    """
+    top = prune_boundary(db, before_month)
+    lo = db.execute("SELECT COALESCE(MIN(id), 1) FROM entry_events").fetchone()[0]
+    deleted = 0
+    while lo <= top:
+        hi = min(lo + batch - 1, top)
+        with transaction(db):
+            deleted += db.execute("DELETE FROM entry_events WHERE id BETWEEN ? AND ?", (lo, hi)).rowcount
+            db.execute("""
+                INSERT INTO cache_versions(name, version) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET version = MAX(version, excluded.version)
+            """, (PRUNED_MARK, hi))
+        if report:
+            report(deleted)
+        lo = hi + 1
+    return deleted
+
+
+# --- Sync ----------------------------------------------------------------------
+def latest_seq(db, carpool_id) -> int:
+    """The carpool's newest event id (0 if none)."""
+    row = db.execute("SELECT MAX(id) FROM entry_events WHERE carpool_id=?", (carpool_id,)).fetchone()
+    return row[0] or 0
+
+def pruned_through(db) -> int:
+    return get_version(db, PRUNED_MARK)
+
+def events_after(db, carpool_id, seq: int, limit: int):
+    """
+    (changes, last_seq, has_more) for the carpool's events after `seq`,
+    at most `limit` events. changes are (seq, day, user_id, role) with only
+    the last change per day/member kept; role None = deleted.
+    """
+    rows = db.execute("""
+        SELECT id, day, user_id, new_role FROM entry_events
+        WHERE carpool_id=? AND id > ? ORDER BY id LIMIT ?
+    """, (carpool_id, seq, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {}
+    for r in rows:
+        latest.pop((r["day"], r["user_id"]), None)  # re-insert so the order follows the last change
+        latest[(r["day"], r["user_id"])] = (r["id"], r["day"], r["user_id"], r["new_role"])
+    return list(latest.values()), (rows[-1]["id"] if rows else seq), has_more
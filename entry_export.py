@@ -0,0 +1,210 @@
+# entry_export.py
+"""
+Streaming exports of `entries` as CSV or NDJSON.
+
+Rows come straight off one SQLite cursor in index order (no ORDER BY that
+needs a sort), are encoded a batch at a time and optionally gzipped on the
+fly, so memory stays flat however many rows are exported. The same
+generators back /api/v1/export, /admin/export and `manage.py export`.
+
+Kinds:
+  history  saved roles per day with carpool and member names
+  audit    every entry row with its id and who/when it was last changed
+Weekly-pattern days are not expanded; only saved rows are exported.
+
+Archived years (archive.py) are included when the range reaches them: each
+archive file is attached in turn and its rows come first (they have no id
+and no member_key of their own), then the rows still in `entries`. With
+sharded carpools (sharding.py) that is repeated for each database.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, timedelta
+
+from flask import Response, stream_with_context
+
+from db import get_db, all_dbs
+from archive import archives, attached
+from compact_layout import day_num, NUM_TO_DAY, CODE_TO_ROLE
+
+KINDS = ("history", "audit")
+FORMATS = ("csv", "ndjson")
+
+# Rows encoded per yielded chunk
+EXPORT_BATCH = 500
+
+_COLUMNS = {
+    "history": ["day", "carpool_id", "carpool", "user_id", "member", "role"],
+    "audit": ["id", "day", "carpool_id", "carpool", "user_id", "member_key", "role",
+              "update_user", "update_ts", "update_date"],
+}
+
+_SELECT = {
+    "history": """
+        SELECT e.day, e.carpool_id, c.name AS carpool, e.user_id,
+               COALESCE(m.display_name, e.member_key) AS member, e.role
+        FROM entries e
+        LEFT JOIN carpools c ON c.id = e.carpool_id
+        LEFT JOIN carpool_memberships m ON m.carpool_id = e.carpool_id AND m.user_id = e.user_id
+    """,
+    "audit": """
+        SELECT e.id, e.day, e.carpool_id, c.name AS carpool, e.user_id, e.member_key, e.role,
+               e.update_user, e.update_ts, e.update_date
+        FROM entries e
+        LEFT JOIN carpools c ON c.id = e.carpool_id
+    """,
+}
+
+# Archived rows in the same columns; {s} is the attached archive's schema
+_ARCHIVE_SELECT = {
+    "history": f"""
+        SELECT {NUM_TO_DAY.format(col="a.day")} AS day, a.carpool_id, c.name AS carpool, a.user_id,
+               m.display_name AS member, {CODE_TO_ROLE.format(col="a.role")} AS role
+        FROM {{s}}.entries_c a
+        LEFT JOIN carpools c ON c.id = a.carpool_id
+        LEFT JOIN carpool_memberships m ON m.carpool_id = a.carpool_id AND m.user_id = a.user_id
+    """,
+    "audit": f"""
+        SELECT NULL AS id, {NUM_TO_DAY.format(col="a.day")} AS day, a.carpool_id, c.name AS carpool, a.user_id,
+               m.member_key, {CODE_TO_ROLE.format(col="a.role")} AS role, act.name AS update_user,
+               datetime(meta.update_ts, 'unixepoch') AS update_ts, date(meta.update_ts, 'unixepoch') AS update_date
+        FROM {{s}}.entries_c a
+        LEFT JOIN {{s}}.entry_meta meta USING (carpool_id, day, user_id)
+        LEFT JOIN {{s}}.entry_actors act ON act.id = meta.actor_id
+        LEFT JOIN carpools c ON c.id = a.carpool_id
+        LEFT JOIN carpool_memberships m ON m.carpool_id = a.carpool_id AND m.user_id = a.user_id
+    """,
+}
+
+# The order of the (carpool_id, day, user_id) unique index, so no sort step
+_ORDER = " ORDER BY e.carpool_id, e.day, e.user_id"
+
+def parse_range(start: str | None, end: str | None):
+    """('YYYY-MM-DD' | None, same) -> (start, end) dates; raises ValueError."""
+    lo = date.fromisoformat(start) if start else None
+    hi = date.fromisoformat(end) if end else None
+    if lo and hi and hi < lo:
+        raise ValueError("end is before start")
+    return lo, hi
+
+def _archived_rows(db, kind: str, carpool_id, start: date | None, end: date | None):
+    """Rows of the archived years in range, one attached file at a time."""
+    where = ["c.deleted_at IS NULL",
+             "NOT EXISTS (SELECT 1 FROM users u WHERE u.id = a.user_id AND u.deleted_at IS NOT NULL)",
+             "a.carpool_id = ?"]
+    params = []
+    if start is not None:
+        where.append("a.day >= ?")
+        params.append(day_num(start))
+    if end is not None:
+        where.append("a.day <= ?")
+        params.append(day_num(end))
+    for cid, year in archives(db, carpool_id, start, end):
+        with attached(db, cid, year) as s:
+            cur = db.execute(_ARCHIVE_SELECT[kind].format(s=s) + " WHERE " + " AND ".join(where)
+                             + " ORDER BY a.carpool_id, a.day, a.user_id", (cid, *params))
+            try:
+                yield from cur
+            finally:
+                cur.close()  # an open statement would keep the file from detaching
+
+def export_rows(db, kind: str, *, carpool_id=None, start: date | None = None, end: date | None = None):
+    """
+    Iterator over the export rows (start/end inclusive), archived years first;
+    don't materialize it. Sharded carpools are read from their own files, so
+    without a carpool each database follows the one before.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"unknown export kind: {kind}")
+    for conn in [get_db(carpool_id)] if carpool_id is not None else all_dbs():
+        yield from _archived_rows(conn, kind, carpool_id, start, end)
+        yield from _live_rows(conn, kind, carpool_id, start, end)
+
+def _live_rows(db, kind: str, carpool_id, start: date | None, end: date | None):
+    # Carpools/users marked deleted are hidden while purge.py removes their rows
+    where = ["c.deleted_at IS NULL",
+             "NOT EXISTS (SELECT 1 FROM users u WHERE u.id = e.user_id AND u.deleted_at IS NOT NULL)"]
+    params = []
+    if carpool_id is not None:
+        where.append("e.carpool_id = ?")
+        params.append(int(carpool_id))
+    elif kind == "history":
+        where.append("e.carpool_id IS NOT NULL")
+    if start is not None:
+        where.append("e.day >= ?")
+        params.append(start.isoformat())
+    if end is not None:
+        where.append("e.day < ?")
+        params.append((end + timedelta(days=1)).isoformat())
+    sql = _SELECT[kind] + " WHERE " + " AND ".join(where) + _ORDER
+    yield from db.execute(sql, params)
+
+def encode(rows, kind: str, fmt: str):
+    """Yield text chunks of `rows` as CSV (with header) or NDJSON."""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+    cols = _COLUMNS[kind]
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer:
+        writer.writerow(cols)
+    n = 0
+    for r in rows:
+        if writer:
+            writer.writerow([r[c] for c in cols])
+        else:
+            buf.write(json.dumps({c: r[c] for c in cols}, separators=(",", ":")))
+            buf.write("\n")
+        n += 1
+        if n % EXPORT_BATCH == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+def gzipped(chunks):
+    """Gzip a stream of text chunks as it goes (yields bytes)."""
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        out = z.compress(chunk.encode())
+        if out:
+            yield out
+    yield z.flush()
+
+def export_stream(db, kind: str, fmt: str, *, carpool_id=None, start=None, end=None, gzip=False):
+    """The full export as a generator of bytes."""
+    chunks = encode(export_rows(db, kind, carpool_id=carpool_id, start=start, end=end), kind, fmt)
+    if gzip:
+        return gzipped(chunks)
+    return (c.encode() for c in chunks)
+
+def export_filename(kind: str, fmt: str, *, carpool_id=None, start=None, end=None, gzip=False) -> str:
+    parts = [kind]
+    if carpool_id is not None:
+        parts.append(f"carpool{int(carpool_id)}")
+    if start or end:
+        parts.append(f"{start or ''}_{end or ''}")
+    return "-".join(parts) + f".{fmt}" + (".gz" if gzip else "")
+
+def mimetype(fmt: str, gzip: bool = False) -> str:
+    if gzip:
+        return "application/gzip"
+    return "text/csv" if fmt == "csv" else "application/x-ndjson"
+
+def export_response(kind: str, fmt: str, *, carpool_id=None, start=None, end=None, gzip=False) -> Response:
+    """A streamed download of the export for a Flask view."""
+    def generate():
+        yield from export_stream(get_db(), kind, fmt, carpool_id=carpool_id, start=start, end=end, gzip=gzip)
+
+    # Validate before the 200 goes out; errors mid-stream can't change the status
+    if kind not in KINDS or fmt not in FORMATS:
+        raise ValueError("unknown export kind or format")
+    resp = Response(stream_with_context(generate()), mimetype=mimetype(fmt, gzip))
+    name = export_filename(kind, fmt, carpool_id=carpool_id, start=start, end=end, gzip=gzip)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{name}"'
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
@@ -0,0 +1,190 @@
+# entry_import.py
+"""
+Streaming import of day/member/role rows from CSV into `entries`.
+
+The file is read one row at a time (csv.DictReader over any line iterator),
+validated, and upserted in chunks of IMPORT_CHUNK rows: one executemany and
+one entries_changed() per carpool per chunk, each chunk one transaction (per
+database, when carpools are sharded).
+Nothing but the current chunk and the membership lookups is held in memory,
+and an interrupted import can simply be re-run (the upsert is idempotent).
+
+Columns (header names, case-insensitive):
+  day        YYYY-MM-DD (M/D/YYYY is accepted too)
+  role       D/R/O or Driver/Rider/Off
+  member     display name, member key or username; or `user_id`
+  carpool    carpool name; or `carpool_id`; or given once for the whole file
+A history export (entry_export.py) imports back as-is.
+"""
+import csv
+from datetime import date, datetime
+
+from constants import ROLE_CHOICES
+from db import get_db, carpool_dbs, transaction
+from entry_store import entries_changed, log_upserts
+from archive import archive_boundary
+
+IMPORT_CHUNK = 5000
+# Error messages kept in the report; the rest are only counted
+IMPORT_MAX_ERRORS = 50
+
+_ROLE_WORDS = {"DRIVER": "D", "RIDER": "R", "OFF": "O"}
+
+_UPSERT = """
+    INSERT INTO entries(carpool_id, day, user_id, member_key, role, update_user, update_ts, update_date)
+    VALUES(?,?,?,?,?,?,CURRENT_TIMESTAMP, DATE('now'))
+    ON CONFLICT(carpool_id, day, user_id) DO UPDATE SET
+      role=excluded.role,
+      member_key=excluded.member_key,
+      update_user=excluded.update_user,
+      update_ts=CURRENT_TIMESTAMP,
+      update_date=DATE('now')
+"""
+
+
+class RowError(ValueError):
+    """A row that can't be imported (reported, not raised to the caller)."""
+
+
+def _parse_day(s: str) -> date:
+    s = (s or "").strip()
+    try:
+        return date.fromisoformat(s[:10])  # much cheaper than strptime per row
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(s, "%m/%d/%Y").date()
+    except ValueError:
+        pass
+    raise RowError(f"bad day {s!r}")
+
+def _parse_role(s: str) -> str:
+    s = (s or "").strip().upper()
+    s = _ROLE_WORDS.get(s, s)
+    if s not in ROLE_CHOICES:
+        raise RowError(f"bad role {s!r}")
+    return s
+
+
+class _Lookups:
+    """Carpool and member resolution, loaded once per carpool."""
+
+    def __init__(self, db, default_carpool_id):
+        self.db = db
+        self.default = int(default_carpool_id) if default_carpool_id else None
+        self.pools = {r["name"].casefold(): r["id"] for r in db.execute("SELECT id, name FROM carpools WHERE deleted_at IS NULL")}
+        self.pool_ids = set(self.pools.values())
+        self.members = {}  # cid -> {"ids": {uid: member_key}, "names": {casefolded: uid}}
+        self.boundaries = {}  # cid -> first day not archived (None = nothing archived)
+
+    def carpool(self, row) -> int:
+        raw_id = (row.get("carpool_id") or "").strip()
+        raw_name = (row.get("carpool") or "").strip()
+        if raw_id:
+            if not raw_id.isdigit() or int(raw_id) not in self.pool_ids:
+                raise RowError(f"unknown carpool_id {raw_id!r}")
+            return int(raw_id)
+        if raw_name:
+            cid = self.pools.get(raw_name.casefold())
+            if cid is None:
+                raise RowError(f"unknown carpool {raw_name!r}")
+            return cid
+        if self.default is None:
+            raise RowError("no carpool given")
+        return self.default
+
+    def _load(self, cid):
+        ids, names = {}, {}
+        for r in self.db.execute("""
+            SELECT m.user_id, m.member_key, m.display_name, u.username
+            FROM carpool_memberships m LEFT JOIN users u ON u.id = m.user_id
+            WHERE m.carpool_id=?
+        """, (cid,)).fetchall():
+            ids[r["user_id"]] = r["member_key"]
+            for label in (r["display_name"], r["member_key"], r["username"]):
+                if label:
+                    names.setdefault(label.casefold(), r["user_id"])
+        self.members[cid] = {"ids": ids, "names": names}
+        return self.members[cid]
+
+    def check_day(self, cid, day: date):
+        if cid not in self.boundaries:
+            self.boundaries[cid] = archive_boundary(get_db(cid), cid)
+        if self.boundaries[cid] is not None and day < self.boundaries[cid]:
+            raise RowError(f"{day} is archived in carpool {cid}")
+
+    def member(self, cid, row):
+        """(user_id, member_key) of the row's member in carpool `cid`."""
+        m = self.members.get(cid) or self._load(cid)
+        raw_id = (row.get("user_id") or "").strip()
+        if raw_id:
+            if raw_id.isdigit() and int(raw_id) in m["ids"]:
+                return int(raw_id), m["ids"][int(raw_id)]
+            raise RowError(f"user_id {raw_id!r} is not a member of carpool {cid}")
+        raw = (row.get("member") or "").strip()
+        uid = m["names"].get(raw.casefold()) if raw else None
+        if uid is None:
+            raise RowError(f"member {raw!r} is not in carpool {cid}")
+        return uid, m["ids"][uid]
+
+
+def import_entries(db, lines, *, carpool_id=None, username="import", dry_run=False,
+                   chunk_size=IMPORT_CHUNK, progress=None) -> dict:
+    """
+    Import CSV `lines` (an iterable of text lines, e.g. an open file).
+    Invalid rows are skipped and reported; with dry_run nothing is written.
+    progress(report) is called after every chunk.
+    Returns {"rows", "valid", "written", "errors", "error_count", "carpools": {cid: rows}}.
+    """
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None:
+        raise ValueError("empty file")
+    reader.fieldnames = [(f or "").strip().lower() for f in reader.fieldnames]
+    missing = {"day", "role"} - set(reader.fieldnames)
+    if missing or not ({"member", "user_id"} & set(reader.fieldnames)):
+        raise ValueError("CSV needs day, role and member (or user_id) columns")
+
+    lookups = _Lookups(db, carpool_id)
+    report = {"rows": 0, "valid": 0, "written": 0, "errors": [], "error_count": 0, "carpools": {}}
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        if not dry_run:
+            by_carpool = {}
+            for cid, day_iso, uid, _key, role, _user in batch:
+                by_carpool.setdefault(cid, []).append((day_iso, uid, role))
+            # One transaction per database: sharded carpools write to their own file
+            for conn, group in carpool_dbs(by_carpool):
+                with transaction(conn):
+                    for cid in group:
+                        log_upserts(conn, cid, by_carpool[cid], username)
+                    conn.executemany(_UPSERT, [b for b in batch if b[0] in group])
+                    for cid in group:
+                        entries_changed(conn, cid, sorted({day for day, _uid, _role in by_carpool[cid]}))
+            report["written"] += len(batch)
+        batch.clear()
+        if progress:
+            progress(report)
+
+    for row in reader:
+        report["rows"] += 1
+        try:
+            cid = lookups.carpool(row)
+            day = _parse_day(row.get("day"))
+            lookups.check_day(cid, day)
+            role = _parse_role(row.get("role"))
+            uid, key = lookups.member(cid, row)
+        except RowError as e:
+            report["error_count"] += 1
+            if len(report["errors"]) < IMPORT_MAX_ERRORS:
+                report["errors"].append(f"line {reader.line_num}: {e}")
+            continue
+        report["valid"] += 1
+        report["carpools"][cid] = report["carpools"].get(cid, 0) + 1
+        batch.append((cid, day.isoformat(), uid, key, role, username))
+        if len(batch) >= chunk_size:
+            flush()
+    flush()
+    return report
@@ -0,0 +1,127 @@
+# entry_store.py
+"""
+Write-side bookkeeping for `entries`.
+
+Every code path that inserts, updates or deletes entries for a carpool calls
+entries_changed() in the same transaction, which keeps the derived data in
+step with the table:
+  - user_ride_stats for the touched months (ride_stats.py)
+  - the carpool's data version (cache_versions 'entries:<carpool_id>'), which
+    readers use for ETags and to notice changes made by other workers
+  - entry_changes, a short log of which days each version touched
+
+Writers also journal each role change (old -> new, who, when) in
+entry_events with log_upserts()/log_entry_events(), again inside their
+transaction; entry_events.py reads and prunes that log.
+"""
+from db import carpool_dbs
+from cache import bump_version, get_version
+from ride_stats import refresh_ride_stats, rebuild_ride_stats
+
+# Versions kept in entry_changes per carpool; older readers just reload
+CHANGE_LOG_KEEP = 200
+
+_EVENT_INSERT = """
+    INSERT INTO entry_events(carpool_id, day, user_id, old_role, new_role, actor)
+    VALUES (?,?,?,?,?,?)
+"""
+
+
+def _version_name(carpool_id) -> str:
+    return f"entries:{int(carpool_id)}"
+
+def _iso(day) -> str:
+    return day.isoformat() if hasattr(day, "isoformat") else str(day)[:10]
+
+def carpool_version(db, carpool_id) -> int:
+    """Counter that moves whenever the carpool's entries change."""
+    return get_version(db, _version_name(carpool_id))
+
+def carpool_versions(carpool_ids) -> dict:
+    """carpool_version() for several carpools, one query per database: {carpool_id: version}."""
+    out = {int(c): 0 for c in carpool_ids}
+    for conn, group in carpool_dbs(out):
+        names = {_version_name(c): c for c in group}
+        marks = ",".join("?" * len(names))
+        for r in conn.execute(f"SELECT name, version FROM cache_versions WHERE name IN ({marks})", tuple(names)).fetchall():
+            out[names[r["name"]]] = int(r["version"])
+    return out
+
+def entries_changed(db, carpool_id, days=None, *, ride_stats=True):
+    """
+    Record that entries of `carpool_id` changed on `days`
+    (None = unknown/many days, e.g. after a bulk delete).
+    ride_stats=False skips the stats refresh for changes that only affect
+    readers (weekly patterns, which ride stats do not count).
+    """
+    if carpool_id is None:
+        return
+    if ride_stats and days is None:
+        rebuild_ride_stats(db, carpool_id)
+    elif ride_stats:
+        refresh_ride_stats(db, carpool_id, days)
+    bump_version(db, _version_name(carpool_id))
+
+    version = carpool_version(db, carpool_id)
+    db.execute(
+        "INSERT OR REPLACE INTO entry_changes(carpool_id, version, days) VALUES (?,?,?)",
+        (carpool_id, version, None if days is None else ",".join(sorted({_iso(d) for d in days})))
+    )
+    db.execute(
+        "DELETE FROM entry_changes WHERE carpool_id=? AND version <= ?",
+        (carpool_id, version - CHANGE_LOG_KEEP)
+    )
+
+def changes_since(db, carpool_id, version: int):
+    """
+    (current_version, days) for everything after `version`. days is a sorted
+    list of YYYY-MM-DD, or None if unknown (bulk change or log already pruned).
+    """
+    current = carpool_version(db, carpool_id)
+    if current == version:
+        return current, []
+    rows = db.execute(
+        "SELECT version, days FROM entry_changes WHERE carpool_id=? AND version > ? ORDER BY version",
+        (carpool_id, version)
+    ).fetchall()
+    if len(rows) != current - version or any(r["days"] is None for r in rows):
+        return current, None
+    return current, sorted({d for r in rows for d in r["days"].split(",")})
+
+def roles_before(db, carpool_id, days) -> dict:
+    """{(day, user_id): role} of the carpool's saved entries between the first and last of `days`."""
+    days = sorted({_iso(d) for d in days})
+    if not days:
+        return {}
+    return {
+        (r["day"], r["user_id"]): r["role"]
+        for r in db.execute(
+            "SELECT day, user_id, role FROM entries WHERE carpool_id=? AND day BETWEEN ? AND ?",
+            (carpool_id, days[0], days[-1])
+        )
+    }
+
+def log_entry_events(db, carpool_id, changes, actor) -> int:
+    """
+    Append (day, user_id, old_role, new_role) changes to entry_events
+    (None = no row); writes that leave the role as it was are skipped.
+    Returns the number of events written.
+    """
+    rows = [(carpool_id, _iso(day), uid, old, new, actor) for day, uid, old, new in changes if old != new]
+    if rows:
+        db.executemany(_EVENT_INSERT, rows)
+    return len(rows)
+
+def log_upserts(db, carpool_id, rows, actor) -> int:
+    """
+    Journal an upsert of (day, user_id, role) rows. Call it in the upsert's
+    transaction, before the upsert, so the old roles can still be read.
+    """
+    rows = list(rows)
+    current = roles_before(db, carpool_id, [day for day, _uid, _role in rows])
+    changes = []
+    for day, uid, role in rows:
+        key = (_iso(day), uid)
+        changes.append((day, uid, current.get(key), role))
+        current[key] = role  # a later row for the same day/user follows this one
+    return log_entry_events(db, carpool_id, changes, actor)
@@ -0,0 +1,181 @@
+# legacy_consolidate.py
+"""
+Parallel consolidation of many legacy single-pool databases into one
+multi-carpool DB (`manage.py consolidate`).
+
+Uses the same mapping config as legacy_migrate.py. Each source is split
+into rowid ranges; a process pool reads and normalizes the ranges in
+parallel (day formats, roles, member key -> user id), and the parent process
+is the only writer: results are bulk-loaded into a TEMP staging table as they
+arrive (no lock on the main DB while reading), then each carpool is merged
+into `entries` with one INSERT ... SELECT in its own transaction.
+
+Duplicate (carpool, day, user) rows, e.g. the same day stored twice in
+different formats or two sources mapped to one carpool, are reported as
+conflicts. The later source in the config, then the higher rowid, wins,
+the same rule legacy_migrate.verify() checks against.
+"""
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import ROLE_CHOICES
+from db import transaction
+from entry_store import entries_changed
+from legacy_migrate import CHUNK, normalize_day, open_source, prepare_carpool
+
+# Rows per source index in the staging priority (source_index * this + rowid)
+_PRIO_STRIDE = 1 << 40
+# Conflicting keys listed in the report; the rest are only counted
+CONFLICT_SAMPLES = 20
+# Read tasks in flight per worker; bounds memory when the writer falls behind
+READ_AHEAD = 4
+
+
+def read_range(task):
+    """
+    Worker: normalize source rows with lo < rowid <= hi.
+    task = (source_index, path, {legacy_key: (user_id, member_key)}, lo, hi)
+    Returns (source_index, rows_read, rows, skipped); rows are
+    (day, user_id, member_key, role, update_ts, rowid).
+    """
+    idx, path, members, lo, hi = task
+    src = open_source(path)
+    try:
+        batch = src.execute(
+            "SELECT rowid AS rid, day, member_key, role, update_ts FROM entries WHERE rowid > ? AND rowid <= ?",
+            (lo, hi)
+        ).fetchall()
+    finally:
+        src.close()
+    rows, skipped = [], 0
+    for r in batch:
+        day = normalize_day(r["day"])
+        role = (r["role"] or "").strip().upper()
+        member = members.get(r["member_key"])
+        if member is None or day is None or role not in ROLE_CHOICES:
+            skipped += 1
+            continue
+        rows.append((day, *member, role, r["update_ts"] or "", r["rid"]))
+    return idx, len(batch), rows, skipped
+
+def _tasks(idx, path, members, chunk):
+    src = open_source(path)
+    try:
+        lo, hi = src.execute("SELECT COALESCE(MIN(rowid), 1), COALESCE(MAX(rowid), 0) FROM entries").fetchone()
+    finally:
+        src.close()
+    start = lo - 1
+    while start < hi:
+        yield (idx, path, members, start, min(start + chunk, hi))
+        start += chunk
+
+def _read_all(pool, tasks, window: int):
+    """pool results in task order with at most `window` tasks submitted ahead."""
+    pending = deque()
+    tasks = iter(tasks)
+    for task in tasks:
+        pending.append(pool.submit(read_range, task))
+        if len(pending) >= window:
+            break
+    while pending:
+        result = pending.popleft().result()
+        for task in tasks:
+            pending.append(pool.submit(read_range, task))
+            break
+        yield result
+
+def consolidate(db, specs, *, workers: int | None = None, chunk: int = CHUNK, report=print) -> dict:
+    """
+    Read all `specs` in parallel and merge them into `entries`.
+    Returns {"read", "staged", "skipped", "written", "conflicts",
+    "conflict_samples", "overwrites", "read_s", "write_s", "carpools": {name: rows}}.
+    """
+    t0 = time.perf_counter()
+    targets = []  # per source: carpool_id
+    tasks = []
+    for idx, spec in enumerate(specs):
+        cid, members = prepare_carpool(db, spec)
+        targets.append(cid)
+        tasks.extend(_tasks(idx, spec["db"], members, chunk))
+
+    db.executescript("""
+        DROP TABLE IF EXISTS temp.legacy_stage;
+        CREATE TEMP TABLE legacy_stage (
+          carpool_id INTEGER, day TEXT, user_id INTEGER, member_key TEXT,
+          role TEXT, update_ts TEXT, prio INTEGER
+        );
+    """)
+    stats = {"read": 0, "staged": 0, "skipped": 0, "written": 0, "carpools": {}}
+    workers = workers or min(len(specs), os.cpu_count() or 1) or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Results arrive in task order; the pool reads ahead while we stage
+        for idx, n_read, rows, skipped in _read_all(pool, tasks, workers * READ_AHEAD):
+            cid = targets[idx]
+            db.executemany(
+                "INSERT INTO temp.legacy_stage VALUES (?,?,?,?,?,?,?)",
+                [(cid, day, uid, key, role, ts, idx * _PRIO_STRIDE + rid)
+                 for day, uid, key, role, ts, rid in rows]
+            )
+            stats["read"] += n_read
+            stats["staged"] += len(rows)
+            stats["skipped"] += skipped
+    stats["read_s"] = time.perf_counter() - t0
+    report(f"read {stats['read']} rows from {len(specs)} sources with {workers} workers "
+           f"in {stats['read_s']:.2f}s ({stats['read'] / max(stats['read_s'], 1e-9):,.0f} rows/s)")
+
+    db.execute("CREATE INDEX temp.ix_legacy_stage ON legacy_stage(carpool_id, day, user_id, prio)")
+    conflicts = db.execute("""
+        SELECT s.carpool_id, c.name AS carpool, s.day, s.user_id, COUNT(*) AS n,
+               GROUP_CONCAT(s.role, '') AS roles
+        FROM temp.legacy_stage s JOIN carpools c ON c.id = s.carpool_id
+        GROUP BY s.carpool_id, s.day, s.user_id HAVING COUNT(*) > 1
+        ORDER BY s.carpool_id, s.day
+    """).fetchall()
+    stats["conflicts"] = len(conflicts)
+    stats["conflict_samples"] = [dict(r) for r in conflicts[:CONFLICT_SAMPLES]]
+    # Rows that will replace a different role already in the destination
+    stats["overwrites"] = db.execute("""
+        SELECT COUNT(*) FROM (
+          SELECT carpool_id, day, user_id, role,
+                 ROW_NUMBER() OVER (PARTITION BY carpool_id, day, user_id ORDER BY prio DESC) AS rn
+          FROM temp.legacy_stage
+        ) s JOIN entries e ON e.carpool_id = s.carpool_id AND e.day = s.day AND e.user_id = s.user_id
+        WHERE s.rn = 1 AND e.role <> s.role
+    """).fetchone()[0]
+
+    t1 = time.perf_counter()
+    for cid in sorted(set(targets)):
+        with transaction(db):
+            # Journal the winning rows that change a role, before they overwrite it
+            db.execute("""
+                INSERT INTO entry_events(carpool_id, day, user_id, old_role, new_role, actor)
+                SELECT s.carpool_id, s.day, s.user_id, e.role, s.role, 'legacy_migration'
+                FROM (
+                  SELECT *, ROW_NUMBER() OVER (PARTITION BY day, user_id ORDER BY prio DESC) AS rn
+                  FROM temp.legacy_stage WHERE carpool_id = ?
+                ) s
+                LEFT JOIN entries e ON e.carpool_id = s.carpool_id AND e.day = s.day AND e.user_id = s.user_id
+                WHERE s.rn = 1 AND e.role IS NOT s.role
+            """, (cid,))
+            n = db.execute("""
+                INSERT INTO entries(carpool_id, day, user_id, member_key, role, update_user, update_ts, update_date)
+                SELECT carpool_id, day, user_id, member_key, role, 'legacy_migration', update_ts, DATE('now')
+                FROM (
+                  SELECT *, ROW_NUMBER() OVER (PARTITION BY day, user_id ORDER BY prio DESC) AS rn
+                  FROM temp.legacy_stage WHERE carpool_id = ?
+                ) WHERE rn = 1
+                ON CONFLICT(carpool_id, day, user_id) DO UPDATE SET
+                  role=excluded.role,
+                  member_key=excluded.member_key
+            """, (cid,)).rowcount
+            entries_changed(db, cid)
+        name = db.execute("SELECT name FROM carpools WHERE id=?", (cid,)).fetchone()["name"]
+        stats["carpools"][name] = n
+        stats["written"] += n
+    stats["write_s"] = time.perf_counter() - t1
+    db.execute("DROP TABLE temp.legacy_stage")
+    report(f"wrote {stats['written']} rows into {len(stats['carpools'])} carpools in {stats['write_s']:.2f}s "
+           f"({stats['written'] / max(stats['write_s'], 1e-9):,.0f} rows/s)")
+    return stats
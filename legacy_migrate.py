@@ -0,0 +1,275 @@
+# legacy_migrate.py
+"""
+Batched, resumable migration of legacy single-pool databases (data.db:
+entries(day, member_key, role, ...)) into the multi-carpool schema.
+
+Driven by a JSON mapping config, so any number of legacy DBs can be mapped
+to any carpools:
+
+  {
+    "sources": [
+      {"db": "data.db", "carpool": "CESpool",
+       "members": {"CA": "christian", "ER": "eric", "SJ": "sean"},
+       "names":   {"CA": "Christian"}}
+    ]
+  }
+
+`db` paths are relative to the config file. `members` maps legacy member
+keys to existing usernames (memberships are added when missing, display
+name from `names` or the capitalized username, member key suffixed with the
+carpool id if another carpool already uses it); rows of unmapped keys are
+skipped and counted. The carpool is created if it does not exist.
+
+Source rows are streamed in rowid order, CHUNK at a time, normalized (day to
+YYYY-MM-DD, role checked against ROLE_CHOICES) and upserted with one
+executemany per chunk. Each chunk and its progress row in legacy_migrations
+commit together, so an interrupted run picks up after the last chunk.
+
+verify() then compares every carpool's deduplicated source rows with the
+destination: row counts plus an order-independent checksum of
+(day, user_id, role), and the missing/different/extra row counts.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from constants import ROLE_CHOICES
+from db import transaction
+from entry_store import entries_changed, log_upserts
+from template_helpers import invalidate_carpool_options
+
+CHUNK = 2000
+
+_UPSERT = """
+    INSERT INTO entries(carpool_id, day, user_id, member_key, role, update_user, update_ts, update_date)
+    VALUES (?, ?, ?, ?, ?, 'legacy_migration', ?, DATE('now'))
+    ON CONFLICT(carpool_id, day, user_id) DO UPDATE SET
+      role=excluded.role,
+      member_key=excluded.member_key
+"""
+
+
+def load_config(path: str) -> list:
+    """The config's sources, with `db` made absolute. Raises ValueError on a bad config."""
+    with open(path, encoding="utf-8") as f:
+        cfg = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    sources = cfg.get("sources") if isinstance(cfg, dict) else None
+    if not sources:
+        raise ValueError("config has no sources")
+    out = []
+    for i, s in enumerate(sources):
+        if not s.get("db") or not s.get("carpool") or not isinstance(s.get("members"), dict):
+            raise ValueError(f"source #{i + 1} needs db, carpool and members")
+        out.append({
+            "db": os.path.realpath(os.path.join(base, s["db"])),
+            "carpool": str(s["carpool"]),
+            "members": {str(k): str(v) for k, v in s["members"].items()},
+            "names": {str(k): str(v) for k, v in (s.get("names") or {}).items()},
+        })
+    return out
+
+def normalize_day(val):
+    """Legacy day values to YYYY-MM-DD, or None if unparseable."""
+    s = str(val or "").strip()
+    try:
+        return datetime.strptime(s[:10], "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        pass
+    # Older rows: "Aug 24 2025 01:23:45 PM"
+    try:
+        return datetime.strptime(s.replace(",", ""), "%b %d %Y %I:%M:%S %p").date().isoformat()
+    except ValueError:
+        return None
+
+def open_source(path: str):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"legacy DB not found: {path}")
+    src = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    src.row_factory = sqlite3.Row
+    return src
+
+def read_chunks(src, keys, after_rowid: int = 0, chunk: int = CHUNK):
+    """
+    Yield (last_rowid, rows, skipped) per chunk of source entries after
+    `after_rowid`; rows are (day, member_key, role, update_ts) for the mapped
+    `keys`, with unmapped keys, bad days and bad roles counted in `skipped`.
+    Only needs a read-only sqlite3 connection, no app context.
+    """
+    while True:
+        batch = src.execute(
+            "SELECT rowid AS rid, day, member_key, role, update_ts FROM entries WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (after_rowid, chunk)
+        ).fetchall()
+        if not batch:
+            return
+        rows, skipped = [], 0
+        for r in batch:
+            day = normalize_day(r["day"])
+            role = (r["role"] or "").strip().upper()
+            if r["member_key"] not in keys or day is None or role not in ROLE_CHOICES:
+                skipped += 1
+                continue
+            rows.append((day, r["member_key"], role, r["update_ts"] or ""))
+        after_rowid = batch[-1]["rid"]
+        yield after_rowid, rows, skipped
+
+def _user_ids(db, spec) -> dict:
+    """{member_key: user_id} for the mapped usernames that exist."""
+    out = {}
+    for key, username in spec["members"].items():
+        row = db.execute("SELECT id FROM users WHERE username=?", (username,)).fetchone()
+        if row:
+            out[key] = row["id"]
+    return out
+
+def _free_key(db, key: str, cid: int) -> str:
+    """
+    `key`, or `key-<cid>` if another carpool (or a legacy single-pool row)
+    already uses it: entries still carry the legacy UNIQUE(day, member_key).
+    """
+    taken = db.execute(
+        "SELECT 1 FROM carpool_memberships WHERE member_key=? AND carpool_id<>? LIMIT 1", (key, cid)
+    ).fetchone() or db.execute(
+        "SELECT 1 FROM entries WHERE member_key=? AND (carpool_id IS NULL OR carpool_id<>?) LIMIT 1", (key, cid)
+    ).fetchone()
+    return f"{key}-{cid}" if taken else key
+
+def prepare_carpool(db, spec) -> tuple:
+    """
+    (carpool_id, {legacy_key: (user_id, member_key)}) for a source, creating
+    the carpool and any missing memberships. member_key is the membership's
+    key, which is what entries store.
+    """
+    user_ids = _user_ids(db, spec)
+    missing = [u for k, u in spec["members"].items() if k not in user_ids]
+    if missing:
+        raise ValueError(f"users not found: {', '.join(missing)}")
+    members = {}
+    with transaction(db):
+        row = db.execute("SELECT id FROM carpools WHERE name=?", (spec["carpool"],)).fetchone()
+        cid = row["id"] if row else db.execute("INSERT INTO carpools(name) VALUES (?)", (spec["carpool"],)).lastrowid
+        added = 0
+        for key, uid in user_ids.items():
+            mem = db.execute(
+                "SELECT member_key FROM carpool_memberships WHERE carpool_id=? AND user_id=?", (cid, uid)
+            ).fetchone()
+            if mem is None:
+                mem_key = _free_key(db, key, cid)
+                db.execute("""
+                    INSERT INTO carpool_memberships(carpool_id, user_id, member_key, display_name, active)
+                    VALUES (?, ?, ?, ?, 1)
+                """, (cid, uid, mem_key, spec["names"].get(key) or spec["members"][key].capitalize()))
+                added += 1
+            else:
+                mem_key = mem["member_key"]
+            members[key] = (uid, mem_key)
+        if added or not row:
+            invalidate_carpool_options(db)
+    return cid, members
+
+def write_chunk(db, source: str, cid: int, members: dict, last_rowid: int, rows, skipped: int):
+    """Upsert one chunk and advance the progress row, in one transaction."""
+    with transaction(db):
+        if rows:
+            log_upserts(db, cid, [(day, members[key][0], role) for day, key, role, _ts in rows], "legacy_migration")
+            db.executemany(_UPSERT, [(cid, day, *members[key], role, ts) for day, key, role, ts in rows])
+            entries_changed(db, cid, sorted({day for day, *_ in rows}))
+        db.execute("""
+            INSERT INTO legacy_migrations(source, carpool_id, last_rowid, copied, skipped, updated_ts)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(source, carpool_id) DO UPDATE SET
+              last_rowid=excluded.last_rowid,
+              copied=copied + excluded.copied,
+              skipped=skipped + excluded.skipped,
+              updated_ts=CURRENT_TIMESTAMP
+        """, (source, cid, last_rowid, len(rows), skipped))
+
+def progress(db, source: str, cid: int) -> int:
+    row = db.execute(
+        "SELECT last_rowid FROM legacy_migrations WHERE source=? AND carpool_id=?", (source, cid)
+    ).fetchone()
+    return row["last_rowid"] if row else 0
+
+def reset_progress(db, specs):
+    with transaction(db):
+        for spec in specs:
+            db.execute("DELETE FROM legacy_migrations WHERE source=?", (spec["db"],))
+
+def migrate_source(db, spec, chunk: int = CHUNK, report=print) -> dict:
+    """Copy one legacy DB (resuming where it stopped). Returns {carpool_id, copied, skipped}."""
+    cid, members = prepare_carpool(db, spec)
+    start = progress(db, spec["db"], cid)
+    if start:
+        report(f"{spec['db']}: resuming after rowid {start}")
+    copied = skipped = 0
+    src = open_source(spec["db"])
+    try:
+        for last_rowid, rows, n_skipped in read_chunks(src, members, start, chunk):
+            write_chunk(db, spec["db"], cid, members, last_rowid, rows, n_skipped)
+            copied += len(rows)
+            skipped += n_skipped
+            report(f"{spec['db']} -> {spec['carpool']}: {copied} copied, {skipped} skipped (rowid {last_rowid})")
+    finally:
+        src.close()
+    return {"carpool_id": cid, "copied": copied, "skipped": skipped}
+
+
+# --- Verification --------------------------------------------------------------
+def _row_hash(day: str, user_id: int, role: str) -> int:
+    return int.from_bytes(hashlib.sha256(f"{day}|{user_id}|{role}".encode()).digest()[:8], "big")
+
+def checksum(rows) -> str:
+    """Order-independent checksum of (day, user_id, role) rows."""
+    return f"{sum(_row_hash(*r) for r in rows) % (1 << 64):016x}"
+
+def verify(db, specs, chunk: int = CHUNK) -> list:
+    """
+    Per carpool: {carpool, source_rows, dest_rows, source_sum, dest_sum,
+    missing, different, extra, ok}. Later sources/rowids win on duplicate
+    (day, member), as they do when copying.
+    """
+    by_carpool = {}
+    for spec in specs:
+        by_carpool.setdefault(spec["carpool"], []).append(spec)
+
+    results = []
+    for name, group in by_carpool.items():
+        row = db.execute("SELECT id FROM carpools WHERE name=?", (name,)).fetchone()
+        cid = row["id"] if row else None
+        expected = {}  # (day, user_id) -> role
+        for spec in group:
+            user_ids = _user_ids(db, spec)
+            src = open_source(spec["db"])
+            try:
+                for _last, rows, _skipped in read_chunks(src, user_ids, 0, chunk):
+                    for day, key, role, _ts in rows:
+                        expected[(day, user_ids[key])] = role
+            finally:
+                src.close()
+
+        different = extra = dest_rows = dest_sum = 0
+        seen = set()
+        if cid is not None:
+            for r in db.execute("SELECT day, user_id, role FROM entries WHERE carpool_id=?", (cid,)):
+                dest_rows += 1
+                dest_sum += _row_hash(r["day"], r["user_id"], r["role"])
+                want = expected.get((r["day"], r["user_id"]))
+                if want is None:
+                    extra += 1
+                else:
+                    different += want != r["role"]
+                    seen.add((r["day"], r["user_id"]))
+        missing = len(expected.keys() - seen)
+        src_sum = checksum((d, u, r) for (d, u), r in expected.items())
+        dst_sum = f"{dest_sum % (1 << 64):016x}"
+        results.append({
+            "carpool": name, "carpool_id": cid,
+            "source_rows": len(expected), "dest_rows": dest_rows,
+            "source_sum": src_sum, "dest_sum": dst_sum,
+            "missing": missing, "different": different, "extra": extra,
+            "ok": src_sum == dst_sum and len(expected) == dest_rows,
+        })
+    return results
@@ -8,12 +8,29 @@ Examples:
   python manage.py set-user --username admin --password "ChangeMeNow!" --admin 1
   python manage.py migrate
   python manage.py seed-members
+  python manage.py rebuild-ride-stats
+  python manage.py bench-api --username alice
+  python manage.py export --kind history --carpool 1 --start 2025-01-01 --out h.csv.gz
+  python manage.py import-entries --file schedule.csv --carpool 1 --dry-run
+  python manage.py provision --file people.csv --dry-run
+  python manage.py migrate-legacy --config legacy.json
+  python manage.py consolidate --config legacy.json --workers 4
+  python manage.py purge
+  python manage.py prune-events --before 2024-01
+  python manage.py compact-entries --out entries.compact.db
+  python manage.py bench-layout --rows 500000 --carpools 20
+  python manage.py archive --through 2023
+  python manage.py archive --restore --carpool 1
+  python manage.py shard --carpool 1
+  python manage.py unshard
+  python manage.py bench-shards --carpools 8 --seconds 5
   python manage.py backup --out data.backup.db
   python manage.py wal-checkpoint
   python manage.py vacuum
 """
 import os
 import sys
+import sqlite3
 import argparse
 from hashlib import sha256
 
@@ -24,7 +41,7 @@ if BASE_DIR not in sys.path:
 
 # Import your app + db utilities
 from app_v3 import create_app
-from db import get_db, close_db
+from db import get_db, close_db, all_dbs, shards_dir, shard_paths
 
 def with_app_context(fn):
     """Decorator to run a function inside Flask app context and return its result."""
@@ -40,12 +57,15 @@ def cmd_stats(args):
     dblist = db.execute("PRAGMA database_list").fetchall()
     main_path = [r["file"] if "file" in r.keys() else r[2] for r in dblist if (r["name"] if "name" in r.keys() else r[1]) == "main"][0]
     tables = [r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY 1").fetchall()]
-    entries = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] if "entries" in tables else 0
+    dbs = all_dbs()
+    entries = sum(d.execute("SELECT COUNT(*) FROM entries").fetchone()[0] for d in dbs) if "entries" in tables else 0
     users = db.execute("SELECT COUNT(*) FROM users").fetchone()[0] if "users" in tables else 0
     members = db.execute("SELECT COUNT(*) FROM members").fetchone()[0] if "members" in tables else 0
     print("DB path:", main_path)
     print("Tables:", ", ".join(tables) or "(none)")
     print("Counts: entries=%s users=%s members=%s" % (entries, users, members))
+    if len(dbs) > 1:
+        print("Sharded carpools: %d (in %s)" % (len(dbs) - 1, shards_dir(db)))
 
 @with_app_context
 def cmd_users(args):
@@ -78,6 +98,8 @@ def cmd_set_user(args):
         (args.username, pw_hash, is_admin),
     )
     db.commit()
+    from auth import invalidate_user
+    invalidate_user(db)
     print(f"user '{args.username}' saved (admin={bool(is_admin)})")
     return 0
 
@@ -110,31 +132,378 @@ def cmd_seed_members(args):
     print(f"seeded {len(MEMBERS)} members")
     return 0
 
+@with_app_context
+def cmd_rebuild_ride_stats(args):
+    """Recompute user_ride_stats from entries (e.g. after a legacy migration)."""
+    from db import transaction
+    from ride_stats import rebuild_ride_stats
+    n = 0
+    # A sharded carpool's stats are in its own file
+    for db in [get_db(args.carpool)] if args.carpool else all_dbs():
+        with transaction(db):
+            n += rebuild_ride_stats(db, args.carpool)
+    print(f"user_ride_stats rebuilt ({n} rows)")
+    return 0
+
+def cmd_bench_api(args):
+    """Compare payload size and latency of the HTML pages with the JSON API."""
+    import time
+    app = create_app()
+    with app.app_context():
+        row = get_db().execute(
+            "SELECT id, username, is_admin FROM users WHERE username=?", (args.username,)
+        ).fetchone()
+    if not row:
+        print(f"user '{args.username}' not found")
+        return 2
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        # Same keys authbp.login sets
+        sess["_user_id"] = str(row["id"])
+        sess["_fresh"] = True
+        sess["user_id"] = int(row["id"])
+        sess["username"] = row["username"]
+        sess["is_admin"] = int(row["is_admin"] or 0)
+    client.get("/today")  # picks the first carpool into the session
+
+    pairs = [
+        ("/today", "/api/v1/today"),
+        ("/history", "/api/v1/history"),
+        ("/today", "/api/v1/credits"),
+    ]
+    print(f"{'url':<24} {'status':>6} {'bytes':>9} {'ms/req':>8}")
+    for html_url, api_url in pairs:
+        for url in (html_url, api_url):
+            t0 = time.perf_counter()
+            for _ in range(args.n):
+                resp = client.get(url)
+            ms = (time.perf_counter() - t0) * 1000 / args.n
+            print(f"{url:<24} {resp.status_code:>6} {len(resp.data):>9} {ms:>8.2f}")
+            if url == api_url and resp.headers.get("ETag"):
+                t0 = time.perf_counter()
+                for _ in range(args.n):
+                    r304 = client.get(url, headers={"If-None-Match": resp.headers["ETag"]})
+                ms = (time.perf_counter() - t0) * 1000 / args.n
+                print(f"{url + ' (etag)':<24} {r304.status_code:>6} {len(r304.data):>9} {ms:>8.2f}")
+    return 0
+
+@with_app_context
+def cmd_export(args):
+    """Stream history/audit rows to a file (or stdout) as CSV/NDJSON, optionally gzipped."""
+    from entry_export import parse_range, export_stream
+    try:
+        start, end = parse_range(args.start, args.end)
+    except ValueError as e:
+        print("bad --start/--end:", e)
+        return 2
+    gz = args.gzip or (args.out or "").endswith(".gz")
+    chunks = export_stream(get_db(), args.kind, args.format, carpool_id=args.carpool,
+                           start=start, end=end, gzip=gz)
+    out = open(args.out, "wb") if args.out and args.out != "-" else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    if args.out and args.out != "-":
+        print("export written to:", os.path.abspath(args.out), file=sys.stderr)
+    return 0
+
+@with_app_context
+def cmd_import_entries(args):
+    """Stream a day/member/role CSV into entries (chunked upserts)."""
+    import gzip
+    import time
+    from entry_import import import_entries
+    t0 = time.perf_counter()
+
+    def progress(rep):
+        print(f"  {rep['rows']} rows read, {rep['written']} written, {rep['error_count']} errors "
+              f"({time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+
+    opener = gzip.open if args.file.endswith(".gz") else open
+    with opener(args.file, "rt", newline="", encoding="utf-8-sig") as f:
+        try:
+            rep = import_entries(get_db(), f, carpool_id=args.carpool, username=args.user,
+                                 dry_run=args.dry_run, chunk_size=args.chunk, progress=progress)
+        except ValueError as e:
+            print("import failed:", e)
+            return 2
+    for msg in rep["errors"]:
+        print("  " + msg)
+    if rep["error_count"] > len(rep["errors"]):
+        print(f"  ... and {rep['error_count'] - len(rep['errors'])} more errors")
+    per_pool = ", ".join(f"carpool {c}: {n}" for c, n in sorted(rep["carpools"].items())) or "none"
+    print(f"{'dry run: ' if args.dry_run else ''}{rep['rows']} rows, {rep['valid']} valid ({per_pool}), "
+          f"{rep['written']} written, {rep['error_count']} errors in {time.perf_counter() - t0:.1f}s")
+    return 1 if rep["error_count"] else 0
+
+@with_app_context
+def cmd_provision(args):
+    """Create users, prefs and memberships from a CSV in one transaction."""
+    from provisioning import provision
+    with open(args.file, newline="", encoding="utf-8-sig") as f:
+        try:
+            rep = provision(get_db(), f, dry_run=args.dry_run)
+        except ValueError as e:
+            print("provisioning failed:", e)
+            return 2
+    for msg in rep["errors"]:
+        print("  " + msg)
+    if rep["error_count"] > len(rep["errors"]):
+        print(f"  ... and {rep['error_count'] - len(rep['errors'])} more errors")
+    if rep["created"]:
+        print("new users:", ", ".join(rep["created"]))
+    print(f"{'dry run: ' if args.dry_run else ''}{rep['rows']} rows; "
+          f"users {rep['users_created']} created / {rep['users_existing']} existing; "
+          f"memberships {rep['memberships_created']} created / {rep['memberships_existing']} existing; "
+          f"{rep['error_count']} errors")
+    return 1 if rep["error_count"] else 0
+
+def _sharded_targets(db, specs) -> list:
+    """Names of config carpools that are sharded; the legacy tools write to the catalog only."""
+    names = [s["carpool"] for s in specs]
+    marks = ",".join("?" * len(names))
+    return [r[0] for r in db.execute(f"""
+        SELECT c.name FROM carpools c JOIN carpool_shards s ON s.carpool_id = c.id
+        WHERE c.name IN ({marks})
+    """, names).fetchall()] if names else []
+
+@with_app_context
+def cmd_migrate_legacy(args):
+    """Copy legacy DBs listed in a mapping config into entries, then verify."""
+    import legacy_migrate as lm
+    db = get_db()
+    try:
+        specs = lm.load_config(args.config)
+    except (OSError, ValueError) as e:
+        print("bad config:", e)
+        return 2
+    if _sharded_targets(db, specs):
+        print("unshard these carpools first:", ", ".join(_sharded_targets(db, specs)))
+        return 2
+    if args.restart:
+        lm.reset_progress(db, specs)
+    if not args.verify_only:
+        for spec in specs:
+            try:
+                res = lm.migrate_source(db, spec, chunk=args.chunk)
+            except (OSError, ValueError) as e:
+                print(f"{spec['db']}: {e}")
+                return 1
+            print(f"{spec['db']} -> {spec['carpool']}: {res['copied']} copied, {res['skipped']} skipped")
+
+    ok = True
+    print(f"{'carpool':<20} {'source':>8} {'dest':>8} {'missing':>8} {'diff':>6} {'extra':>6}  checksums")
+    for r in lm.verify(db, specs, chunk=args.chunk):
+        ok = ok and r["ok"]
+        print(f"{r['carpool']:<20} {r['source_rows']:>8} {r['dest_rows']:>8} {r['missing']:>8} "
+              f"{r['different']:>6} {r['extra']:>6}  {r['source_sum']} {'==' if r['ok'] else '!='} {r['dest_sum']}")
+    print("verified: OK" if ok else "verified: MISMATCH (edits made in the app since the migration show up here too)")
+    return 0 if ok else 1
+
+@with_app_context
+def cmd_consolidate(args):
+    """Read many legacy DBs in parallel and merge them through one writer, then verify."""
+    import legacy_migrate as lm
+    from legacy_consolidate import consolidate
+    db = get_db()
+    try:
+        specs = lm.load_config(args.config)
+        if _sharded_targets(db, specs):
+            print("unshard these carpools first:", ", ".join(_sharded_targets(db, specs)))
+            return 2
+        stats = consolidate(db, specs, workers=args.workers, chunk=args.chunk)
+    except (OSError, ValueError) as e:
+        print("consolidation failed:", e)
+        return 1
+    for name, n in sorted(stats["carpools"].items()):
+        print(f"  {name}: {n} rows")
+    print(f"{stats['staged']} rows staged, {stats['skipped']} skipped, "
+          f"{stats['conflicts']} duplicate (carpool, day, user) keys, "
+          f"{stats['overwrites']} existing rows changed role")
+    for c in stats["conflict_samples"]:
+        print(f"  conflict: {c['carpool']} {c['day']} user {c['user_id']}: {c['n']} rows, roles {c['roles']}")
+    if stats["conflicts"] > len(stats["conflict_samples"]):
+        print(f"  ... and {stats['conflicts'] - len(stats['conflict_samples'])} more")
+
+    ok = all(r["ok"] for r in lm.verify(db, specs, chunk=args.chunk))
+    print("verified: OK" if ok else "verified: MISMATCH (run migrate-legacy --verify-only for details)")
+    return 0 if ok else 1
+
+@with_app_context
+def cmd_purge(args):
+    """Finish purging deleted carpools/users (same batches as the background thread)."""
+    from purge import run_pending, retry_failed
+    db = get_db()
+    if args.retry:
+        retry_failed(db)
+
+    def report(job):
+        status = f"failed: {job['error']}" if job["error"] else f"{job['done']}/{job['total']}"
+        print(f"  #{job['id']} {job['kind']} {job['label']}: {status}")
+
+    n = run_pending(db, batch=args.batch, pause=args.pause, report=report)
+    print(f"{n} purge job(s) finished")
+    return 0
+
+@with_app_context
+def cmd_prune_events(args):
+    """Drop change-journal events older than a month, oldest first."""
+    import re
+    from entry_events import prune_events
+    if not re.fullmatch(r"\d{4}-\d{2}", args.before or ""):
+        print("--before must be YYYY-MM")
+        return 2
+    n = 0
+    for db in all_dbs():
+        n += prune_events(db, args.before, batch=args.batch,
+                          report=lambda done: print(f"  {done} events deleted", file=sys.stderr))
+    print(f"{n} events before {args.before} deleted")
+    return 0
+
+@with_app_context
+def cmd_compact_entries(args):
+    """Copy entries into the compact WITHOUT ROWID layout in a separate file, then verify."""
+    from compact_layout import copy_entries, verify_copy
+    db = get_db()
+    out = os.path.abspath(args.out)
+    if len(all_dbs()) > 1:
+        print("note: sharded carpools are not copied (run unshard first to include them)", file=sys.stderr)
+    if not args.verify_only:
+        stats = copy_entries(db, out, report=lambda msg: print(f"  {msg}", file=sys.stderr))
+        print(f"{stats['copied']} rows of {stats['carpools']} carpool(s) copied to {out}; "
+              f"{stats['skipped']} skipped (no carpool/user or bad day)")
+        before = db.execute("PRAGMA page_count").fetchone()[0] * db.execute("PRAGMA page_size").fetchone()[0]
+        print(f"live DB: {before // 1024} KiB; compact file: {os.path.getsize(out) // 1024} KiB")
+    res = verify_copy(db, out)
+    print("verified: OK" if res["ok"] else f"verified: MISMATCH ({res['missing']} missing, {res['extra']} extra)")
+    return 0 if res["ok"] else 1
+
+@with_app_context
+def cmd_bench_layout(args):
+    """Size and scan speed of the current entries schema vs the compact layout, on generated data."""
+    from compact_layout import compare_layouts
+    print(f"{'':<34} {'entries':>12} {'entries_c':>12}")
+    compare_layouts(get_db(), rows=args.rows, carpools=args.carpools, members=args.members)
+    return 0
+
+@with_app_context
+def cmd_archive(args):
+    """Move closed years into per-carpool, per-year archive files (or list/restore them)."""
+    from datetime import date
+    import archive
+    db = get_db()
+    if args.restore:
+        if args.carpool is None:
+            print("--restore needs --carpool")
+            return 2
+        n = archive.restore_year(get_db(args.carpool), args.carpool)
+        print("nothing archived" if n is None else f"{n} rows moved back into entries")
+        return 0
+    if args.through is not None:
+        if args.through >= date.today().year:
+            print(f"--through must be a closed year (before {date.today().year})")
+            return 2
+        cids = [args.carpool] if args.carpool is not None else [
+            r[0] for r in db.execute("SELECT id FROM carpools WHERE deleted_at IS NULL ORDER BY id").fetchall()]
+        for cid in cids:
+            try:
+                archive.archive_through(get_db(cid), cid, args.through,
+                                        report=lambda c, y, n: print(f"  carpool {c} {y}: {n} rows", file=sys.stderr))
+            except ValueError as e:
+                print(f"carpool {cid}: {e}")
+                return 1
+    for conn in [get_db(args.carpool)] if args.carpool is not None else all_dbs():
+        for cid, year in archive.archives(conn, args.carpool):
+            rows = conn.execute("SELECT rows FROM entry_archives WHERE carpool_id=? AND year=?",
+                                (cid, year)).fetchone()[0]
+            print(f"carpool {cid} {year}: {rows} rows")
+    print("archive dir:", archive.archive_dir(db))
+    return 0
+
+@with_app_context
+def cmd_shard(args):
+    """Move carpools' entries, journal and stats into their own DB files (app stopped)."""
+    import sharding
+    db = get_db()
+    cids = [args.carpool] if args.carpool is not None else [r[0] for r in db.execute("""
+        SELECT id FROM carpools WHERE deleted_at IS NULL AND id NOT IN (SELECT carpool_id FROM carpool_shards)
+        ORDER BY id
+    """).fetchall()]
+    for cid in cids:
+        try:
+            moved = sharding.shard_carpool(db, cid)
+        except (ValueError, RuntimeError) as e:
+            print(f"carpool {cid}: {e}")
+            return 1
+        print(f"carpool {cid}: " + ", ".join(f"{t} {n}" for t, n in moved.items() if n))
+    print(f"{len(cids)} carpool(s) sharded into {shards_dir(db)}")
+    return 0
+
+@with_app_context
+def cmd_unshard(args):
+    """Move sharded carpools back into the main DB and delete their files (app stopped)."""
+    import sharding
+    db = get_db()
+    cids = [args.carpool] if args.carpool is not None else [
+        r[0] for r in db.execute("SELECT carpool_id FROM carpool_shards ORDER BY carpool_id").fetchall()]
+    for cid in cids:
+        try:
+            moved = sharding.unshard_carpool(db, cid)
+        except (ValueError, RuntimeError) as e:
+            print(f"carpool {cid}: {e}")
+            return 1
+        print(f"carpool {cid}: " + ", ".join(f"{t} {n}" for t, n in moved.items() if n))
+    print(f"{len(cids)} carpool(s) moved back")
+    return 0
+
+@with_app_context
+def cmd_bench_shards(args):
+    """Concurrent multi-carpool save throughput: one DB file vs one shard per carpool."""
+    from sharding import bench_writes
+    print(f"{'':<20} {'single':>12} {'sharded':>12}")
+    bench_writes(get_db(), carpools=args.carpools, members=args.members, seconds=args.seconds)
+    return 0
+
 @with_app_context
 def cmd_backup(args):
     """Make a SQLite online backup to the given output file."""
     out = os.path.abspath(args.out or "data.backup.db")
     db = get_db()
     # Use SQLite backup API
-    dest = __import__("sqlite3").connect(out)
+    dest = sqlite3.connect(out)
     with dest:
         db.backup(dest)
     dest.close()
     print("backup written to:", out)
+    # Sharded carpools: one file each, in <out>-shards/ (rename it to shards/ to restore)
+    shards = shard_paths(db)
+    if shards:
+        sdir = os.path.splitext(out)[0] + "-shards"
+        os.makedirs(sdir, exist_ok=True)
+        for cid, path in sorted(shards.items()):
+            dest = sqlite3.connect(os.path.join(sdir, os.path.basename(path)))
+            with dest:
+                get_db(cid).backup(dest)
+            dest.close()
+        print(f"{len(shards)} shard(s) written to:", sdir)
     return 0
 
 @with_app_context
 def cmd_wal_checkpoint(args):
-    db = get_db()
-    # checkpoint and truncate WAL so data.db contains the latest state
-    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-    db.commit()
+    # checkpoint and truncate WAL so data.db (and each shard) contains the latest state
+    for db in all_dbs():
+        db.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+        db.commit()
     print("WAL checkpointed (TRUNCATE)")
 
 @with_app_context
 def cmd_vacuum(args):
-    db = get_db()
-    db.execute("VACUUM")
+    for db in all_dbs():
+        db.execute("VACUUM main")
     print("VACUUM done")
 
 def main():
@@ -153,6 +522,93 @@ def main():
     sub.add_parser("migrate", help="Ensure schema + run lightweight migrations").set_defaults(func=cmd_migrate)
     sub.add_parser("seed-members", help="Seed members table if empty").set_defaults(func=cmd_seed_members)
 
+    rp = sub.add_parser("rebuild-ride-stats", help="Recompute per-user monthly ride counts from entries")
+    rp.add_argument("--carpool", type=int, default=None, help="Only this carpool id (default: all)")
+    rp.set_defaults(func=cmd_rebuild_ride_stats)
+
+    ap = sub.add_parser("bench-api", help="Compare size/latency of HTML pages vs the JSON API")
+    ap.add_argument("--username", required=True)
+    ap.add_argument("--n", type=int, default=20, help="Requests per URL")
+    ap.set_defaults(func=cmd_bench_api)
+
+    xp = sub.add_parser("export", help="Stream history/audit entries as CSV or NDJSON")
+    xp.add_argument("--kind", choices=["history", "audit"], default="history")
+    xp.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    xp.add_argument("--carpool", type=int, default=None, help="Only this carpool id (default: all)")
+    xp.add_argument("--start", default=None, help="YYYY-MM-DD, inclusive")
+    xp.add_argument("--end", default=None, help="YYYY-MM-DD, inclusive")
+    xp.add_argument("--gzip", action="store_true", help="Gzip the output (implied by a .gz --out)")
+    xp.add_argument("--out", default="-", help="Output file (default: stdout)")
+    xp.set_defaults(func=cmd_export)
+
+    ip = sub.add_parser("import-entries", help="Import a day/member/role CSV into entries")
+    ip.add_argument("--file", required=True, help="CSV (or .csv.gz) with day, member/user_id, role[, carpool/carpool_id]")
+    ip.add_argument("--carpool", type=int, default=None, help="Carpool id for rows without a carpool column")
+    ip.add_argument("--user", default="import", help="Recorded as update_user")
+    ip.add_argument("--chunk", type=int, default=5000, help="Rows per transaction")
+    ip.add_argument("--dry-run", action="store_true", help="Validate only, write nothing")
+    ip.set_defaults(func=cmd_import_entries)
+
+    vp = sub.add_parser("provision", help="Create users and memberships from a CSV (username, password, carpool, ...)")
+    vp.add_argument("--file", required=True, help="CSV with a username column")
+    vp.add_argument("--dry-run", action="store_true", help="Validate and count, then roll back")
+    vp.set_defaults(func=cmd_provision)
+
+    lp = sub.add_parser("migrate-legacy", help="Batched, resumable copy of legacy DBs per a JSON mapping config")
+    lp.add_argument("--config", required=True, help="JSON: {\"sources\": [{\"db\", \"carpool\", \"members\": {key: username}}]}")
+    lp.add_argument("--chunk", type=int, default=2000, help="Source rows per transaction")
+    lp.add_argument("--restart", action="store_true", help="Forget saved progress and copy from the start")
+    lp.add_argument("--verify-only", action="store_true", help="Only compare counts/checksums")
+    lp.set_defaults(func=cmd_migrate_legacy)
+
+    cp = sub.add_parser("consolidate", help="Merge many legacy DBs in parallel (process pool, one writer)")
+    cp.add_argument("--config", required=True, help="Same JSON mapping config as migrate-legacy")
+    cp.add_argument("--workers", type=int, default=None, help="Reader processes (default: one per source, up to CPU count)")
+    cp.add_argument("--chunk", type=int, default=2000, help="Source rows per read task")
+    cp.set_defaults(func=cmd_consolidate)
+
+    pp = sub.add_parser("purge", help="Purge entries of deleted carpools/users in small batches")
+    pp.add_argument("--batch", type=int, default=500, help="Entries deleted per transaction")
+    pp.add_argument("--pause", type=float, default=0.05, help="Seconds between batches")
+    pp.add_argument("--retry", action="store_true", help="Retry jobs that failed")
+    pp.set_defaults(func=cmd_purge)
+
+    ep = sub.add_parser("prune-events", help="Delete change-journal events before a month")
+    ep.add_argument("--before", required=True, help="YYYY-MM; events before the 1st of this month go")
+    ep.add_argument("--batch", type=int, default=5000, help="Events deleted per transaction")
+    ep.set_defaults(func=cmd_prune_events)
+
+    kp = sub.add_parser("compact-entries", help="Copy entries into the compact WITHOUT ROWID layout (separate file)")
+    kp.add_argument("--out", default="entries.compact.db")
+    kp.add_argument("--verify-only", action="store_true", help="Only compare the file against entries")
+    kp.set_defaults(func=cmd_compact_entries)
+
+    lb = sub.add_parser("bench-layout", help="Compare size/scan speed of entries vs the compact layout on generated data")
+    lb.add_argument("--rows", type=int, default=200000)
+    lb.add_argument("--carpools", type=int, default=10)
+    lb.add_argument("--members", type=int, default=6, help="Members per carpool")
+    lb.set_defaults(func=cmd_bench_layout)
+
+    av = sub.add_parser("archive", help="Move closed years of entries into per-year archive files; lists archives")
+    av.add_argument("--through", type=int, default=None, help="Archive every year up to and including this one")
+    av.add_argument("--carpool", type=int, default=None, help="Only this carpool id (default: all)")
+    av.add_argument("--restore", action="store_true", help="Move the carpool's newest archived year back")
+    av.set_defaults(func=cmd_archive)
+
+    sh = sub.add_parser("shard", help="Move carpools into per-carpool DB files (stop the app first)")
+    sh.add_argument("--carpool", type=int, default=None, help="Only this carpool id (default: all not yet sharded)")
+    sh.set_defaults(func=cmd_shard)
+
+    us = sub.add_parser("unshard", help="Move sharded carpools back into the main DB (stop the app first)")
+    us.add_argument("--carpool", type=int, default=None, help="Only this carpool id (default: all sharded)")
+    us.set_defaults(func=cmd_unshard)
+
+    bs = sub.add_parser("bench-shards", help="Compare concurrent save throughput of one DB file vs per-carpool shards")
+    bs.add_argument("--carpools", type=int, default=8, help="Carpools saving at once (one thread each)")
+    bs.add_argument("--members", type=int, default=6, help="Members per carpool")
+    bs.add_argument("--seconds", type=float, default=5.0, help="Duration of each run")
+    bs.set_defaults(func=cmd_bench_shards)
+
     bp = sub.add_parser("backup", help="Write a safe online backup of the DB")
     bp.add_argument("--out", default="data.backup.db")
     bp.set_defaults(func=cmd_backup)
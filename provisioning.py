@@ -0,0 +1,174 @@
+# provisioning.py
+"""
+Bulk creation of users, prefs and memberships from CSV (/admin/provision,
+`manage.py provision`), e.g. to set up a new carpool in one go.
+
+Columns (header names, case-insensitive):
+  username      required; matched case-insensitively against existing users
+  password      required for new users; existing users keep theirs
+  is_admin      1/yes for admins (new users only)
+  carpool       carpool name, or `carpool_id`; leave both empty for no membership
+  member_key    defaults to the first 4 letters of the username, upper-cased
+                (numbered if any carpool uses it)
+  display_name  defaults to the capitalized username
+  active        membership active, default 1
+
+Everything is written in one transaction; invalid rows are skipped and
+reported. Existing users and memberships are left as they are and counted
+as such, so a file can be re-run safely.
+"""
+import csv
+from hashlib import sha256
+
+from db import transaction
+from template_helpers import invalidate_carpool_options
+
+# Error messages kept in the report; the rest are only counted
+PROVISION_MAX_ERRORS = 50
+
+_TRUE = {"1", "y", "yes", "true", "x"}
+_FALSE = {"0", "n", "no", "false"}
+
+
+class RowError(ValueError):
+    """A row that can't be provisioned (reported, not raised to the caller)."""
+
+
+class _DryRun(Exception):
+    """Rolls back a dry run's transaction."""
+
+
+def _flag(s, default: int) -> int:
+    s = (s or "").strip().lower()
+    if not s:
+        return default
+    if s in _TRUE:
+        return 1
+    if s in _FALSE:
+        return 0
+    raise RowError(f"bad flag {s!r}")
+
+def _find_user(db, username: str):
+    # COLLATE NOCASE matches ix_users_username_nocase; LOWER() would scan
+    return db.execute(
+        "SELECT id, username FROM users WHERE username = ? COLLATE NOCASE AND deleted_at IS NULL",
+        (username,)
+    ).fetchone()
+
+def _user(db, row):
+    """(user_id, created) for the row's username, creating the user if needed."""
+    username = (row.get("username") or "").strip()
+    if not username:
+        raise RowError("no username")
+    u = _find_user(db, username)
+    if u is not None:
+        return u["id"], False
+    password = (row.get("password") or "").strip()
+    if not password:
+        raise RowError(f"new user {username!r} needs a password")
+    uid = db.execute(
+        "INSERT INTO users(username, password_hash, is_admin, active) VALUES (?,?,?,1)",
+        (username, sha256(password.encode()).hexdigest(), _flag(row.get("is_admin"), 0))
+    ).lastrowid
+    db.execute("INSERT OR IGNORE INTO user_prefs(user_id) VALUES (?)", (uid,))
+    return uid, True
+
+def _carpool(row, pools: dict):
+    raw_id = (row.get("carpool_id") or "").strip()
+    raw_name = (row.get("carpool") or "").strip()
+    if raw_id:
+        if not raw_id.isdigit() or int(raw_id) not in pools.values():
+            raise RowError(f"unknown carpool_id {raw_id!r}")
+        return int(raw_id)
+    if raw_name:
+        cid = pools.get(raw_name.casefold())
+        if cid is None:
+            raise RowError(f"unknown carpool {raw_name!r}")
+        return cid
+    return None
+
+def _membership(db, row, cid: int, uid: int, keys: set) -> bool:
+    """
+    Add the membership unless it exists; returns whether it was created.
+    `keys` holds (carpool_id, member_key) and (None, member_key) of every
+    membership and is kept up to date.
+    """
+    if db.execute(
+        "SELECT 1 FROM carpool_memberships WHERE carpool_id=? AND user_id=?", (cid, uid)
+    ).fetchone():
+        return False
+    username = row["username"].strip()
+    key = (row.get("member_key") or "").strip().upper()
+    if key:
+        if (cid, key) in keys:
+            raise RowError(f"member key {key!r} is taken in carpool {cid}")
+    else:
+        base = "".join(ch for ch in username if ch.isalnum())[:4].upper()
+        if not base:
+            raise RowError("no member_key")
+        # Unique across carpools: entries still carry the legacy UNIQUE(day, member_key)
+        key, n = base, 1
+        while (None, key) in keys:
+            n += 1
+            key = f"{base}{n}"
+    db.execute("""
+        INSERT INTO carpool_memberships(carpool_id, user_id, member_key, display_name, active)
+        VALUES (?,?,?,?,?)
+    """, (cid, uid, key, (row.get("display_name") or "").strip() or username.capitalize(),
+          _flag(row.get("active"), 1)))
+    keys.update(((cid, key), (None, key)))
+    return True
+
+
+def provision(db, lines, *, dry_run=False) -> dict:
+    """
+    Provision CSV `lines` (an iterable of text lines, e.g. an open file).
+    With dry_run everything is checked and counted, then rolled back.
+    Returns {"rows", "users_created", "users_existing", "memberships_created",
+    "memberships_existing", "created", "errors", "error_count"}.
+    """
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None:
+        raise ValueError("empty file")
+    reader.fieldnames = [(f or "").strip().lower() for f in reader.fieldnames]
+    if "username" not in reader.fieldnames:
+        raise ValueError("CSV needs a username column")
+
+    report = {"rows": 0, "users_created": 0, "users_existing": 0, "memberships_created": 0,
+              "memberships_existing": 0, "created": [], "errors": [], "error_count": 0}
+    pools = {r["name"].casefold(): r["id"] for r in db.execute("SELECT id, name FROM carpools WHERE deleted_at IS NULL")}
+    keys = set()
+    for r in db.execute("SELECT carpool_id, member_key FROM carpool_memberships"):
+        keys.update(((r[0], r[1]), (None, r[1])))
+    try:
+        with transaction(db):
+            for row in reader:
+                report["rows"] += 1
+                # A row that fails halfway (user added, membership not) is undone
+                db.execute("SAVEPOINT provision_row")
+                try:
+                    cid = _carpool(row, pools)
+                    uid, user_created = _user(db, row)
+                    mem_created = _membership(db, row, cid, uid, keys) if cid is not None else None
+                except RowError as e:
+                    db.execute("ROLLBACK TO provision_row")
+                    db.execute("RELEASE provision_row")
+                    report["error_count"] += 1
+                    if len(report["errors"]) < PROVISION_MAX_ERRORS:
+                        report["errors"].append(f"line {reader.line_num}: {e}")
+                    continue
+                db.execute("RELEASE provision_row")
+                if user_created:
+                    report["users_created"] += 1
+                    report["created"].append(row["username"].strip())
+                else:
+                    report["users_existing"] += 1
+                if mem_created is not None:
+                    report["memberships_created" if mem_created else "memberships_existing"] += 1
+            if dry_run:
+                raise _DryRun
+            if report["memberships_created"]:
+                invalidate_carpool_options(db)
+    except _DryRun:
+        pass
+    return report
@@ -0,0 +1,202 @@
+# purge.py
+"""
+Deleting carpools and users without holding the write lock for long.
+
+schedule_*_delete() runs in the admin's request and only does bounded work:
+it marks the row deleted (deleted_at, active=0, name/username suffixed so the
+name can be reused at once), removes the handful of membership/pref/pattern
+rows that make it visible anywhere, and queues a purge_jobs row.
+
+run_pending() then deletes the entries PURGE_BATCH rows per transaction,
+pausing between batches so requests can write in the gaps, and finally
+removes the carpool/user row itself. It runs on a background thread
+(kick()) right after a delete, and from `manage.py purge` (e.g. a scheduled
+task, or after a restart interrupted a purge). Batches are idempotent, so a
+job that was interrupted just continues. Sharded carpools (sharding.py) are
+purged in their own file, which goes at the end.
+"""
+import threading
+import time
+
+from db import get_db, all_dbs, transaction
+from entry_store import entries_changed, log_entry_events
+from auth import invalidate_user
+from template_helpers import invalidate_carpool_options
+from archive import drop_carpool, drop_user
+from sharding import drop_shard
+
+PURGE_BATCH = 500
+# Seconds between batches, so other writers get the lock in between
+PURGE_PAUSE = 0.05
+# A job queued this long without starting means the thread never ran (uWSGI
+# without threads); the Deletions page then points to `manage.py purge`
+STALL_MINUTES = 5
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def schedule_carpool_delete(db, cid: int):
+    """Hide a carpool now and queue the purge of its entries. Returns the job id (None if not found)."""
+    with transaction(db):
+        row = db.execute("SELECT name FROM carpools WHERE id=? AND deleted_at IS NULL", (cid,)).fetchone()
+        if row is None:
+            return None
+        db.execute("""
+            UPDATE carpools SET deleted_at=CURRENT_TIMESTAMP, active=0, name=name || ' (deleted #' || id || ')'
+            WHERE id=?
+        """, (cid,))
+        db.execute("DELETE FROM user_carpool_prefs WHERE carpool_id=?", (cid,))
+        db.execute("DELETE FROM carpool_memberships WHERE carpool_id=?", (cid,))
+        # The same transaction unless the carpool has its own shard
+        data = get_db(cid)
+        with transaction(data):
+            data.execute("DELETE FROM weekly_patterns WHERE carpool_id=?", (cid,))
+            total = data.execute("SELECT COUNT(*) FROM entries WHERE carpool_id=?", (cid,)).fetchone()[0]
+            # Open pages/ETags of the carpool notice it is gone
+            entries_changed(data, cid, None, ride_stats=False)
+        job = db.execute(
+            "INSERT INTO purge_jobs(kind, target_id, label, total) VALUES ('carpool', ?, ?, ?)",
+            (cid, row["name"], total)
+        ).lastrowid
+    invalidate_carpool_options(db)
+    return job
+
+def schedule_user_delete(db, uid: int):
+    """Hide a user now (no login, no memberships) and queue the purge of their entries."""
+    with transaction(db):
+        row = db.execute("SELECT username FROM users WHERE id=? AND deleted_at IS NULL", (uid,)).fetchone()
+        if row is None:
+            return None
+        db.execute("""
+            UPDATE users SET deleted_at=CURRENT_TIMESTAMP, active=0, username=username || ' (deleted #' || id || ')'
+            WHERE id=?
+        """, (uid,))
+        db.execute("DELETE FROM user_prefs WHERE user_id=?", (uid,))
+        db.execute("DELETE FROM user_carpool_prefs WHERE user_id=?", (uid,))
+        db.execute("DELETE FROM carpool_memberships WHERE user_id=?", (uid,))
+        total = 0
+        # The main DB joins this transaction; each shard commits its own
+        for data in all_dbs():
+            with transaction(data):
+                pattern_cids = [r["carpool_id"] for r in data.execute(
+                    "SELECT DISTINCT carpool_id FROM weekly_patterns WHERE user_id=?", (uid,)
+                ).fetchall()]
+                data.execute("DELETE FROM user_ride_stats WHERE user_id=?", (uid,))
+                data.execute("DELETE FROM weekly_patterns WHERE user_id=?", (uid,))
+                total += data.execute("SELECT COUNT(*) FROM entries WHERE user_id=?", (uid,)).fetchone()[0]
+                for cid in pattern_cids:
+                    entries_changed(data, cid, None, ride_stats=False)
+        job = db.execute(
+            "INSERT INTO purge_jobs(kind, target_id, label, total) VALUES ('user', ?, ?, ?)",
+            (uid, row["username"], total)
+        ).lastrowid
+    invalidate_user(db, uid)
+    invalidate_carpool_options(db, uid)
+    return job
+
+
+def _purge_batch(db, job, batch: int) -> int:
+    """Delete up to `batch` entries (then journal events) of the job's target; returns how many."""
+    # A carpool's rows are in one database; a user's can be in every shard
+    for data in [get_db(job["target_id"])] if job["kind"] == "carpool" else all_dbs():
+        n = _purge_batch_in(data, db, job, batch)
+        if n:
+            return n
+    return 0
+
+def _purge_batch_in(db, catalog, job, batch: int) -> int:
+    col = "carpool_id" if job["kind"] == "carpool" else "user_id"
+    rows = db.execute(
+        f"SELECT id, carpool_id, day, user_id, role FROM entries WHERE {col}=? LIMIT ?", (job["target_id"], batch)
+    ).fetchall()
+    if not rows:
+        if job["kind"] == "carpool":
+            # Then its change journal, in batches as well
+            return db.execute(
+                "DELETE FROM entry_events WHERE id IN (SELECT id FROM entry_events WHERE carpool_id=? LIMIT ?)",
+                (job["target_id"], batch)
+            ).rowcount
+        return 0
+    # Catalog lock first, then the shard's: the order the schedule_* functions take them in
+    with transaction(catalog), transaction(db):
+        db.executemany("DELETE FROM entries WHERE id=?", [(r["id"],) for r in rows])
+        if job["kind"] == "user":
+            # Their driver days count towards other members' rides
+            by_carpool = {}
+            for r in rows:
+                if r["carpool_id"] is not None:
+                    by_carpool.setdefault(r["carpool_id"], []).append((r["day"], r["user_id"], r["role"], None))
+            for cid, changes in by_carpool.items():
+                log_entry_events(db, cid, changes, "purge")
+                entries_changed(db, cid, sorted({c[0] for c in changes}))
+        catalog.execute("UPDATE purge_jobs SET done = done + ? WHERE id=?", (len(rows), job["id"]))
+    return len(rows)
+
+def _finish(db, job):
+    tid = job["target_id"]
+    # Archived years are small files, cleared in one go before the row goes
+    if job["kind"] == "carpool":
+        data = get_db(tid)
+        drop_carpool(data, tid)
+        with transaction(data):
+            data.execute("DELETE FROM user_ride_stats WHERE carpool_id=?", (tid,))
+            data.execute("DELETE FROM entry_changes WHERE carpool_id=?", (tid,))
+        drop_shard(db, tid)
+    else:
+        for data in all_dbs():
+            drop_user(data, tid)
+    with transaction(db):
+        if job["kind"] == "carpool":
+            db.execute("DELETE FROM legacy_migrations WHERE carpool_id=?", (tid,))
+            db.execute("DELETE FROM carpools WHERE id=? AND deleted_at IS NOT NULL", (tid,))
+        else:
+            db.execute("DELETE FROM users WHERE id=? AND deleted_at IS NOT NULL", (tid,))
+        db.execute("UPDATE purge_jobs SET finished_ts=CURRENT_TIMESTAMP, error=NULL WHERE id=?", (job["id"],))
+
+def run_pending(db, *, batch: int = PURGE_BATCH, pause: float = PURGE_PAUSE, report=None) -> int:
+    """Work through every unfinished job. Returns the number of jobs finished."""
+    finished = 0
+    while True:
+        job = db.execute(
+            "SELECT * FROM purge_jobs WHERE finished_ts IS NULL AND error IS NULL ORDER BY id LIMIT 1"
+        ).fetchone()
+        if job is None:
+            return finished
+        db.execute("UPDATE purge_jobs SET started_ts=COALESCE(started_ts, CURRENT_TIMESTAMP) WHERE id=?", (job["id"],))
+        try:
+            while _purge_batch(db, job, batch):
+                if report:
+                    report(db.execute("SELECT * FROM purge_jobs WHERE id=?", (job["id"],)).fetchone())
+                time.sleep(pause)
+            _finish(db, job)
+        except Exception as e:
+            # Leave it for a retry (admin page or `manage.py purge --retry`)
+            db.execute("UPDATE purge_jobs SET error=? WHERE id=?", (str(e)[:500], job["id"]))
+            if report:
+                report(db.execute("SELECT * FROM purge_jobs WHERE id=?", (job["id"],)).fetchone())
+            continue
+        finished += 1
+
+def retry_failed(db):
+    db.execute("UPDATE purge_jobs SET error=NULL WHERE finished_ts IS NULL AND error IS NOT NULL")
+
+def kick(app):
+    """Run pending purges on a background thread (one per process)."""
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        def _run():
+            with app.app_context():
+                run_pending(get_db())
+        _worker = threading.Thread(target=_run, name="purge", daemon=True)
+        _worker.start()
+
+def list_jobs(db, limit: int = 50):
+    """Newest jobs first; `stalled` is 1 for a job still not started STALL_MINUTES after it was queued."""
+    return db.execute("""
+        SELECT *, (started_ts IS NULL AND finished_ts IS NULL AND error IS NULL
+                   AND created_ts < datetime('now', ?)) AS stalled
+        FROM purge_jobs ORDER BY id DESC LIMIT ?
+    """, (f"-{STALL_MINUTES} minutes", limit)).fetchall()
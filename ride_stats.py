@@ -0,0 +1,298 @@
+# ride_stats.py
+"""
+Materialized ride counts per (user, carpool, month).
+
+A "ride" is a day the user was marked Rider (R) in a carpool on which someone
+in that carpool was marked Driver (D). The /account summary multiplies these
+counts by the per-carpool miles/MPG preferences, so only counts are stored;
+changing a preference never requires a rebuild.
+
+Rows are refreshed for the affected carpool-months whenever entries change
+(refresh_ride_stats) and can be rebuilt from scratch with
+`python manage.py rebuild-ride-stats`. Months of archived years (archive.py)
+are no longer in `entries`, so a rebuild keeps their rows.
+
+Savings are priced against gas_price_history (effective-from dated prices per
+user, optionally per carpool) with a single sorted sweep; see monthly_savings.
+"""
+from datetime import date, timedelta
+
+from db import get_db, carpool_dbs
+
+_RIDES_SELECT = """
+    SELECT e.user_id, e.carpool_id, substr(e.day, 1, 7) AS month, COUNT(*) AS rides
+    FROM entries e
+    WHERE e.role = 'R' AND e.user_id IS NOT NULL AND e.carpool_id IS NOT NULL
+      AND EXISTS (
+        SELECT 1 FROM entries d
+        WHERE d.carpool_id = e.carpool_id AND d.day = e.day AND d.role = 'D'
+      )
+"""
+
+def _month_bounds(month: str):
+    """'YYYY-MM' -> ('YYYY-MM-01', first day of next month as ISO)."""
+    y, m = int(month[:4]), int(month[5:7])
+    nxt = date(y + (m == 12), m % 12 + 1, 1)
+    return f"{month}-01", nxt.isoformat()
+
+def _months_for(days) -> set:
+    out = set()
+    for d in days:
+        s = d.isoformat() if isinstance(d, date) else str(d or "")
+        if len(s) >= 7:
+            out.add(s[:7])
+    return out
+
+def refresh_ride_stats(db, carpool_id, days):
+    """
+    Recompute the stats rows of one carpool for the months containing `days`.
+    Cheap enough to run inline with every save: each month is one carpool's
+    few dozen rows.
+    """
+    if carpool_id is None:
+        return
+    for month in sorted(_months_for(days)):
+        lo, hi = _month_bounds(month)
+        db.execute(
+            "DELETE FROM user_ride_stats WHERE carpool_id=? AND month=?",
+            (carpool_id, month)
+        )
+        db.execute(
+            "INSERT INTO user_ride_stats(user_id, carpool_id, month, rides)"
+            + _RIDES_SELECT
+            + " AND e.carpool_id = ? AND e.day >= ? AND e.day < ? GROUP BY 1, 2, 3",
+            (carpool_id, lo, hi)
+        )
+
+_NOT_ARCHIVED = """
+    NOT EXISTS (
+      SELECT 1 FROM entry_archives a
+      WHERE a.carpool_id = user_ride_stats.carpool_id AND a.year = CAST(substr(user_ride_stats.month, 1, 4) AS INTEGER)
+    )
+"""
+
+def _kept(db) -> str:
+    # The v7 backfill runs before entry_archives exists (and nothing is archived then)
+    has = db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='entry_archives'").fetchone()
+    return _NOT_ARCHIVED if has else " 1"
+
+def rebuild_ride_stats(db, carpool_id=None) -> int:
+    """Rebuild stats from `entries` (all carpools, or one). Returns row count."""
+    if carpool_id is None:
+        db.execute("DELETE FROM user_ride_stats WHERE" + _kept(db))
+        db.execute("INSERT INTO user_ride_stats(user_id, carpool_id, month, rides)" + _RIDES_SELECT + " GROUP BY 1, 2, 3")
+        return db.execute("SELECT COUNT(*) FROM user_ride_stats").fetchone()[0]
+    db.execute("DELETE FROM user_ride_stats WHERE carpool_id=? AND" + _kept(db), (carpool_id,))
+    db.execute(
+        "INSERT INTO user_ride_stats(user_id, carpool_id, month, rides)"
+        + _RIDES_SELECT + " AND e.carpool_id = ? GROUP BY 1, 2, 3",
+        (carpool_id,)
+    )
+    return db.execute("SELECT COUNT(*) FROM user_ride_stats WHERE carpool_id=?", (carpool_id,)).fetchone()[0]
+
+# --- Gas price history & savings ------------------------------------------------
+class _PriceCursor:
+    """
+    Walks one user's gas price history for one carpool in date order.
+    A carpool-specific price wins over the user's global price once it is in
+    effect; before any history row the fallback (user_prefs.gas_price) applies.
+    seek() must be called with non-decreasing days, so a whole report is a
+    single linear pass over rides and prices.
+    """
+    def __init__(self, global_prices, carpool_prices, fallback):
+        self.lists = (carpool_prices, global_prices)
+        self.pos = [-1, -1]
+        self.fallback = fallback
+
+    def seek(self, day: str) -> float:
+        for i, lst in enumerate(self.lists):
+            while self.pos[i] + 1 < len(lst) and lst[self.pos[i] + 1][0] <= day:
+                self.pos[i] += 1
+        for i, lst in enumerate(self.lists):
+            if self.pos[i] >= 0:
+                return lst[self.pos[i]][1]
+        return self.fallback
+
+    def next_change(self):
+        """First effective_from after the current position, or None."""
+        nxt = [lst[self.pos[i] + 1][0] for i, lst in enumerate(self.lists) if self.pos[i] + 1 < len(lst)]
+        return min(nxt) if nxt else None
+
+def _sweep_days(days, cursor):
+    """[(month, rides, sum of prices)] for ascending ride days."""
+    out = []
+    for d in days:
+        d = str(d)[:10]
+        price = cursor.seek(d)
+        if out and out[-1][0] == d[:7]:
+            month, n, psum = out[-1]
+            out[-1] = (month, n + 1, psum + price)
+        else:
+            out.append((d[:7], 1, price))
+    return out
+
+def gas_price_history(db, user_id):
+    return db.execute("""
+        SELECT id, carpool_id, effective_from, price
+        FROM gas_price_history
+        WHERE user_id = ?
+        ORDER BY effective_from, id
+    """, (user_id,)).fetchall()
+
+def record_gas_price(db, user_id, price, *, effective_from=None, carpool_id=None, previous=None):
+    """
+    Set the gas price in force from `effective_from` (default today), for all
+    of the user's carpools or just one. When a user changes their global
+    price for the first time, `previous` is pinned as the price since the
+    beginning so older rides aren't re-priced.
+    """
+    effective_from = effective_from or date.today().isoformat()
+    if carpool_id is None and previous is not None:
+        db.execute("""
+            INSERT INTO gas_price_history(user_id, carpool_id, effective_from, price)
+            SELECT ?, NULL, '0001-01-01', ?
+            WHERE NOT EXISTS (
+              SELECT 1 FROM gas_price_history WHERE user_id = ? AND carpool_id IS NULL
+            )
+        """, (user_id, previous, user_id))
+    db.execute(
+        "DELETE FROM gas_price_history WHERE user_id = ? AND carpool_id IS ? AND effective_from = ?",
+        (user_id, carpool_id, effective_from)
+    )
+    db.execute(
+        "INSERT INTO gas_price_history(user_id, carpool_id, effective_from, price) VALUES (?, ?, ?, ?)",
+        (user_id, carpool_id, effective_from, price)
+    )
+
+# --- Legacy day strings -----------------------------------------------------------
+# Old single-carpool rows may store days as "Aug 24 2025 01:23:45 PM", which
+# compare wrongly against ISO days as text
+_ISO_DAY = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*"
+
+def _has_old_days(db) -> bool:
+    """Any day not starting with a digit; two range seeks on the (day, member_key) index."""
+    return db.execute("SELECT 1 FROM entries WHERE day < '0' OR day >= ':' LIMIT 1").fetchone() is not None
+
+def _scan_legacy_ride_days(db, key, today: date) -> list:
+    """Legacy-mode ride days (ISO, ascending) by parsing every row, for DBs with old day strings."""
+    from legacy_migrate import normalize_day
+    by_day = {}
+    for r in db.execute("SELECT day, member_key, role FROM entries ORDER BY id").fetchall():
+        # Unparseable days counted as today, as the old scan did
+        by_day.setdefault(normalize_day(r["day"]) or today.isoformat(), {})[r["member_key"]] = r["role"]
+    return [d for d, roles in sorted(by_day.items())
+            if d <= today.isoformat() and roles.get(key) == "R" and "D" in roles.values()]
+
+def _archived_ride_days(db, carpool_id, user_id, lo: str, hi: str) -> list:
+    """
+    A member's ride days in [lo, hi) read from the archive file (archive.py);
+    None if that month isn't archived.
+    """
+    from archive import is_archived, archived_rows
+    if not is_archived(db, carpool_id, date.fromisoformat(lo)):
+        return None
+    rows = archived_rows(db, carpool_id, date.fromisoformat(lo), date.fromisoformat(hi))
+    drove = {r["day"] for r in rows if r["role"] == "D"}
+    return [r["day"] for r in rows if r["who"] == user_id and r["role"] == "R" and r["day"] in drove]
+
+def monthly_savings(db, user_id, carpools, avg_mpg, fallback_price, legacy_key=None):
+    """
+    Month-by-month rides, miles and estimated gas savings for days <= today,
+    newest first. Each ride is priced with the gas price in force on its day.
+
+    carpools: [{id, mpr, mpg}] for the user's active memberships, or one
+    {id: None, mpr, mpg: None} row together with `legacy_key` in legacy mode.
+
+    Closed months come from user_ride_stats; only months that contain a price
+    change (and the current month) are expanded to individual ride days.
+    """
+    today = date.today()
+    month_start = today.replace(day=1).isoformat()
+    tomorrow = (today + timedelta(days=1)).isoformat()
+
+    global_prices, carpool_prices = [], {}
+    for r in gas_price_history(db, user_id):
+        row = (r["effective_from"], float(r["price"]))
+        if r["carpool_id"] is None:
+            global_prices.append(row)
+        else:
+            carpool_prices.setdefault(r["carpool_id"], []).append(row)
+
+    months = {}
+    def add(month, rides, price_sum, c):
+        mpg = c["mpg"] if c["mpg"] is not None else avg_mpg
+        m = months.setdefault(month, {"month": month, "rides": 0, "miles": 0.0, "gallons": 0.0, "savings": 0.0})
+        m["rides"] += rides
+        m["miles"] += rides * c["mpr"]
+        if mpg:
+            m["gallons"] += rides * c["mpr"] / mpg
+            m["savings"] += price_sum * c["mpr"] / mpg
+
+    if legacy_key is not None:
+        if _has_old_days(db):
+            days = _scan_legacy_ride_days(db, legacy_key, today)
+        else:
+            days = [r["day"] for r in db.execute(f"""
+                SELECT e.day
+                FROM entries e
+                WHERE e.member_key = ? AND e.role = 'R' AND e.day < ? AND e.day GLOB '{_ISO_DAY}'
+                  AND EXISTS (SELECT 1 FROM entries d WHERE d.day = e.day AND d.role = 'D')
+                ORDER BY e.day
+            """, (legacy_key, tomorrow)).fetchall()]
+        cursor = _PriceCursor(global_prices, [], fallback_price)
+        for month, n, psum in _sweep_days(days, cursor):
+            add(month, n, psum, carpools[0])
+        return [months[k] for k in sorted(months, reverse=True)]
+
+    closed, live = {}, {}
+    # Sharded carpools keep their stats and entries in their own file
+    for conn, _group in carpool_dbs([c["id"] for c in carpools]):
+        for r in conn.execute("""
+            SELECT carpool_id, month, rides
+            FROM user_ride_stats
+            WHERE user_id = ? AND month < ?
+            ORDER BY carpool_id, month
+        """, (user_id, month_start[:7])).fetchall():
+            closed.setdefault(r["carpool_id"], []).append((r["month"], r["rides"]))
+
+        for r in conn.execute("""
+            SELECT e.carpool_id, e.day
+            FROM entries e
+            WHERE e.user_id = ? AND e.role = 'R' AND e.day >= ? AND e.day < ?
+              AND EXISTS (
+                SELECT 1 FROM entries d
+                WHERE d.carpool_id = e.carpool_id AND d.day = e.day AND d.role = 'D'
+              )
+            ORDER BY e.carpool_id, e.day
+        """, (user_id, month_start, tomorrow)).fetchall():
+            live.setdefault(r["carpool_id"], []).append(r["day"])
+
+    for c in carpools:
+        cursor = _PriceCursor(global_prices, carpool_prices.get(c["id"], []), fallback_price)
+        for month, rides in closed.get(c["id"], []):
+            lo, hi = _month_bounds(month)
+            price = cursor.seek(lo)
+            nxt = cursor.next_change()
+            if nxt is None or nxt >= hi:
+                add(month, rides, rides * price, c)
+                continue
+            # Price changed mid-month: price this month's rides day by day
+            data = get_db(c["id"])
+            days = _archived_ride_days(data, c["id"], user_id, lo, hi)
+            if days is None:
+                days = [r["day"] for r in data.execute("""
+                    SELECT e.day
+                    FROM entries e
+                    WHERE e.user_id = ? AND e.carpool_id = ? AND e.role = 'R' AND e.day >= ? AND e.day < ?
+                      AND EXISTS (
+                        SELECT 1 FROM entries d
+                        WHERE d.carpool_id = e.carpool_id AND d.day = e.day AND d.role = 'D'
+                      )
+                    ORDER BY e.day
+                """, (user_id, c["id"], lo, hi)).fetchall()]
+            for m, n, psum in _sweep_days(days, cursor):
+                add(m, n, psum, c)
+        for m, n, psum in _sweep_days(live.get(c["id"], []), cursor):
+            add(m, n, psum, c)
+
+    return [months[k] for k in sorted(months, reverse=True)]
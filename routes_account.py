@@ -2,28 +2,15 @@
 from flask import Blueprint, render_template_string, session, request, redirect, url_for, flash
 from datetime import date, datetime
 from hashlib import sha256
-from collections import defaultdict
 
-from db import get_db
+from db import get_db, transaction
 from auth import login_required
 from templates import BASE_TMPL
 from template_helpers import get_navbar_context
+from ride_stats import monthly_savings, gas_price_history, record_gas_price
 
 accountbp = Blueprint("accountbp", __name__)
 
-def _day_to_date(val):
-    if isinstance(val, date): return val
-    s = str(val or "")
-    try:
-        return datetime.strptime(s[:10], "%Y-%m-%d").date()
-    except Exception:
-        pass
-    try:
-        return datetime.strptime(s.replace(",", ""), "%b %d %Y %I:%M:%S %p").date()
-    except Exception:
-        pass
-    return date.today()
-
 def _has_table(db, name: str) -> bool:
     return db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
 
@@ -115,57 +102,13 @@ def _save_mprs(db, user_id, mpr_map, mpg_map):
         """, (user_id, cid, mpr, mpg))
     db.commit()
 
-def _count_rides_by_carpool(db, user_id):
-    """
-    Count rides for this user per carpool (only days <= today AND with a driver).
-    Returns dict {carpool_id or 'legacy': rides_count}
-    """
-    today = date.today()
-    out = defaultdict(int)
-
-    if _is_multi_mode(db):
-        # Build per (cid, day) role maps
-        rows = db.execute("""
-            SELECT day, carpool_id AS cid, user_id, role
-            FROM entries
-        """).fetchall()
-        by = defaultdict(lambda: defaultdict(dict))  # {cid: {day: {user_id: role}}}
-        for r in rows:
-            d = _day_to_date(r["day"])
-            if d > today:  # future excluded
-                continue
-            by[r["cid"]][d][r["user_id"]] = r["role"]
-        for cid, daymap in by.items():
-            for d, roles in daymap.items():
-                if "D" not in roles.values():  # require at least one driver
-                    continue
-                if roles.get(user_id) == "R":
-                    out[cid] += 1
-    else:
-        # Legacy: use members/member_key
-        # Infer member_key from username (best-effort)
-        uname = (session.get("username") or "").strip().lower()
-        key = None
-        rows = db.execute("SELECT key, name FROM members").fetchall()
-        for r in rows:
-            if (r["name"] or "").strip().lower() == uname:
-                key = r["key"]
-                break
-
-        rows = db.execute("SELECT day, member_key, role FROM entries").fetchall()
-        by_day = defaultdict(dict)
-        for r in rows:
-            d = _day_to_date(r["day"])
-            if d > today:
-                continue
-            by_day[d][r["member_key"]] = r["role"]
-        for d, roles in by_day.items():
-            if "D" not in roles.values():
-                continue
-            if key and roles.get(key) == "R":
-                out["legacy"] += 1
-
-    return dict(out)
+def _legacy_member_key(db):
+    """Legacy: infer member_key from username (best-effort)."""
+    uname = (session.get("username") or "").strip().lower()
+    row = db.execute(
+        "SELECT key FROM members WHERE LOWER(TRIM(name)) = ? LIMIT 1", (uname,)
+    ).fetchone()
+    return row["key"] if row else None
 
 @accountbp.route("/account", methods=["GET", "POST"])
 @login_required
@@ -198,6 +141,12 @@ def account():
             flash("Please enter valid numbers for Gas price and Avg MPG.", "error")
             return redirect(url_for("accountbp.account"))
 
+        # A new price applies from today on; earlier rides keep their price
+        previous = _get_global_prefs(db, user_id)[0]
+        if gas_price != previous:
+            with transaction(db):
+                record_gas_price(db, user_id, gas_price, previous=previous)
+
         if _is_multi_mode(db):
             _save_global_prefs(db, user_id, gas_price, avg_mpg)
         else:
@@ -234,33 +183,50 @@ def account():
             flash("Carpool settings updated.")
         return redirect(url_for("accountbp.account"))
 
+    # Gas price history
+    if request.method == "POST" and request.form.get("action") == "add_gas_price":
+        try:
+            price = float(request.form.get("price") or "")
+            eff = datetime.strptime((request.form.get("effective_from") or "").strip(), "%Y-%m-%d").date()
+            cid = int(request.form.get("carpool_id") or 0) or None
+        except ValueError:
+            flash("Please enter a valid date and price.", "error")
+            return redirect(url_for("accountbp.account"))
+        if cid is not None and cid not in {r["id"] for r in _get_carpool_mprs(db, user_id)}:
+            flash("Invalid carpool selection.", "error")
+            return redirect(url_for("accountbp.account"))
+        with transaction(db):
+            record_gas_price(
+                db, user_id, price, effective_from=eff.isoformat(), carpool_id=cid,
+                previous=_get_global_prefs(db, user_id)[0]
+            )
+        flash("Gas price saved.")
+        return redirect(url_for("accountbp.account"))
+
+    if request.method == "POST" and request.form.get("action") == "delete_gas_price":
+        price_id = request.form.get("price_id", type=int)
+        if price_id is not None:
+            db.execute("DELETE FROM gas_price_history WHERE id=? AND user_id=?", (price_id, user_id))
+            flash("Gas price removed.")
+        return redirect(url_for("accountbp.account"))
+
     # Load prefs
     gas_price, avg_mpg, legacy_mpr = _get_global_prefs(db, user_id)
     carpool_mprs = _get_carpool_mprs(db, user_id)  # [] in legacy
 
-    # Compute rides per carpool with the new rule, then miles & savings
-    rides_by_cid = _count_rides_by_carpool(db, user_id)
-    total_miles = 0.0
-    gallons = 0.0
-    # multi-carpool
-    for r in carpool_mprs:
-        rid = rides_by_cid.get(r["id"], 0)
-        miles = rid * r["mpr"]
-        total_miles += miles
-        
-        # Use carpool-specific MPG if set, else global avg_mpg
-        c_mpg = r["mpg"] if r["mpg"] is not None else avg_mpg
-        if c_mpg:
-            gallons += miles / c_mpg
-    # legacy fallback
-    if not carpool_mprs:
-        rid = rides_by_cid.get("legacy", 0)
-        miles = rid * legacy_mpr
-        total_miles += miles
-        if avg_mpg:
-            gallons += miles / avg_mpg
-
-    gas_savings = gallons * gas_price
+    # Rides (past/today days that had a driver) priced month by month with
+    # the gas price in force on each day
+    is_multi = _is_multi_mode(db)
+    if is_multi:
+        months = monthly_savings(db, user_id, carpool_mprs, avg_mpg, gas_price)
+    else:
+        key = _legacy_member_key(db)
+        legacy = [{"id": None, "mpr": legacy_mpr, "mpg": None}]
+        months = monthly_savings(db, user_id, legacy, avg_mpg, gas_price, legacy_key=key) if key else []
+    total_miles = sum(m["miles"] for m in months)
+    gas_savings = sum(m["savings"] for m in months)
+    price_history = gas_price_history(db, user_id)
+    carpool_names = {r["id"]: r["name"] for r in carpool_mprs}
 
     # Template
     tmpl = """
@@ -331,9 +297,78 @@ def account():
         <!-- Stats summary (uses new credit-day rule) -->
         <div class="card">
           <h5>Your summary</h5>
-          <p class="muted">Miles are estimated as (rides × miles-per-ride) per carpool, only counting past/today days that had a driver.</p>
+          <p class="muted">Miles are estimated as (rides × miles-per-ride) per carpool, only counting past/today days that had a driver. Each ride is priced with the gas price in effect on that day. Days that only come from a weekly pattern (never saved on the day) count towards credits but not towards rides or savings here.</p>
           <div><strong>Total miles:</strong> {{ total_miles|round(2) }}</div>
           <div><strong>Gas savings (est.):</strong> ${{ "%.2f"|format(gas_savings) }}</div>
+          {% if months %}
+          <div class="table-scroll" style="margin-top:10px; max-height:40vh;">
+            <table class="table">
+              <thead><tr><th>Month</th><th style="text-align:right;">Rides</th><th style="text-align:right;">Miles</th><th style="text-align:right;">Savings</th></tr></thead>
+              <tbody>
+                {% for m in months %}
+                  <tr>
+                    <td>{{ m.month }}</td>
+                    <td style="text-align:right;">{{ m.rides }}</td>
+                    <td style="text-align:right;">{{ m.miles|round(1) }}</td>
+                    <td style="text-align:right;">${{ "%.2f"|format(m.savings) }}</td>
+                  </tr>
+                {% endfor %}
+              </tbody>
+            </table>
+          </div>
+          {% endif %}
+        </div>
+
+        <!-- Gas price history -->
+        <div class="card">
+          <h5>Gas price history</h5>
+          <p class="muted">Saving a new price above applies from today on. Add a dated price to correct past periods, optionally for a single carpool.</p>
+          <form method="post" class="form-row" style="align-items:end;">
+            <input type="hidden" name="action" value="add_gas_price">
+            <div>
+              <label class="form-label">Effective from
+                <input class="form-control" type="date" name="effective_from" value="{{ today_iso }}" required>
+              </label>
+            </div>
+            <div>
+              <label class="form-label">Price ($/gal)
+                <input class="form-control" name="price" inputmode="decimal" required>
+              </label>
+            </div>
+            {% if is_multi %}
+            <div>
+              <label class="form-label">Carpool
+                <select class="form-select" name="carpool_id">
+                  <option value="">(all)</option>
+                  {% for r in carpool_mprs %}<option value="{{ r.id }}">{{ r.name }}</option>{% endfor %}
+                </select>
+              </label>
+            </div>
+            {% endif %}
+            <div><button class="btn btn-primary">Add</button></div>
+          </form>
+          <table class="table" style="margin-top:10px;">
+            <thead><tr><th>From</th>{% if is_multi %}<th>Carpool</th>{% endif %}<th style="text-align:right;">Price</th><th></th></tr></thead>
+            <tbody>
+              {% for p in price_history|reverse %}
+                <tr>
+                  <td>{{ p['effective_from'] if p['effective_from'] > '0001-01-01' else '(start)' }}</td>
+                  {% if is_multi %}<td>{{ carpool_names.get(p['carpool_id'], '(all)') if p['carpool_id'] else '(all)' }}</td>{% endif %}
+                  <td style="text-align:right;">${{ "%.2f"|format(p['price']) }}</td>
+                  <td style="text-align:right;">
+                    <form method="post" style="display:inline;">
+                      <input type="hidden" name="action" value="delete_gas_price">
+                      <input type="hidden" name="price_id" value="{{ p['id'] }}">
+                      <button class="btn btn-sm btn-secondary" style="padding:2px 6px; font-size:0.8rem;">Del</button>
+                    </form>
+                  </td>
+                </tr>
+              {% endfor %}
+              {% if not price_history %}
+                <tr><td colspan="4" class="muted">Using ${{ gas_price }} for all rides.</td></tr>
+              {% endif %}
+            </tbody>
+          </table>
         </div>
 
         <!-- Password -->
@@ -360,9 +395,11 @@ def account():
     return render_template_string(
         tmpl,
         BASE_TMPL=BASE_TMPL,
-        is_multi=_is_multi_mode(db),
+        is_multi=is_multi,
         gas_price=gas_price, avg_mpg=avg_mpg, legacy_mpr=legacy_mpr,
         carpool_mprs=carpool_mprs,
         total_miles=total_miles, gas_savings=gas_savings,
+        months=months, price_history=price_history, carpool_names=carpool_names,
+        today_iso=date.today().isoformat(),
         **get_navbar_context()
     )
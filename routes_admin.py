@@ -1,4 +1,5 @@
 # routes_admin.py
+import io
 import os
 import time
 from collections import defaultdict
@@ -6,12 +7,20 @@ from datetime import datetime, date
 
 from flask import (
     Blueprint, render_template_string, request, redirect,
-    url_for, session, abort, flash
+    url_for, session, abort, flash, current_app, jsonify
 )
 
-from db import get_db
-from auth import login_required
+from db import get_db, all_dbs, transaction
+from auth import login_required, invalidate_user
 from template_helpers import get_navbar_context
+from entry_store import entries_changed, log_entry_events
+from carpool_analytics import carpool_snapshots
+from entry_export import KINDS, FORMATS, parse_range, export_response
+from entry_import import import_entries
+from provisioning import provision
+from admin_lists import users_page, suggest_users
+from entry_events import recent_events, recent_events_merged
+from purge import schedule_user_delete, kick, list_jobs, retry_failed
 
 adminbp = Blueprint("adminbp", __name__)
 
@@ -81,6 +90,22 @@ def admin_dashboard():
           <h5>Diagnostics</h5>
           <div class="muted">View system stats and database info.</div>
         </a>
+        <a class="card" href="{{ url_for('adminbp.admin_import') }}" style="text-decoration:none; color:inherit;">
+          <h5>Import</h5>
+          <div class="muted">Load a schedule spreadsheet (CSV) into a pool.</div>
+        </a>
+        <a class="card" href="{{ url_for('adminbp.admin_provision') }}" style="text-decoration:none; color:inherit;">
+          <h5>Provision</h5>
+          <div class="muted">Create many users and memberships from a CSV.</div>
+        </a>
+        <a class="card" href="{{ url_for('adminbp.admin_purges') }}" style="text-decoration:none; color:inherit;">
+          <h5>Deletions</h5>
+          <div class="muted">Progress of deleted pools and users being purged.</div>
+        </a>
+        <a class="card" href="{{ url_for('adminbp.admin_analytics') }}" style="text-decoration:none; color:inherit;">
+          <h5>Analytics</h5>
+          <div class="muted">Members, ride days and driver fairness per pool.</div>
+        </a>
       </div>
     {% endblock %}
     """
@@ -146,32 +171,29 @@ def admin_users():
                 (pw_hash, is_admin, username),
             )
             db.commit()
+            row = db.execute("SELECT id FROM users WHERE username=?", (username,)).fetchone()
+            if row:
+                invalidate_user(db, row["id"])
             flash(f"User '{username}' updated.", "info")
 
         elif action == "toggle_active":
             uid = int(request.form.get("user_id") or 0)
-            row = db.execute("SELECT active FROM users WHERE id=?", (uid,)).fetchone()
+            row = db.execute("SELECT active FROM users WHERE id=? AND deleted_at IS NULL", (uid,)).fetchone()
             if row is not None:
                 new_active = 0 if int(row["active"] or 0) == 1 else 1
                 db.execute("UPDATE users SET active=? WHERE id=?", (new_active, uid))
                 db.commit()
+                invalidate_user(db, uid)
             return redirect(url_for("adminbp.admin_users"))
 
         elif action == "delete":
             uid = int(request.form.get("user_id") or 0)
-            print(f"DEBUG: Attempting to delete user {uid}")
             if uid == session.get("user_id"):
-                print("DEBUG: Cannot delete self")
                 flash("Cannot delete yourself.", "error")
-            else:
-                print("DEBUG: Deleting user...")
-                db.execute("DELETE FROM user_prefs WHERE user_id=?", (uid,))
-                db.execute("DELETE FROM user_carpool_prefs WHERE user_id=?", (uid,))
-                db.execute("DELETE FROM carpool_memberships WHERE user_id=?", (uid,))
-                db.execute("DELETE FROM entries WHERE user_id=?", (uid,))
-                db.execute("DELETE FROM users WHERE id=?", (uid,))
-                db.commit()
-                flash("User deleted.", "info")
+            elif schedule_user_delete(db, uid):
+                # Hidden now; their entries are purged in the background
+                kick(current_app._get_current_object())
+                flash("User deleted. Their entries are being purged (see Admin > Deletions).", "info")
             return redirect(url_for("adminbp.admin_users"))
 
         else:
@@ -179,9 +201,8 @@ def admin_users():
 
         return redirect(url_for("adminbp.admin_users"))
 
-    users = db.execute(
-        "SELECT id, username, is_admin, active FROM users ORDER BY username"
-    ).fetchall()
+    q = (request.args.get("q") or "").strip()
+    users, next_page = users_page(db, q, request.args.get("after"), request.args.get("after_id"))
 
     tmpl = """
     {% extends 'BASE_TMPL' %}{% block content %}
@@ -223,11 +244,9 @@ def admin_users():
           <input type='hidden' name='action' value='reset'>
           <div class="col-auto">
             <label class="form-label">Username
-              <select class="form-select" name='username'>
-                {% for u in users %}
-                  <option value='{{u["username"]}}'>{{u["username"]}}</option>
-                {% endfor %}
-              </select>
+              <input class="form-control" name='username' list="user_suggestions" autocomplete="off" required
+                     data-typeahead="{{ url_for('adminbp.admin_user_suggest') }}">
+              <datalist id="user_suggestions"></datalist>
             </label>
           </div>
           <div class="col-auto">
@@ -247,6 +266,16 @@ def admin_users():
 
       <br>
 
+      <form method="get" class="row g-2 align-items-end mb-2">
+        <div class="col-auto">
+          <input class="form-control" name="q" value="{{ q }}" placeholder="Username starts with...">
+        </div>
+        <div class="col-auto">
+          <button class="btn btn-primary">Search</button>
+          {% if q or request.args.get('after') %}<a class="btn btn-secondary" href="{{ url_for('adminbp.admin_users') }}">Reset</a>{% endif %}
+        </div>
+      </form>
+
       <table class="table table-sm">
         <thead><tr><th>User</th><th>Admin</th><th>Active</th><th>Actions</th></tr></thead>
         <tbody>
@@ -276,14 +305,23 @@ def admin_users():
             </tr>
           {% endfor %}
           {% if not users %}
-            <tr><td colspan="2" class="text-center text-muted">No users</td></tr>
+            <tr><td colspan="4" class="text-center text-muted">No users</td></tr>
           {% endif %}
         </tbody>
       </table>
+      {% if next_page %}
+        <a class="btn btn-secondary" href="{{ url_for('adminbp.admin_users', q=q or None, **next_page) }}">Next page</a>
+      {% endif %}
     {% endblock %}
     """
     from templates import BASE_TMPL
-    return render_template_string(tmpl, users=users, BASE_TMPL=BASE_TMPL, **get_navbar_context())
+    return render_template_string(tmpl, users=users, q=q, next_page=next_page, BASE_TMPL=BASE_TMPL, **get_navbar_context())
+
+@adminbp.route("/admin/users/suggest")
+@login_required
+def admin_user_suggest():
+    """Typeahead: JSON list of usernames starting with ?q=."""
+    return jsonify(suggest_users(get_db(), request.args.get("q", "")))
 
 
 # --- Audit view ----------------------------------------------------------------
@@ -296,8 +334,15 @@ def admin_audit():
     if request.method == "POST" and request.form.get("action") == "delete":
         entry_id = int(request.form.get("entry_id") or 0)
         if entry_id:
-            db.execute("DELETE FROM entries WHERE id=?", (entry_id,))
-            db.commit()
+            # Entry ids are per database: a sharded carpool's are its shard's
+            data = get_db(request.form.get("carpool_id", type=int))
+            row = data.execute("SELECT carpool_id, day, user_id, role FROM entries WHERE id=?", (entry_id,)).fetchone()
+            with transaction(data):
+                data.execute("DELETE FROM entries WHERE id=?", (entry_id,))
+                if row is not None and row["carpool_id"] is not None:
+                    log_entry_events(data, row["carpool_id"], [(row["day"], row["user_id"], row["role"], None)],
+                                     session.get("username", "admin"))
+                    entries_changed(data, row["carpool_id"], [row["day"]])
             flash("Entry deleted.", "info")
         return redirect(url_for("adminbp.admin_audit"))
 
@@ -310,9 +355,9 @@ def admin_audit():
     end   = (request.args.get("end") or "").strip()    # YYYY-MM-DD
 
     # Get all carpools for filter dropdown
-    carpools = db.execute("SELECT id, name FROM carpools ORDER BY name").fetchall() if _has_table(db, "carpools") else []
+    carpools = db.execute("SELECT id, name FROM carpools WHERE deleted_at IS NULL ORDER BY name").fetchall() if _has_table(db, "carpools") else []
 
-    rows = db.execute("""
+    rows = [r for conn in all_dbs() for r in conn.execute("""
         SELECT e.id, e.day, e.member_key, e.role,
                COALESCE(e.update_user,'') AS update_user,
                COALESCE(e.update_date,'') AS update_date,
@@ -321,7 +366,9 @@ def admin_audit():
                c.name AS carpool_name
         FROM entries e
         LEFT JOIN carpools c ON c.id = e.carpool_id
-    """).fetchall()
+        WHERE c.deleted_at IS NULL
+          AND NOT EXISTS (SELECT 1 FROM users u WHERE u.id = e.user_id AND u.deleted_at IS NOT NULL)
+    """).fetchall()]
 
     # Convert + filter in Python (supports non-ISO day formats)
     out = []
@@ -403,6 +450,10 @@ def admin_audit():
         <div class="col-auto">
           <button class="btn btn-primary">Filter</button>
           <a class="btn btn-secondary" href="{{ url_for('adminbp.admin_audit') }}">Reset</a>
+          {% set xargs = {'carpool': request.args.get('carpool',''), 'start': request.args.get('start',''), 'end': request.args.get('end','')} %}
+          <a class="btn btn-secondary" href="{{ url_for('adminbp.admin_export', kind='audit', format='csv', **xargs) }}">Export CSV</a>
+          <a class="btn btn-secondary" href="{{ url_for('adminbp.admin_export', kind='audit', format='ndjson', gzip=1, **xargs) }}">NDJSON.gz</a>
+          <a class="btn btn-secondary" href="{{ url_for('adminbp.admin_changes', carpool=request.args.get('carpool') or None) }}">Change log</a>
         </div>
       </form>
 
@@ -434,6 +485,7 @@ def admin_audit():
                   <form method="post" style="display:inline;" onsubmit="return confirm('Delete this entry?');">
                     <input type="hidden" name="action" value="delete">
                     <input type="hidden" name="entry_id" value="{{ r['id'] }}">
+                    <input type="hidden" name="carpool_id" value="{{ r['carpool_id'] or '' }}">
                     <button class="btn btn-sm btn-danger" style="padding:2px 6px; font-size:0.8rem;">Del</button>
                   </form>
                 </td>
@@ -451,6 +503,279 @@ def admin_audit():
     return render_template_string(tmpl, rows=out, carpools=carpools, BASE_TMPL=BASE_TMPL, **get_navbar_context())
 
 
+# --- Export --------------------------------------------------------------------
+@adminbp.route("/admin/export")
+@login_required
+def admin_export():
+    """?kind=history|audit&format=csv|ndjson&carpool=<id>&start=&end=&gzip=1, streamed."""
+    kind = (request.args.get("kind") or "audit").lower()
+    fmt = (request.args.get("format") or "csv").lower()
+    carpool = (request.args.get("carpool") or "").strip()
+    if kind not in KINDS or fmt not in FORMATS or (carpool and not carpool.isdigit()):
+        abort(400)
+    try:
+        start, end = parse_range(request.args.get("start"), request.args.get("end"))
+    except ValueError:
+        abort(400)
+    return export_response(kind, fmt, carpool_id=int(carpool) if carpool else None,
+                           start=start, end=end, gzip=request.args.get("gzip") in ("1", "true"))
+
+
+# --- Import --------------------------------------------------------------------
+@adminbp.route("/admin/import", methods=["GET", "POST"])
+@login_required
+def admin_import():
+    db = get_db()
+    report = None
+    if request.method == "POST":
+        upload = request.files.get("file")
+        carpool = (request.form.get("carpool_id") or "").strip()
+        if not upload or not upload.filename:
+            flash("Choose a CSV file.", "error")
+            return redirect(url_for("adminbp.admin_import"))
+        # Werkzeug spools large uploads to disk; read it line by line from there
+        lines = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        try:
+            report = import_entries(
+                db, lines,
+                carpool_id=int(carpool) if carpool.isdigit() else None,
+                username=session.get("username", "admin"),
+                dry_run=bool(request.form.get("dry_run")),
+            )
+        except (ValueError, UnicodeDecodeError) as e:
+            flash(f"Import failed: {e}", "error")
+            return redirect(url_for("adminbp.admin_import"))
+        report["dry_run"] = bool(request.form.get("dry_run"))
+
+    carpools = db.execute("SELECT id, name FROM carpools WHERE deleted_at IS NULL ORDER BY name").fetchall()
+    tmpl = """
+    {% extends 'BASE_TMPL' %}{% block content %}
+      <h3>Import schedule</h3>
+      <div class="card">
+        <form method="post" enctype="multipart/form-data" class="row g-2 align-items-end">
+          <div class="col-auto">
+            <label class="form-label">CSV file</label>
+            <input class="form-control" type="file" name="file" accept=".csv,text/csv" required>
+          </div>
+          <div class="col-auto">
+            <label class="form-label">Pool (if the file has no carpool column)</label>
+            <select name="carpool_id" class="form-select">
+              <option value="">(from file)</option>
+              {% for c in carpools %}<option value="{{ c['id'] }}">{{ c['name'] }}</option>{% endfor %}
+            </select>
+          </div>
+          <div class="col-auto">
+            <label><input type="checkbox" name="dry_run" value="1" checked> Dry run (validate only)</label>
+          </div>
+          <div class="col-auto"><button class="btn btn-primary">Upload</button></div>
+        </form>
+        <div class="muted" style="font-size:.85rem; margin-top:8px;">
+          Columns: <code>day</code> (YYYY-MM-DD), <code>member</code> (name, member key or username) or <code>user_id</code>,
+          <code>role</code> (D/R/O), optionally <code>carpool</code> or <code>carpool_id</code>.
+          Existing days are overwritten; invalid rows are skipped and listed.
+        </div>
+      </div>
+      {% if report %}
+        <br>
+        <div class="card">
+          <h5>{{ 'Dry run' if report.dry_run else 'Imported' }}</h5>
+          <p>{{ report.rows }} rows read, {{ report.valid }} valid, {{ report.written }} written, {{ report.error_count }} errors.</p>
+          {% if report.errors %}
+            <pre>{% for e in report.errors %}{{ e }}
+{% endfor %}{% if report.error_count > report.errors|length %}... and {{ report.error_count - report.errors|length }} more{% endif %}</pre>
+          {% endif %}
+        </div>
+      {% endif %}
+    {% endblock %}
+    """
+    from templates import BASE_TMPL
+    return render_template_string(tmpl, BASE_TMPL=BASE_TMPL, carpools=carpools, report=report, **get_navbar_context())
+
+
+# --- Change log ----------------------------------------------------------------
+@adminbp.route("/admin/changes")
+@login_required
+def admin_changes():
+    """Every role change from the entry_events journal, newest first."""
+    db = get_db()
+    carpool_filter = request.args.get("carpool", type=int)
+    dbs = all_dbs()
+    if carpool_filter or len(dbs) == 1:
+        events, next_page = recent_events(
+            get_db(carpool_filter), carpool_filter, request.args.get("before_ts"), request.args.get("before_id")
+        )
+    else:
+        # Sharded carpools keep their own journal (and ids); merge them
+        events, next_page = recent_events_merged(
+            {getattr(conn, "carpool_id", None) or 0: conn for conn in dbs}, request.args.get("before")
+        )
+    carpools = db.execute("SELECT id, name FROM carpools WHERE deleted_at IS NULL ORDER BY name").fetchall()
+    tmpl = """
+    {% extends 'BASE_TMPL' %}{% block content %}
+      <h3>Change log</h3>
+      <form method="get" class="row g-2 align-items-end mb-2">
+        <div class="col-auto">
+          <select class="form-select" name="carpool">
+            <option value="">(all pools)</option>
+            {% for c in carpools %}<option value="{{ c['id'] }}" {{ 'selected' if carpool_filter == c['id'] }}>{{ c['name'] }}</option>{% endfor %}
+          </select>
+        </div>
+        <div class="col-auto">
+          <button class="btn btn-primary">Filter</button>
+          <a class="btn btn-secondary" href="{{ url_for('adminbp.admin_audit') }}">Audit</a>
+        </div>
+      </form>
+      <div class="table-scroll">
+        <table class="table table-sm table-sticky">
+          <thead><tr><th>When</th><th>Carpool</th><th>Day</th><th>Member</th><th>Change</th><th>By</th></tr></thead>
+          <tbody>
+            {% for e in events %}
+              <tr>
+                <td class="muted">{{ e['ts'] }}</td>
+                <td>{{ e['carpool'] or ('#' ~ e['carpool_id']) }}</td>
+                <td>{{ e['day'] }}</td>
+                <td>{{ e['member'] }}</td>
+                <td>{{ e['old_role'] or '(none)' }} &rarr; {{ e['new_role'] or '(deleted)' }}</td>
+                <td>{{ e['actor'] or '' }}</td>
+              </tr>
+            {% endfor %}
+            {% if not events %}<tr><td colspan="6" class="muted">No changes recorded.</td></tr>{% endif %}
+          </tbody>
+        </table>
+      </div>
+      {% if next_page %}
+        <a class="btn btn-secondary" href="{{ url_for('adminbp.admin_changes', carpool=carpool_filter, **next_page) }}">Older</a>
+      {% endif %}
+    {% endblock %}
+    """
+    from templates import BASE_TMPL
+    return render_template_string(tmpl, BASE_TMPL=BASE_TMPL, events=events, next_page=next_page,
+                                  carpools=carpools, carpool_filter=carpool_filter, **get_navbar_context())
+
+
+# --- Provisioning --------------------------------------------------------------
+@adminbp.route("/admin/provision", methods=["GET", "POST"])
+@login_required
+def admin_provision():
+    db = get_db()
+    report = None
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            flash("Choose a CSV file.", "error")
+            return redirect(url_for("adminbp.admin_provision"))
+        lines = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        try:
+            report = provision(db, lines, dry_run=bool(request.form.get("dry_run")))
+        except (ValueError, UnicodeDecodeError) as e:
+            flash(f"Provisioning failed: {e}", "error")
+            return redirect(url_for("adminbp.admin_provision"))
+        report["dry_run"] = bool(request.form.get("dry_run"))
+
+    tmpl = """
+    {% extends 'BASE_TMPL' %}{% block content %}
+      <h3>Provision users and memberships</h3>
+      <div class="card">
+        <form method="post" enctype="multipart/form-data" class="row g-2 align-items-end">
+          <div class="col-auto">
+            <label class="form-label">CSV file</label>
+            <input class="form-control" type="file" name="file" accept=".csv,text/csv" required>
+          </div>
+          <div class="col-auto">
+            <label><input type="checkbox" name="dry_run" value="1" checked> Dry run (validate only)</label>
+          </div>
+          <div class="col-auto"><button class="btn btn-primary">Upload</button></div>
+        </form>
+        <div class="muted" style="font-size:.85rem; margin-top:8px;">
+          Columns: <code>username</code>, <code>password</code> (new users), optionally <code>is_admin</code>,
+          <code>carpool</code> or <code>carpool_id</code>, <code>member_key</code>, <code>display_name</code>, <code>active</code>.
+          Existing users and memberships are left unchanged; the whole file is saved in one transaction.
+        </div>
+      </div>
+      {% if report %}
+        <br>
+        <div class="card">
+          <h5>{{ 'Dry run' if report.dry_run else 'Provisioned' }}</h5>
+          <p>
+            {{ report.rows }} rows:
+            {{ report.users_created }} users {{ 'would be ' if report.dry_run }}created, {{ report.users_existing }} already existed;
+            {{ report.memberships_created }} memberships {{ 'would be ' if report.dry_run }}created, {{ report.memberships_existing }} already existed;
+            {{ report.error_count }} errors.
+          </p>
+          {% if report.created %}
+            <div class="muted" style="font-size:.85rem;">New: {{ report.created[:100]|join(', ') }}{% if report.created|length > 100 %}, ...{% endif %}</div>
+          {% endif %}
+          {% if report.errors %}
+            <pre>{% for e in report.errors %}{{ e }}
+{% endfor %}{% if report.error_count > report.errors|length %}... and {{ report.error_count - report.errors|length }} more{% endif %}</pre>
+          {% endif %}
+        </div>
+      {% endif %}
+    {% endblock %}
+    """
+    from templates import BASE_TMPL
+    return render_template_string(tmpl, BASE_TMPL=BASE_TMPL, report=report, **get_navbar_context())
+
+
+# --- Deletions -----------------------------------------------------------------
+@adminbp.route("/admin/purges", methods=["GET", "POST"])
+@login_required
+def admin_purges():
+    db = get_db()
+    if request.method == "POST" and request.form.get("action") == "retry":
+        retry_failed(db)
+    jobs = list_jobs(db)
+    pending = any(j["finished_ts"] is None and j["error"] is None for j in jobs)
+    if pending or request.method == "POST":
+        # Also picks up purges a restart interrupted
+        kick(current_app._get_current_object())
+    if request.method == "POST":
+        return redirect(url_for("adminbp.admin_purges"))
+    tmpl = """
+    {% extends 'BASE_TMPL' %}{% block content %}
+      {% if pending %}<meta http-equiv="refresh" content="2">{% endif %}
+      <h3>Deletions</h3>
+      <div class="card">
+        <div class="muted" style="font-size:.85rem;">
+          Deleted pools and users disappear at once; their entries are removed here in small batches.
+        </div>
+        <div class="table-scroll">
+          <table class="table table-sm">
+            <thead><tr><th>#</th><th>What</th><th>Queued</th><th style="min-width:200px;">Progress</th><th>Status</th></tr></thead>
+            <tbody>
+              {% for j in jobs %}
+                {% set pct = (100 * j['done'] / j['total'])|round|int if j['total'] else 100 %}
+                <tr>
+                  <td>{{ j['id'] }}</td>
+                  <td>{{ 'Pool' if j['kind'] == 'carpool' else 'User' }} {{ j['label'] }}</td>
+                  <td>{{ j['created_ts'] }}</td>
+                  <td>
+                    <progress max="100" value="{{ pct }}" style="width:140px;"></progress>
+                    {{ j['done'] }} / {{ j['total'] }}
+                  </td>
+                  <td>
+                    {% if j['finished_ts'] %}Done {{ j['finished_ts'] }}
+                    {% elif j['error'] %}<span style="color:var(--danger, #c00);">Failed: {{ j['error'] }}</span>
+                    {% elif j['started_ts'] %}Purging…
+                    {% elif j['stalled'] %}Pending – run <code>python manage.py purge</code>
+                    {% else %}Queued{% endif %}
+                  </td>
+                </tr>
+              {% endfor %}
+              {% if not jobs %}<tr><td colspan="5" class="muted">Nothing deleted yet.</td></tr>{% endif %}
+            </tbody>
+          </table>
+        </div>
+        {% if jobs|selectattr('error')|rejectattr('finished_ts')|list %}
+          <form method="post"><input type="hidden" name="action" value="retry"><button class="btn btn-secondary">Retry failed</button></form>
+        {% endif %}
+      </div>
+    {% endblock %}
+    """
+    from templates import BASE_TMPL
+    return render_template_string(tmpl, BASE_TMPL=BASE_TMPL, jobs=jobs, pending=pending, **get_navbar_context())
+
+
 # --- Diagnostics ---------------------------------------------------------------
 @adminbp.route("/admin/diag")
 @login_required
@@ -471,9 +796,9 @@ def admin_diag():
     size = os.path.getsize(main_path) if exists else 0
     mtime = os.path.getmtime(main_path) if exists else 0
 
-    rows = db.execute(
+    rows = [r for conn in all_dbs() for r in conn.execute(
         "SELECT day, member_key, role, update_user, update_ts FROM entries"
-    ).fetchall()
+    ).fetchall()]
     n_entries = len(rows)
 
     # Compute day stats
@@ -563,3 +888,61 @@ def admin_diag():
         newest=newest, oldest=oldest,
         **get_navbar_context()
     )
+
+
+# --- Analytics -----------------------------------------------------------------
+@adminbp.route("/admin/analytics")
+@login_required
+def admin_analytics():
+    db = get_db()
+    pools = carpool_snapshots(db)
+    months_shown = 6
+    tmpl = """
+    {% extends 'BASE_TMPL' %}{% block content %}
+      <h3>Analytics</h3>
+      <div class="card">
+        <div class="muted" style="font-size:.85rem;">
+          Saved entries up to today. <strong>Spread</strong> = highest minus lowest credit balance among active members;
+          <strong>Unscored</strong> = days with no Driver or several Drivers, which the credit rule ignores.
+        </div>
+        <div class="table-scroll">
+          <table class="table table-sm">
+            <thead>
+              <tr>
+                <th>Pool</th><th style="text-align:right;">Active members</th>
+                <th style="text-align:right;">Ride days</th><th style="text-align:right;">Unscored</th>
+                <th style="text-align:right;">Spread</th><th>Range</th><th>Ride days per month (latest {{ months_shown }})</th>
+              </tr>
+            </thead>
+            <tbody>
+              {% for p in pools %}
+                <tr>
+                  <td>{{ p.name }}</td>
+                  <td style="text-align:right;">{{ p.members }}</td>
+                  <td style="text-align:right;">{{ p.ride_days }}</td>
+                  <td style="text-align:right;">{{ p.unscored_days }}</td>
+                  <td style="text-align:right;">{{ p.spread }}</td>
+                  <td>{% if p.first_day %}{{ p.first_day }} → {{ p.last_day }}{% else %}<span class="muted">no entries</span>{% endif %}</td>
+                  <td>
+                    {% for m in p.months[-months_shown:] %}
+                      <span title="{{ m.unscored_days }} unscored">{{ m.month }}: {{ m.ride_days }}</span>{% if not loop.last %}, {% endif %}
+                    {% endfor %}
+                  </td>
+                </tr>
+              {% endfor %}
+              {% if not pools %}
+                <tr><td colspan="7" class="muted">No pools yet.</td></tr>
+              {% endif %}
+            </tbody>
+          </table>
+        </div>
+      </div>
+    {% endblock %}
+    """
+    from templates import BASE_TMPL
+    return render_template_string(
+        tmpl,
+        BASE_TMPL=BASE_TMPL,
+        pools=pools, months_shown=months_shown,
+        **get_navbar_context()
+    )
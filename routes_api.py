@@ -0,0 +1,314 @@
+# routes_api.py
+"""
+Versioned JSON API for lightweight clients (phones checking "who drives today").
+
+Same data and rules as the Today/History pages (load_day/day_summary in
+routes_today.py), without the HTML. Multi-carpool mode only; the carpool is
+?carpool_id=, else the session's carpool, else the user's first carpool.
+
+Responses carry a strong ETag built from the carpool's entries version and
+the membership/carpool version (cache_versions), so a client polling with
+If-None-Match gets a 304 without the server computing anything.
+"""
+import hashlib
+from datetime import date, timedelta
+
+from flask import Blueprint, request, session, jsonify, abort, make_response
+from flask_login import current_user
+
+from db import get_db
+from auth import login_required
+from cache import get_version
+from entry_store import carpool_versions
+from template_helpers import get_user_carpools, carpool_options_cache
+from schedule_patterns import load_patterns, pattern_roles, overlay
+from routes_dashboard import carpool_dashboard
+from entry_export import FORMATS, parse_range, export_response
+from entry_events import latest_seq, pruned_through, events_after
+from routes_today import _is_multi_mode, parse_day, load_day, day_summary, credit_bases, can_edit_day
+
+apibp = Blueprint("apibp", __name__, url_prefix="/api/v1")
+
+HISTORY_PAGE_DEFAULT = 30
+HISTORY_PAGE_MAX = 200
+SYNC_PAGE_DEFAULT = 500
+SYNC_PAGE_MAX = 5000
+
+
+@apibp.errorhandler(400)
+@apibp.errorhandler(401)
+@apibp.errorhandler(404)
+@apibp.errorhandler(410)
+def _json_error(e):
+    return jsonify(error=e.description), e.code
+
+def _current_carpool():
+    """(id, name) of the requested carpool, checked against the user's memberships."""
+    db = get_db()
+    if not _is_multi_mode(db):
+        abort(404, "multi-carpool mode is not enabled")
+    options = get_user_carpools(int(current_user.id))
+    wanted = request.args.get("carpool_id") or session.get("carpool_id")
+    if wanted is None and options:
+        wanted = options[0]["id"]
+    try:
+        wanted = int(wanted)
+    except (TypeError, ValueError):
+        abort(404, "no carpool selected")
+    for c in options:
+        if c["id"] == wanted:
+            return c["id"], c["name"]
+    abort(404, "not a member of this carpool")
+
+def _etag(*cids: int) -> str:
+    db = get_db()
+    versions = carpool_versions(cids)
+    parts = (
+        request.endpoint, request.query_string.decode(),
+        ",".join(f"{c}:{versions[c]}" for c in sorted(versions)), str(get_version(db, carpool_options_cache.name)),
+        # Credits only count days <= today, so the answer changes at midnight
+        date.today().isoformat(), str(current_user.id), str(int(bool(session.get("is_admin")))),
+    )
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:20]
+
+def _not_modified(etag: str):
+    """A 304 response if the client already has this version, else None."""
+    if etag in request.if_none_match:
+        resp = make_response("", 304)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+    return None
+
+def _json(payload, etag: str):
+    resp = jsonify(payload)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+def _members(db, cid: int):
+    return db.execute("""
+        SELECT user_id, display_name FROM carpool_memberships
+        WHERE carpool_id=? AND active=1
+        ORDER BY display_name
+    """, (cid,)).fetchall()
+
+
+@apibp.route("/carpools")
+@login_required
+def carpools():
+    options = get_user_carpools(int(current_user.id))
+    return jsonify(carpools=options, selected=session.get("carpool_id"))
+
+@apibp.route("/today")
+@login_required
+def today():
+    """
+    Roles, credits and the driver for one day (?day=YYYY-MM-DD, default today).
+    Credits include the selected day, like the Today page.
+    """
+    cid, name = _current_carpool()
+    etag = _etag(cid)
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+
+    db = get_db(cid)
+    selected_day = parse_day(request.args.get("day") or date.today().isoformat())
+    members, existing, roles = load_day(db, multi=True, cid=cid, selected_day=selected_day)
+    summary = day_summary(db, selected_day, existing, roles, multi=True, cid=cid)
+    credits = summary["credits"]
+    return _json({
+        "carpool": {"id": cid, "name": name},
+        "day": selected_day.isoformat(),
+        "members": [
+            {"id": m["user_id"], "name": m["display_name"],
+             "role": roles[m["user_id"]], "credits": credits.get(m["user_id"], 0)}
+            for m in members
+        ],
+        "driver": None if summary["suggestion"] is None else {
+            "id": summary["suggestion"],
+            "name": summary["suggestion_name"],
+            "explicit": summary["driver_is_explicit"],
+        },
+        "no_carpool": summary["no_carpool"],
+        "can_edit": can_edit_day(selected_day),
+    }, etag)
+
+@apibp.route("/credits")
+@login_required
+def credits():
+    """Current credit balances (days up to and including today)."""
+    cid, name = _current_carpool()
+    etag = _etag(cid)
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+
+    db = get_db(cid)
+    # Days before tomorrow; starts from the archive checkpoint if there is one
+    balances, _last = credit_bases(db, [cid], date.today() + timedelta(days=1))[cid]
+    return _json({
+        "carpool": {"id": cid, "name": name},
+        "as_of": date.today().isoformat(),
+        "credits": [
+            {"id": m["user_id"], "name": m["display_name"], "credits": balances.get(m["user_id"], 0)}
+            for m in _members(db, cid)
+        ],
+    }, etag)
+
+@apibp.route("/history")
+@login_required
+def history():
+    """
+    Saved roles, newest day first, paged by day: ?limit=N&before=YYYY-MM-DD.
+    Lists explicit entries plus weekly-pattern roles up to today; members
+    without either are Riders.
+    Follow `next_before` until it is null.
+    """
+    cid, name = _current_carpool()
+    try:
+        limit = min(max(int(request.args.get("limit") or HISTORY_PAGE_DEFAULT), 1), HISTORY_PAGE_MAX)
+    except ValueError:
+        abort(400, "limit must be an integer")
+    before = (request.args.get("before") or "").strip()
+    if before:
+        before = parse_day(before).isoformat()
+    else:
+        before = "9999-12-31"
+
+    etag = _etag(cid)
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+
+    db = get_db(cid)
+    days = [r["day"] for r in db.execute("""
+        SELECT DISTINCT day FROM entries
+        WHERE carpool_id=? AND day < ?
+        ORDER BY day DESC LIMIT ?
+    """, (cid, before, limit + 1)).fetchall()]
+    # Pattern days count too, up to today
+    patterns = load_patterns(db, cid)
+    hi = min(parse_day(before) if before < "9999" else date.max, date.today() + timedelta(days=1))
+    if patterns:
+        pattern_days = sorted({d for d, _who in pattern_roles(patterns, None, hi)}, reverse=True)
+        days = sorted(set(days) | set(pattern_days[:limit + 1]), reverse=True)[:limit + 1]
+    has_more = len(days) > limit
+    days = days[:limit]
+
+    by_day = {d: {} for d in days}
+    if days:
+        rows = db.execute("""
+            SELECT day, user_id AS who, role FROM entries
+            WHERE carpool_id=? AND day BETWEEN ? AND ?
+        """, (cid, days[-1], days[0])).fetchall()
+        span_end = min(parse_day(days[0]) + timedelta(days=1), hi)
+        for r in overlay(rows, patterns, parse_day(days[-1]), span_end):
+            if r["day"] in by_day:
+                by_day[r["day"]][str(r["who"])] = r["role"]
+
+    return _json({
+        "carpool": {"id": cid, "name": name},
+        "members": [{"id": m["user_id"], "name": m["display_name"]} for m in _members(db, cid)],
+        "days": [{"day": d, "roles": by_day[d]} for d in days],
+        "next_before": days[-1] if has_more else None,
+    }, etag)
+
+@apibp.route("/dashboard")
+@login_required
+def dashboard():
+    """Today's role, driver and the user's credits in each of their carpools."""
+    db = get_db()
+    if not _is_multi_mode(db):
+        abort(404, "multi-carpool mode is not enabled")
+    uid = int(current_user.id)
+    etag = _etag(*[c["id"] for c in get_user_carpools(uid)])
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+    return _json({"day": date.today().isoformat(), "carpools": carpool_dashboard(db, uid)}, etag)
+
+@apibp.route("/export")
+@login_required
+def export():
+    """
+    Saved roles of the carpool streamed as a download:
+    ?format=csv|ndjson&start=YYYY-MM-DD&end=YYYY-MM-DD&gzip=1 (dates inclusive).
+    """
+    cid, _name = _current_carpool()
+    fmt = (request.args.get("format") or "csv").lower()
+    if fmt not in FORMATS:
+        abort(400, "format must be csv or ndjson")
+    try:
+        start, end = parse_range(request.args.get("start"), request.args.get("end"))
+    except ValueError:
+        abort(400, "start/end must be YYYY-MM-DD, start <= end")
+    return export_response("history", fmt, carpool_id=cid, start=start, end=end,
+                           gzip=request.args.get("gzip") in ("1", "true"))
+
+@apibp.route("/sync")
+@login_required
+def sync():
+    """
+    Saved roles changed since the client's cursor: ?cursor=<from the last
+    response>&limit=N. Without a cursor (or once it is too old) the response
+    has reset=true and pages through a full snapshot first; keep calling with
+    the returned cursor while has_more. role null = deleted.
+    Weekly-pattern days are not expanded.
+    """
+    wanted = request.args.get("carpool_id", type=int)
+    if wanted and get_db().execute(
+        "SELECT 1 FROM carpools WHERE id=? AND deleted_at IS NOT NULL", (wanted,)
+    ).fetchone():
+        abort(410, "carpool deleted")
+    cid, name = _current_carpool()
+    try:
+        limit = min(max(int(request.args.get("limit") or SYNC_PAGE_DEFAULT), 1), SYNC_PAGE_MAX)
+    except ValueError:
+        abort(400, "limit must be an integer")
+    # "<seq>" after a finished sync, "<seq>:<day>:<user_id>" while paging a snapshot
+    token = (request.args.get("cursor") or "").strip()
+    try:
+        seq, *after = token.split(":") if token else ("",)
+        seq = int(seq) if seq else None
+        after = (after[0], int(after[1])) if after else None
+    except (ValueError, IndexError):
+        abort(400, "bad cursor")
+
+    etag = _etag(cid)
+    cached = _not_modified(etag)
+    if cached is not None:
+        return cached
+
+    db = get_db(cid)
+    current = latest_seq(db, cid)
+    reset = seq is None or (after is None and (seq < pruned_through(db) or seq > current))
+    if reset or after is not None:
+        if reset:
+            # Read the sequence first: changes racing with the snapshot are replayed after it
+            seq, after = current, None
+        params = [cid]
+        sql = "SELECT day, user_id, role FROM entries WHERE carpool_id=?"
+        if after is not None:
+            sql += " AND (day, user_id) > (?, ?)"
+            params.extend(after)
+        rows = db.execute(sql + " ORDER BY day, user_id LIMIT ?", (*params, limit + 1)).fetchall()
+        snapshot_more = len(rows) > limit
+        rows = rows[:limit]
+        changes = [{"day": r["day"], "user_id": r["user_id"], "role": r["role"]} for r in rows]
+        cursor = f"{seq}:{rows[-1]['day']}:{rows[-1]['user_id']}" if snapshot_more else str(seq)
+        # After the last snapshot page, changes made while paging follow as events
+        has_more = snapshot_more or current > seq
+    else:
+        events, last, has_more = events_after(db, cid, seq, limit)
+        changes = [{"day": day, "user_id": uid, "role": role} for _seq, day, uid, role in events]
+        cursor = str(last)
+
+    return _json({
+        "carpool": {"id": cid, "name": name},
+        "reset": reset,
+        "changes": changes,
+        "cursor": cursor,
+        "has_more": has_more,
+    }, etag)
@@ -0,0 +1,390 @@
+# routes_calendar.py
+"""
+Month calendar: roles, credits and the driver for every day of a month.
+
+The Today page works one day at a time (credit_base() for the day, then the
+day's roles). Here the month's entries come from one ranged query; the
+balances before the 1st are computed once and rolled forward day by day
+with the same rules (day_credits / pick_driver), so a whole month costs
+about as much as one Today page.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from flask import Blueprint, render_template_string, request, session, redirect, url_for, flash
+
+from db import get_db
+from auth import login_required
+from template_helpers import get_navbar_context
+from constants import ROLE_CHOICES
+from schedule_patterns import load_patterns, pattern_roles, overlay, member_week, set_member_week, WEEKDAYS
+from archive import archived_rows
+from routes_today import (_is_multi_mode, credit_base, day_credits, pick_driver, rotation_order,
+                          can_edit_day, locked_message, save_entries)
+
+calendarbp = Blueprint("calendarbp", __name__)
+
+BULK_MAX_DAYS = 366
+ROLE_LABELS = {"D": "Driver", "R": "Rider", "O": "Off"}
+
+def _parse_month(s: str) -> date:
+    try:
+        return datetime.strptime(s, "%Y-%m").date()
+    except Exception:
+        return date.today().replace(day=1)
+
+def _add_month(first: date, n: int) -> date:
+    y, m = divmod(first.year * 12 + first.month - 1 + n, 12)
+    return date(y, m + 1, 1)
+
+def month_plan(db, first: date, *, multi: bool, cid: int | None):
+    """
+    Returns (days, members, credits_end):
+      days        - {date: {roles, driver, explicit, no_carpool}} for the month
+      members     - [(who, label)] active members
+      credits_end - balances after the month's last counted day
+    """
+    last = _add_month(first, 1)
+    if multi:
+        members = db.execute("""
+            SELECT user_id AS who, display_name AS label
+            FROM carpool_memberships
+            WHERE carpool_id=? AND active=1
+            ORDER BY display_name
+        """, (cid,)).fetchall()
+        rows = db.execute("""
+            SELECT day, user_id AS who, role FROM entries
+            WHERE carpool_id=? AND day >= ? AND day < ?
+        """, (cid, first.isoformat(), last.isoformat())).fetchall()
+        rows = overlay(list(rows) + archived_rows(db, cid, first, last), load_patterns(db, cid), first, last)
+    else:
+        members = db.execute(
+            "SELECT key AS who, name AS label FROM members WHERE active=1 ORDER BY key"
+        ).fetchall()
+        rows = db.execute(
+            "SELECT day, member_key AS who, role FROM entries WHERE day >= ? AND day < ?",
+            (first.isoformat(), last.isoformat())
+        ).fetchall()
+    members = [(m["who"], m["label"]) for m in members]
+    rotation = rotation_order(db, multi=multi, cid=cid)
+
+    by_day = defaultdict(dict)
+    for r in rows:
+        by_day[r["day"][:10]][r["who"]] = r["role"]
+
+    base_credits, last_driver = credit_base(db, first, multi=multi, cid=cid)
+    credits = dict(base_credits)
+    today = date.today()
+
+    days = {}
+    d = first
+    while d < last:
+        existing = by_day.get(d.isoformat(), {})
+        roles = {who: existing.get(who, "R") for who, _label in members}
+        active = [w for w, r in roles.items() if r != "O"]
+        explicit = next((w for w, r in roles.items() if r == "D"), None)
+        no_carpool = len(active) < 2
+        driver = None
+        if not no_carpool:
+            driver = explicit if explicit is not None else pick_driver(active, credits, last_driver, rotation)
+        days[d] = {"roles": roles, "driver": driver, "explicit": explicit is not None, "no_carpool": no_carpool}
+
+        # Roll forward: this day now counts for the days after it
+        if d <= today:
+            for who, n in day_credits(existing).items():
+                credits[who] = credits.get(who, 0) + n
+        drivers = [w for w, r in existing.items() if r == "D"]
+        if drivers:
+            last_driver = drivers[0]
+        d += timedelta(days=1)
+
+    return days, members, credits
+
+CALENDAR_TMPL = """
+{% extends "BASE_TMPL" %}{% block content %}
+  <div class="card">
+    {% if session.get('carpool_name') %}
+      <div style="margin-bottom: 14px; padding-bottom: 10px; border-bottom: 1px solid var(--border);">
+        <div class="muted" style="font-size: .9rem;">Displaying data for</div>
+        <div style="font-size: 1.1rem; font-weight: 600; color: var(--accent);">{{ session.get('carpool_name') }}</div>
+      </div>
+    {% endif %}
+
+    <div class="form-row" style="justify-content:space-between; align-items:center; margin-bottom:10px;">
+      <a class="btn btn-sm btn-secondary" href="{{ url_for('calendarbp.month_view', month=prev_month) }}">&larr; {{ prev_month }}</a>
+      <h3 style="margin:0;">{{ title }}</h3>
+      <a class="btn btn-sm btn-secondary" href="{{ url_for('calendarbp.month_view', month=next_month) }}">{{ next_month }} &rarr;</a>
+    </div>
+
+    <div class="table-scroll">
+      <table class="table" style="table-layout:fixed;">
+        <thead>
+          <tr>{% for wd in ['Mon','Tue','Wed','Thu','Fri','Sat','Sun'] %}<th>{{ wd }}</th>{% endfor %}</tr>
+        </thead>
+        <tbody>
+          {% for week in weeks %}
+            <tr>
+              {% for d in week %}
+                {% set info = days.get(d) %}
+                <td style="vertical-align:top; {{ 'opacity:.35;' if not info else '' }} {{ 'outline:1px solid var(--accent);' if d == today else '' }}">
+                  {% if info %}
+                    <a href="{{ url_for('todaybp.today', day=d.isoformat()) }}">{{ d.day }}</a>
+                    {% if info.no_carpool %}
+                      <div class="muted" style="font-size:.8rem;">No NerdPool</div>
+                    {% elif info.driver is not none %}
+                      <div style="font-size:.85rem;">
+                        {% if info.explicit %}<strong>{{ names.get(info.driver, info.driver) }}</strong>
+                        {% else %}<span class="muted">{{ names.get(info.driver, info.driver) }}?</span>{% endif %}
+                      </div>
+                    {% endif %}
+                    {% set off = [] %}
+                    {% for who, role in info.roles.items() if role == 'O' %}{% set _ = off.append(names.get(who, who)) %}{% endfor %}
+                    {% if off %}<div class="muted" style="font-size:.75rem;">Off: {{ off|join(', ') }}</div>{% endif %}
+                  {% else %}
+                    <span class="muted">{{ d.day }}</span>
+                  {% endif %}
+                </td>
+              {% endfor %}
+            </tr>
+          {% endfor %}
+        </tbody>
+      </table>
+    </div>
+    <div class="muted" style="font-size:.85rem;"><strong>Name</strong> = driver set, <span class="muted">Name?</span> = suggested</div>
+  </div>
+
+  {% if multi and members %}
+  <div class="card" style="margin-top:14px;">
+    <h4>Weekly pattern</h4>
+    <div class="muted" style="font-size:.85rem; margin-bottom:8px;">
+      Repeats every week from the start date without saving each day. Roles set on a specific day still win.
+    </div>
+    <form method="post" action="{{ url_for('calendarbp.save_pattern') }}">
+      <div class="table-scroll">
+        <table class="table table-sm">
+          <thead><tr><th>Member</th>{% for wd in weekday_names %}<th>{{ wd }}</th>{% endfor %}</tr></thead>
+          <tbody>
+            {% for who, label in members %}
+              <tr>
+                <td>{{ label }}</td>
+                {% for wd in range(7) %}
+                  {% set cur = member_weeks[who].get(wd, '') %}
+                  <td>
+                    <select class="form-select" name="p_{{ who }}_{{ wd }}">
+                      <option value="" {{ 'selected' if not cur else '' }}>-</option>
+                      <option value="D" {{ 'selected' if cur=='D' else '' }}>D</option>
+                      <option value="R" {{ 'selected' if cur=='R' else '' }}>R</option>
+                      <option value="O" {{ 'selected' if cur=='O' else '' }}>O</option>
+                    </select>
+                  </td>
+                {% endfor %}
+              </tr>
+            {% endfor %}
+          </tbody>
+        </table>
+      </div>
+      <div class="form-row" style="align-items:end; gap:10px;">
+        <div>
+          <label class="form-label">Starting</label>
+          <input class="form-control" type="date" name="start" required value="{{ today.isoformat() }}">
+        </div>
+        <div><button class="btn btn-primary">Save pattern</button></div>
+      </div>
+    </form>
+  </div>
+  {% endif %}
+
+  {% if members %}
+  <div class="card" style="margin-top:14px;">
+    <h4>Set a date range</h4>
+    <form method="post" action="{{ url_for('calendarbp.bulk_edit') }}" class="form-row" style="align-items:end; gap:10px;">
+      <div>
+        <label class="form-label">Member</label>
+        <select class="form-select" name="who">
+          {% for who, label in members %}<option value="{{ who }}">{{ label }}</option>{% endfor %}
+        </select>
+      </div>
+      <div>
+        <label class="form-label">From</label>
+        <input class="form-control" type="date" name="start" required value="{{ range_start }}">
+      </div>
+      <div>
+        <label class="form-label">To</label>
+        <input class="form-control" type="date" name="end" required value="{{ range_end }}">
+      </div>
+      <div>
+        <label class="form-label">Status</label>
+        <select class="form-select" name="role">
+          <option value="O">Off</option><option value="R">Rider</option><option value="D">Driver</option>
+        </select>
+      </div>
+      <div>
+        <label><input type="checkbox" name="weekdays" value="1" checked> Weekdays only</label>
+      </div>
+      <div><button class="btn btn-primary">Apply</button></div>
+    </form>
+  </div>
+  {% endif %}
+
+  <div class="card" style="margin-top:14px;">
+    <h4>Credits at end of {{ title }}</h4>
+    <table class="table table-sm">
+      <tbody>
+        {% for who, label in members %}
+          <tr><td>{{ label }}</td><td style="text-align:right;">{{ credits_end.get(who, 0) }}</td></tr>
+        {% endfor %}
+      </tbody>
+    </table>
+  </div>
+{% endblock %}
+"""
+
+@calendarbp.route("/calendar")
+@login_required
+def month_view():
+    db = get_db()
+    multi = _is_multi_mode(db)
+    cid = session.get("carpool_id") if multi else None
+    db = get_db(cid)
+    first = _parse_month(request.args.get("month") or "")
+
+    if multi and not cid:
+        days, members, credits_end = {}, [], {}
+    else:
+        days, members, credits_end = month_plan(db, first, multi=multi, cid=cid)
+
+    from templates import BASE_TMPL
+    return render_template_string(
+        CALENDAR_TMPL,
+        BASE_TMPL=BASE_TMPL,
+        title=f"{first:%B %Y}",
+        prev_month=f"{_add_month(first, -1):%Y-%m}",
+        next_month=f"{_add_month(first, 1):%Y-%m}",
+        weeks=calendar.Calendar().monthdatescalendar(first.year, first.month),
+        days=days,
+        names=dict(members),
+        members=members,
+        credits_end=credits_end,
+        today=date.today(),
+        multi=multi,
+        weekday_names=WEEKDAYS,
+        member_weeks={who: member_week(db, cid, who, date.today()) for who, _label in members} if multi else {},
+        range_start=max(first, date.today()).isoformat(),
+        range_end=max(_add_month(first, 1) - timedelta(days=1), date.today()).isoformat(),
+        **get_navbar_context()
+    )
+
+@calendarbp.route("/calendar/bulk", methods=["POST"])
+@login_required
+def bulk_edit():
+    """
+    Set one member's role on every day (or weekday) of a date range, e.g. a
+    vacation. Days that already have that role are left alone; the rest are
+    written with one batched upsert in a single transaction.
+    """
+    db = get_db()
+    multi = _is_multi_mode(db)
+    cid = session.get("carpool_id") if multi else None
+    db = get_db(cid)
+    if multi and not cid:
+        flash("Select a NerdPool first.", "error")
+        return redirect(url_for("calendarbp.month_view"))
+
+    try:
+        start = datetime.strptime(request.form.get("start") or "", "%Y-%m-%d").date()
+        end = datetime.strptime(request.form.get("end") or "", "%Y-%m-%d").date()
+    except ValueError:
+        flash("Pick a start and end date.", "error")
+        return redirect(url_for("calendarbp.month_view"))
+    back = redirect(url_for("calendarbp.month_view", month=f"{start:%Y-%m}"))
+
+    role = request.form.get("role")
+    if role not in ROLE_CHOICES:
+        return ("Bad role value", 400)
+    if end < start:
+        flash("End date is before the start date.", "error")
+        return back
+    if (end - start).days >= BULK_MAX_DAYS:
+        flash(f"Ranges are limited to {BULK_MAX_DAYS} days.", "error")
+        return back
+    if not can_edit_day(start):
+        flash(locked_message(start), "error")
+        return back
+
+    who = request.form.get("who", "")
+    if multi:
+        row = db.execute(
+            "SELECT user_id AS who, display_name AS label FROM carpool_memberships WHERE carpool_id=? AND user_id=? AND active=1",
+            (cid, int(who) if who.isdigit() else None)
+        ).fetchone()
+        current = db.execute(
+            "SELECT day, role FROM entries WHERE carpool_id=? AND user_id=? AND day >= ? AND day <= ?",
+            (cid, row["who"] if row else None, start.isoformat(), end.isoformat())
+        ).fetchall()
+    else:
+        row = db.execute("SELECT key AS who, name AS label FROM members WHERE key=? AND active=1", (who,)).fetchone()
+        current = db.execute(
+            "SELECT day, role FROM entries WHERE member_key=? AND day >= ? AND day <= ?",
+            (who, start.isoformat(), end.isoformat())
+        ).fetchall()
+    if not row:
+        flash("Not an active member of this NerdPool.", "error")
+        return back
+
+    weekdays_only = bool(request.form.get("weekdays"))
+    current = {r["day"][:10]: r["role"] for r in current}
+    if multi:
+        # Days the member's weekly pattern already covers need no row either
+        for (day, who), role in pattern_roles(load_patterns(db, cid), start, end + timedelta(days=1)).items():
+            if who == row["who"]:
+                current.setdefault(day, role)
+    rows = []
+    d = start
+    while d <= end:
+        # Members without an entry are Riders by default
+        if not (weekdays_only and d.weekday() >= 5) and current.get(d.isoformat(), "R") != role:
+            rows.append((d, row["who"], role))
+        d += timedelta(days=1)
+
+    save_entries(db, rows, multi=multi, cid=cid)
+    flash(f"Set {row['label']} to {ROLE_LABELS[role]} on {len(rows)} day(s).")
+    return back
+
+@calendarbp.route("/calendar/pattern", methods=["POST"])
+@login_required
+def save_pattern():
+    """Replace the weekly pattern of every member whose week changed, from `start` on."""
+    db = get_db()
+    cid = session.get("carpool_id") if _is_multi_mode(db) else None
+    if not cid:
+        flash("Select a NerdPool first.", "error")
+        return redirect(url_for("calendarbp.month_view"))
+    db = get_db(cid)
+    try:
+        start = datetime.strptime(request.form.get("start") or "", "%Y-%m-%d").date()
+    except ValueError:
+        flash("Pick a start date.", "error")
+        return redirect(url_for("calendarbp.month_view"))
+    if not can_edit_day(start):
+        flash(locked_message(start), "error")
+        return redirect(url_for("calendarbp.month_view"))
+
+    members = db.execute(
+        "SELECT user_id FROM carpool_memberships WHERE carpool_id=? AND active=1", (cid,)
+    ).fetchall()
+    changed = 0
+    for m in members:
+        week = {}
+        for wd in range(7):
+            role = request.form.get(f"p_{m['user_id']}_{wd}") or ""
+            if role and role not in ROLE_CHOICES:
+                return ("Bad role value", 400)
+            if role:
+                week[wd] = role
+        if week != member_week(db, cid, m["user_id"], start):
+            set_member_week(db, cid, m["user_id"], week, start)
+            changed += 1
+
+    flash(f"Weekly pattern saved for {changed} member(s)." if changed else "No changes to save.")
+    return redirect(url_for("calendarbp.month_view", month=f"{start:%Y-%m}"))
@@ -1,8 +1,12 @@
 # routes_carpools.py
-from flask import Blueprint, render_template_string, request, redirect, url_for, session, flash, abort
+from datetime import date, timedelta
+from flask import Blueprint, render_template_string, request, redirect, url_for, session, flash, abort, current_app
 from auth import login_required
 from db import get_db
-from template_helpers import get_navbar_context
+from template_helpers import get_navbar_context, invalidate_carpool_options
+from schedule_patterns import end_patterns
+from purge import schedule_carpool_delete, kick
+from admin_lists import memberships_page
 
 carpoolsbp = Blueprint("carpoolsbp", __name__, url_prefix="/carpools")
 
@@ -33,7 +37,7 @@ def pick():
         options = [{"id": r["id"], "name": r["name"]} for r in rows]
         if request.method == "POST":
             cid = request.form.get("carpool_id")
-            row = db.execute("SELECT id, name FROM carpools WHERE id=?", (cid,)).fetchone()
+            row = db.execute("SELECT id, name FROM carpools WHERE id=? AND deleted_at IS NULL", (cid,)).fetchone()
             if row:
                 session["carpool_id"] = int(row["id"])
                 session["carpool_name"] = row["name"]
@@ -112,32 +116,30 @@ def admin():
             """)
             db.execute("INSERT OR IGNORE INTO carpools(name, active) VALUES (?, 1)", (name,))
             db.commit()
+            invalidate_carpool_options(db)
             flash(f"Carpool '{name}' created.", "info")
             return redirect(url_for("carpoolsbp.admin"))
             
         elif action == "toggle_active":
             cid = int(request.form.get("carpool_id") or 0)
-            row = db.execute("SELECT active FROM carpools WHERE id=?", (cid,)).fetchone()
+            row = db.execute("SELECT active FROM carpools WHERE id=? AND deleted_at IS NULL", (cid,)).fetchone()
             if row:
                 new_val = 0 if row["active"] else 1
                 db.execute("UPDATE carpools SET active=? WHERE id=?", (new_val, cid))
                 db.commit()
+                invalidate_carpool_options(db)
                 flash("Carpool status updated.", "info")
             return redirect(url_for("carpoolsbp.admin"))
 
         elif action == "delete":
             cid = int(request.form.get("carpool_id") or 0)
-            print(f"DEBUG: Attempting to delete carpool {cid}")
-            # Cascade delete
-            db.execute("DELETE FROM user_carpool_prefs WHERE carpool_id=?", (cid,))
-            db.execute("DELETE FROM carpool_memberships WHERE carpool_id=?", (cid,))
-            db.execute("DELETE FROM entries WHERE carpool_id=?", (cid,))
-            db.execute("DELETE FROM carpools WHERE id=?", (cid,))
-            db.commit()
-            flash("Carpool deleted.", "info")
+            # Hidden now; its entries are purged in the background
+            if schedule_carpool_delete(db, cid):
+                kick(current_app._get_current_object())
+                flash("Carpool deleted. Its entries are being purged (see Admin > Deletions).", "info")
             return redirect(url_for("carpoolsbp.admin"))
 
-    rows = db.execute("SELECT id, name, active FROM carpools ORDER BY name").fetchall() if _has_table(db,"carpools") else []
+    rows = db.execute("SELECT id, name, active FROM carpools WHERE deleted_at IS NULL ORDER BY name").fetchall() if _has_table(db,"carpools") else []
     tmpl = """
     {% extends "BASE_TMPL" %}{% block content %}
       <h3>NerdPools</h3>
@@ -222,7 +224,9 @@ def memberships():
             flash("All fields required.", "error")
             return redirect(url_for("carpoolsbp.memberships"))
 
-        u = db.execute("SELECT id FROM users WHERE LOWER(username)=LOWER(?)", (username,)).fetchone()
+        u = db.execute(
+            "SELECT id FROM users WHERE username = ? COLLATE NOCASE AND deleted_at IS NULL", (username,)
+        ).fetchone()
         if not u:
             flash("User not found. Create user under Admin > Users.", "error")
             return redirect(url_for("carpoolsbp.memberships"))
@@ -232,18 +236,19 @@ def memberships():
             VALUES (?,?,?,?,?)
         """, (carpool_id, u["id"], member_key, display_name, active))
         db.commit()
+        if not active:
+            # Inactive members stop following their weekly pattern from today
+            end_patterns(get_db(carpool_id), carpool_id, u["id"], date.today() - timedelta(days=1))
+        invalidate_carpool_options(db, u["id"])
         flash("Membership saved.", "info")
         return redirect(url_for("carpoolsbp.memberships"))
 
-    carpools = db.execute("SELECT id, name FROM carpools ORDER BY name").fetchall()
-    users = db.execute("SELECT id, username FROM users ORDER BY username").fetchall()
-    memberships = db.execute("""
-        SELECT cm.id, c.name AS carpool, u.username, cm.member_key, cm.display_name, cm.active
-        FROM carpool_memberships cm
-        JOIN carpools c ON c.id=cm.carpool_id
-        JOIN users u ON u.id=cm.user_id
-        ORDER BY c.name, u.username
-    """).fetchall()
+    carpools = db.execute("SELECT id, name FROM carpools WHERE deleted_at IS NULL ORDER BY name").fetchall()
+    q = (request.args.get("q") or "").strip()
+    carpool_filter = request.args.get("carpool", type=int)
+    memberships, next_page = memberships_page(
+        db, q, carpool_filter, request.args.get("after"), request.args.get("after_id")
+    )
 
     tmpl = """
     {% extends "BASE_TMPL" %}{% block content %}
@@ -259,7 +264,9 @@ def memberships():
           </div>
           <div class="col-auto">
             <label class="form-label">Username
-              <input class="form-control" name="username" placeholder="Christian">
+              <input class="form-control" name="username" placeholder="Christian" list="user_suggestions" autocomplete="off"
+                     data-typeahead="{{ url_for('adminbp.admin_user_suggest') }}">
+              <datalist id="user_suggestions"></datalist>
             </label>
           </div>
           <div class="col-auto">
@@ -282,15 +289,36 @@ def memberships():
         </div>
       </form>
 
+      <form method="get" class="row g-2 align-items-end mb-2">
+        <div class="col-auto">
+          <select class="form-select" name="carpool">
+            <option value="">(all pools)</option>
+            {% for c in carpools %}<option value="{{c['id']}}" {{ 'selected' if carpool_filter == c['id'] }}>{{c['name']}}</option>{% endfor %}
+          </select>
+        </div>
+        <div class="col-auto">
+          <input class="form-control" name="q" value="{{ q }}" placeholder="Name or username starts with...">
+        </div>
+        <div class="col-auto">
+          <button class="btn btn-primary">Search</button>
+          {% if q or carpool_filter or request.args.get('after') %}<a class="btn btn-secondary" href="{{ url_for('carpoolsbp.memberships') }}">Reset</a>{% endif %}
+        </div>
+      </form>
+
       <table class="table table-sm">
         <thead><tr><th>Carpool</th><th>User</th><th>Key</th><th>Name</th><th>Active</th></tr></thead>
         <tbody>
         {% for m in memberships %}
           <tr><td>{{m['carpool']}}</td><td>{{m['username']}}</td><td>{{m['member_key']}}</td><td>{{m['display_name']}}</td><td>{{'Yes' if m['active'] else 'No'}}</td></tr>
         {% endfor %}
+        {% if not memberships %}<tr><td colspan="5" class="muted">No memberships</td></tr>{% endif %}
         </tbody>
       </table>
+      {% if next_page %}
+        <a class="btn btn-secondary" href="{{ url_for('carpoolsbp.memberships', q=q or None, carpool=carpool_filter, **next_page) }}">Next page</a>
+      {% endif %}
     {% endblock %}
     """
     from templates import BASE_TMPL
-    return render_template_string(tmpl, BASE_TMPL=BASE_TMPL, carpools=carpools, users=users, memberships=memberships, **get_navbar_context())
+    return render_template_string(tmpl, BASE_TMPL=BASE_TMPL, carpools=carpools, memberships=memberships,
+                                  q=q, carpool_filter=carpool_filter, next_page=next_page, **get_navbar_context())
@@ -0,0 +1,139 @@
+# routes_dashboard.py
+"""
+Dashboard: the user's standing in every carpool on one page.
+
+Instead of a /switch + /today round trip per carpool, all carpools are read
+together: balances before today come from credit_bases() (cached per
+carpool version; misses share one entries query), and today's entries,
+memberships and weekly patterns are one query each across all carpools
+(per database when carpools are sharded).
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from flask import Blueprint, render_template_string
+from flask_login import current_user
+
+from db import get_db, carpool_dbs
+from auth import login_required
+from template_helpers import get_navbar_context, get_user_carpools
+from schedule_patterns import load_patterns_by_carpool, pattern_roles
+from routes_today import _is_multi_mode, credit_bases, day_credits, pick_driver
+
+dashboardbp = Blueprint("dashboardbp", __name__)
+
+def carpool_dashboard(db, user_id: int, day: date | None = None):
+    """
+    One row per active carpool of the user:
+    {id, name, role, credits, driver, driver_name, explicit, no_carpool}.
+    """
+    day = day or date.today()
+    carpools = get_user_carpools(user_id)
+    cids = [c["id"] for c in carpools]
+    if not cids:
+        return []
+    marks = ",".join("?" * len(cids))
+
+    members = defaultdict(list)  # cid -> [(user_id, display_name)] in rotation order
+    for r in db.execute(f"""
+        SELECT carpool_id, user_id, display_name FROM carpool_memberships
+        WHERE carpool_id IN ({marks}) AND active=1
+        ORDER BY carpool_id, display_name
+    """, tuple(cids)).fetchall():
+        members[r["carpool_id"]].append((r["user_id"], r["display_name"]))
+
+    existing = defaultdict(dict)  # cid -> {user_id: role} for `day`
+    for conn, group in carpool_dbs(cids):
+        for r in conn.execute(f"""
+            SELECT carpool_id, user_id, role FROM entries
+            WHERE carpool_id IN ({",".join("?" * len(group))}) AND day LIKE ?
+        """, (*group, f"{day.isoformat()}%")).fetchall():
+            existing[r["carpool_id"]][r["user_id"]] = r["role"]
+        for cid, patterns in load_patterns_by_carpool(conn, group).items():
+            for (_day, who), role in pattern_roles(patterns, day, day + timedelta(days=1)).items():
+                existing[cid].setdefault(who, role)
+
+    bases = credit_bases(db, cids, day)
+    today = date.today()
+    out = []
+    for c in carpools:
+        cid = c["id"]
+        names = dict(members[cid])
+        base_credits, last_driver = bases[cid]
+        credits = dict(base_credits)
+        if day <= today:
+            for who, n in day_credits(existing[cid]).items():
+                credits[who] = credits.get(who, 0) + n
+
+        roles = {who: existing[cid].get(who, "R") for who in names}
+        active = [w for w, r in roles.items() if r != "O"]
+        explicit = next((w for w, r in roles.items() if r == "D"), None)
+        no_carpool = len(active) < 2
+        driver = None
+        if not no_carpool:
+            driver = explicit if explicit is not None else pick_driver(active, base_credits, last_driver, list(names))
+        out.append({
+            "id": cid,
+            "name": c["name"],
+            "role": roles.get(user_id),
+            "credits": credits.get(user_id, 0),
+            "driver": driver,
+            "driver_name": names.get(driver) if driver is not None else None,
+            "explicit": explicit is not None,
+            "no_carpool": no_carpool,
+        })
+    return out
+
+DASHBOARD_TMPL = """
+{% extends "BASE_TMPL" %}{% block content %}
+  <div class="card">
+    <h3>My NerdPools &mdash; {{ today }}</h3>
+    <div class="table-scroll">
+      <table class="table">
+        <thead>
+          <tr><th>NerdPool</th><th>My status</th><th>Driver</th><th style="text-align:right;">My credits</th><th></th></tr>
+        </thead>
+        <tbody>
+          {% for r in rows %}
+            <tr>
+              <td>{{ r.name }}</td>
+              <td>{{ role_labels.get(r.role, '-') }}</td>
+              <td>
+                {% if r.no_carpool %}<span class="muted">No NerdPool today</span>
+                {% elif r.explicit %}<strong>{{ r.driver_name }}</strong>
+                {% elif r.driver_name %}<span class="muted">{{ r.driver_name }}?</span>{% endif %}
+              </td>
+              <td style="text-align:right;">{{ r.credits }}</td>
+              <td style="text-align:right;">
+                <form method="post" action="{{ url_for('todaybp.switch') }}" style="display:inline;">
+                  <input type="hidden" name="carpool_id" value="{{ r.id }}">
+                  <button class="btn btn-sm btn-secondary">Open</button>
+                </form>
+              </td>
+            </tr>
+          {% endfor %}
+          {% if not rows %}
+            <tr><td colspan="5" class="muted">You are not in any active NerdPool.</td></tr>
+          {% endif %}
+        </tbody>
+      </table>
+    </div>
+    <div class="muted" style="font-size:.85rem;"><strong>Name</strong> = driver set, <span class="muted">Name?</span> = suggested</div>
+  </div>
+{% endblock %}
+"""
+
+@dashboardbp.route("/dashboard")
+@login_required
+def dashboard():
+    db = get_db()
+    rows = carpool_dashboard(db, int(current_user.id)) if _is_multi_mode(db) else []
+    from templates import BASE_TMPL
+    return render_template_string(
+        DASHBOARD_TMPL,
+        BASE_TMPL=BASE_TMPL,
+        rows=rows,
+        today=date.today().isoformat(),
+        role_labels={"D": "Driver", "R": "Rider", "O": "Off"},
+        **get_navbar_context()
+    )
@@ -1,11 +1,14 @@
 # routes_history.py
 from flask import Blueprint, render_template_string, request, abort
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from collections import defaultdict
 
 from db import get_db
 from auth import login_required
 from templates import STATS_TMPL
+from template_helpers import get_navbar_context
+from schedule_patterns import load_patterns, overlay
+from archive import archived_rows, archived_role_counts
 
 historybp = Blueprint("historybp", __name__)
 
@@ -44,6 +47,7 @@ def history():
     db = get_db()
     multi = _is_multi_mode(db, session)
     cid = session.get("carpool_id") if multi else None
+    db = get_db(cid)
 
     start  = (request.args.get("start") or "").strip()
     end    = (request.args.get("end") or "").strip()
@@ -63,6 +67,10 @@ def history():
             FROM entries
             WHERE carpool_id=?
         """, (cid,)).fetchall()
+        # Archived years are only opened when the range reaches them
+        rows = list(rows) + archived_rows(db, cid, start_d, end_d + timedelta(days=1) if end_d else None)
+        # Weekly patterns count as entries up to today
+        rows = overlay(rows, load_patterns(db, cid), None, date.today() + timedelta(days=1))
     else:
         members = db.execute("""
             SELECT key AS who, name AS label
@@ -88,17 +96,6 @@ def history():
             "roles": {who: role_map.get(who, "R") for who, _label in headers}
         })
 
-    carpool_options = []
-    if multi:
-        uid = session.get("user_id")
-        carpool_options = db.execute("""
-            SELECT c.id, c.name
-            FROM carpools c
-            JOIN carpool_memberships cm ON cm.carpool_id=c.id
-            WHERE cm.user_id=? AND cm.active=1
-            ORDER BY c.name
-        """, (uid,)).fetchall()
-
     tmpl = """
     {% extends "BASE_TMPL" %}{% block content %}
       <h3>History</h3>
@@ -123,6 +120,9 @@ def history():
         <div class="col-auto">
           <button class="btn btn-primary">Filter</button>
           <a class="btn btn-secondary" href="{{ url_for('historybp.history') }}">Reset</a>
+          {% if session.get('carpool_id') %}
+            <a class="btn btn-secondary" href="{{ url_for('apibp.export', format='csv', start=request.args.get('start',''), end=request.args.get('end','')) }}">Export CSV</a>
+          {% endif %}
         </div>
       </form>
 
@@ -163,7 +163,7 @@ def history():
         headers=headers,
         rows=out_rows,
         multi=multi,
-        carpool_options=carpool_options
+        **get_navbar_context()
     )
 
 @historybp.route("/stats/<who>")
@@ -183,6 +183,7 @@ def member_stats(who):
     if multi and is_int:
         cid = session.get("carpool_id")
         user_id = int(who)
+        db = get_db(cid)
         counts = db.execute("""
             SELECT role, COUNT(*) AS n
             FROM entries
@@ -190,13 +191,16 @@ def member_stats(who):
             GROUP BY role
         """, (cid, user_id)).fetchall()
         counts = {r["role"]: r["n"] for r in counts}
+        for role, n in archived_role_counts(db, cid, user_id).items():
+            counts[role] = counts.get(role, 0) + n
         row = db.execute("""
             SELECT display_name FROM carpool_memberships
             WHERE carpool_id=? AND user_id=?
         """, (cid, user_id)).fetchone()
         if not row: abort(404)
         return render_template_string(
-            STATS_TMPL, member_key=f"u{user_id}", member_name=row["display_name"], counts=counts
+            STATS_TMPL, member_key=f"u{user_id}", member_name=row["display_name"], counts=counts,
+            **get_navbar_context()
         )
 
     member_key = who.upper()
@@ -207,4 +211,6 @@ def member_stats(who):
         (member_key,)
     ).fetchall()
     counts = {r["role"]: r["n"] for r in counts}
-    return render_template_string(STATS_TMPL, member_key=member_key, member_name=row["name"], counts=counts)
+    return render_template_string(
+        STATS_TMPL, member_key=member_key, member_name=row["name"], counts=counts, **get_navbar_context()
+    )
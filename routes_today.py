@@ -1,13 +1,22 @@
 # routes_today.py
-from flask import Blueprint, request, render_template_string, redirect, url_for, session, flash
+from flask import (Blueprint, request, render_template_string, redirect, url_for, session, flash, jsonify,
+                   Response, stream_with_context)
 from flask_login import current_user
 from datetime import date, datetime, timedelta
 from collections import defaultdict
+import json
+import threading
+import time
 
-from constants import ROLE_CHOICES
+from constants import ROLE_CHOICES, LIVE_MAX_STREAMS
 from templates import TODAY_TMPL
-from db import get_db
+from db import get_db, carpool_dbs, transaction
+from entry_store import entries_changed, carpool_version, carpool_versions, changes_since, log_upserts
+from cache import TTLCache
+from schedule_patterns import load_patterns, load_patterns_by_carpool, pattern_roles, overlay
+from archive import credit_start, archived_roles, is_archived
 from auth import login_required
+from template_helpers import get_navbar_context, get_user_carpools
 
 todaybp = Blueprint("todaybp", __name__)
 
@@ -82,62 +91,90 @@ def compute_credits_all(rows, who_field: str = "who", cutoff_date: date = None):
         if cutoff_date is not None and d > cutoff_date:
             continue
 
-        roles = by_day[d]
-        drivers = [w for w, r in roles.items() if r == "D"]
-        riders = [w for w, r in roles.items() if r == "R"]
-        
-        # Rule: ONLY days with exactly 1 driver will be used to calc credits.
-        if len(drivers) != 1:
-            continue
-            
-        for drv in drivers:
-            credits[drv] += len(riders)
-        for r in riders:
-            credits[r] -= 1
+        for who, n in day_credits(by_day[d]).items():
+            credits[who] += n
     return dict(credits)
+
+def day_credits(roles: dict) -> dict:
+    """Credit change from one day's saved roles {who: role}."""
+    drivers = [w for w, r in roles.items() if r == "D"]
+    riders = [w for w, r in roles.items() if r == "R"]
+
+    # Rule: ONLY days with exactly 1 driver will be used to calc credits.
+    if len(drivers) != 1:
+        return {}
+
+    out = {r: -1 for r in riders}
+    out[drivers[0]] = len(riders)
+    return out
 # ----------------------------------------------
 
-def find_last_driver(db, *, multi: bool, cid: int | None, cutoff_day: date):
-    if multi:
-        rows = db.execute(
-            "SELECT day, user_id AS who, role FROM entries WHERE carpool_id=?",
-            (cid,)
-        ).fetchall()
-    else:
-        rows = db.execute("SELECT day, member_key AS who, role FROM entries").fetchall()
+# Balances before a day only move when an earlier day is edited, so they are
+# kept per (carpool, day) and checked against the carpool's entries version.
+_credit_base_cache = TTLCache(maxsize=256, ttl=600.0)
 
+def _base_from_rows(rows):
     last_day, last_driver = None, None
     for e in rows:
-        d = day_to_date(e["day"])
-        if d >= cutoff_day:
-            continue
-        if e["role"] == "D" and (last_day is None or d > last_day):
-            last_day, last_driver = d, e["who"]
-    return last_driver
-
-def suggest_driver(db, selected_day: date, roles_today: dict, *, multi: bool, cid: int | None):
-    active = [w for w, r in roles_today.items() if r != "O"]
-    if len(active) < 2:
-        return None
+        if e["role"] == "D":
+            d = day_to_date(e["day"])
+            if last_day is None or d > last_day:
+                last_day, last_driver = d, e["who"]
+    return compute_credits_all(rows, who_field="who"), last_driver
 
+def credit_base(db, selected_day: date, *, multi: bool, cid: int | None):
+    """
+    (credits, last_driver) over all entries strictly before `selected_day`:
+    the balances the suggestion ranks by and the rotation anchor.
+    """
     if multi:
-        rows_prev = db.execute(
-            "SELECT day, user_id AS who, role FROM entries WHERE carpool_id=?",
-            (cid,)
-        ).fetchall()
-    else:
-        rows_prev = db.execute("SELECT day, member_key AS who, role FROM entries").fetchall()
-    rows_prev = [r for r in rows_prev if day_to_date(r["day"]) < selected_day]
-
-    credits = compute_credits_all(rows_prev, who_field="who")
-    filtered = {w: credits.get(w, 0) for w in active}
-    min_score = min(filtered.values()) if filtered else 0
-    candidates = [w for w, sc in filtered.items() if sc == min_score]
-    if len(candidates) == 1:
-        return candidates[0]
-
-    last_drv = find_last_driver(db, multi=multi, cid=cid, cutoff_day=selected_day)
+        return credit_bases(db, [int(cid)], selected_day)[int(cid)]
+    rows = db.execute("SELECT day, member_key AS who, role FROM entries").fetchall()
+    return _base_from_rows([r for r in rows if day_to_date(r["day"]) < selected_day])
 
+def credit_bases(db, cids, selected_day: date) -> dict:
+    """
+    credit_base() for several carpools at once: {carpool_id: (credits, last_driver)}.
+    One versions lookup; cache misses share one entries query and one
+    patterns query per database (`db` is ignored for sharded carpools). Archived years come from their credit checkpoints.
+    """
+    day_iso = selected_day.isoformat()
+    versions = carpool_versions(cids)
+    out, misses = {}, []
+    for cid in versions:
+        hit = _credit_base_cache.get((cid, day_iso))
+        if hit is not None and hit[0] == versions[cid]:
+            out[cid] = hit[1]
+        else:
+            misses.append(cid)
+    if not misses:
+        return out
+
+    for db, group in carpool_dbs(misses):
+        marks = ",".join("?" * len(group))
+        rows_by_cid = defaultdict(list)
+        for r in db.execute(
+            f"SELECT carpool_id, day, user_id AS who, role FROM entries WHERE carpool_id IN ({marks}) AND day < ?",
+            (*group, day_iso)
+        ).fetchall():
+            rows_by_cid[r["carpool_id"]].append(r)
+        patterns = load_patterns_by_carpool(db, group)
+        for cid in group:
+            start_credits, start_last, lo, archived = credit_start(db, cid, selected_day)
+            rows = overlay(archived + rows_by_cid[cid], patterns.get(cid, []), lo, selected_day)
+            credits, last = _base_from_rows(rows)
+            for who, n in start_credits.items():
+                credits[who] = credits.get(who, 0) + n
+            out[cid] = (credits, last if last is not None else start_last)
+            _credit_base_cache.set((cid, day_iso), (versions[cid], out[cid]))
+    return out
+
+def _keep_credit_base(db, cid: int, selected_day: date, base):
+    """After an edit on `selected_day` itself, its base is still valid under the new version."""
+    _credit_base_cache.set((cid, selected_day.isoformat()), (carpool_version(db, cid), base))
+
+def rotation_order(db, *, multi: bool, cid: int | None):
+    """Active members in driver-rotation order (used to break credit ties)."""
     if multi:
         rows = db.execute(
             """
@@ -148,13 +185,26 @@ def suggest_driver(db, selected_day: date, roles_today: dict, *, multi: bool, ci
             """,
             (cid,)
         ).fetchall()
-        order = [r["who"] for r in rows if r["who"] in active]
     else:
         rows = db.execute(
             "SELECT key AS who, name AS display_name FROM members WHERE active=1 ORDER BY name"
         ).fetchall()
-        order = [r["who"] for r in rows if r["who"] in active]
+    return [r["who"] for r in rows]
 
+def pick_driver(active: list, credits: dict, last_drv, rotation: list):
+    """
+    Lowest credits among `active`; ties go to the next member in `rotation`
+    after the last driver.
+    """
+    if len(active) < 2:
+        return None
+    filtered = {w: credits.get(w, 0) for w in active}
+    min_score = min(filtered.values()) if filtered else 0
+    candidates = [w for w, sc in filtered.items() if sc == min_score]
+    if len(candidates) == 1:
+        return candidates[0]
+
+    order = [w for w in rotation if w in active]
     if last_drv in order:
         start = (order.index(last_drv) + 1) % len(order)
         for i in range(len(order)):
@@ -167,6 +217,172 @@ def suggest_driver(db, selected_day: date, roles_today: dict, *, multi: bool, ci
             return w
     return sorted(candidates, key=lambda x: str(x))[0] if candidates else None
 
+def suggest_driver(db, selected_day: date, roles_today: dict, *, multi: bool, cid: int | None):
+    active = [w for w, r in roles_today.items() if r != "O"]
+    if len(active) < 2:
+        return None
+
+    credits, last_drv = credit_base(db, selected_day, multi=multi, cid=cid)
+    return pick_driver(active, credits, last_drv, rotation_order(db, multi=multi, cid=cid))
+
+def load_day(db, *, multi: bool, cid: int | None, selected_day: date):
+    """
+    Active members of the carpool and their roles for one day.
+    Returns (members, existing, roles_form): `existing` holds saved entries
+    and weekly-pattern roles, `roles_form` fills in the default Rider for
+    everyone else.
+    """
+    if multi:
+        members = db.execute("""
+            SELECT cm.user_id, cm.member_key, cm.display_name
+            FROM carpool_memberships cm
+            WHERE cm.carpool_id=? AND cm.active=1
+            ORDER BY cm.display_name
+        """, (cid,)).fetchall()
+        existing = archived_roles(db, cid, selected_day)
+        if existing is None:
+            existing = {
+                r["user_id"]: r["role"]
+                for r in db.execute(
+                    "SELECT user_id, role FROM entries WHERE carpool_id=? AND day LIKE ?",
+                    (cid, f"{selected_day.isoformat()}%",)
+                ).fetchall()
+            }
+        # Weekly patterns fill in members without an explicit entry
+        for (_day, who), role in pattern_roles(load_patterns(db, cid), selected_day, selected_day + timedelta(days=1)).items():
+            existing.setdefault(who, role)
+        roles_form = {m["user_id"]: existing.get(m["user_id"], "R") for m in members}
+    else:
+        members = db.execute(
+            "SELECT key AS member_key, name AS display_name FROM members WHERE active=1 ORDER BY key"
+        ).fetchall()
+        existing = {
+            r["member_key"]: r["role"]
+            for r in db.execute(
+                "SELECT member_key, role FROM entries WHERE day LIKE ?",
+                (f"{selected_day.isoformat()}%",)
+            ).fetchall()
+        }
+        roles_form = {m["member_key"]: existing.get(m["member_key"], "R") for m in members}
+    return members, existing, roles_form
+
+def members_context(members, *, multi: bool):
+    if multi:
+        return [{"user_id": m["user_id"], "member_key": m["member_key"], "display_name": m["display_name"]} for m in members]
+    return [{"key": m["member_key"], "name": m["display_name"]} for m in members]
+
+def _member_name(db, who, *, multi: bool, cid: int | None) -> str:
+    if multi:
+        name = db.execute(
+            "SELECT display_name FROM carpool_memberships WHERE carpool_id=? AND user_id=?",
+            (cid, who)
+        ).fetchone()
+        return name["display_name"] if name else str(who)
+    name = db.execute("SELECT name FROM members WHERE key=?", (who,)).fetchone()
+    return name["name"] if name else str(who)
+
+def day_summary(db, selected_day: date, existing: dict, roles_form: dict, *, multi: bool, cid: int | None):
+    """
+    Credits and the driver callout for one day, shared by the Today page and
+    the JSON API. Returns {credits, suggestion, suggestion_name,
+    driver_is_explicit, no_carpool}.
+    """
+    # Credits calculation:
+    # - Balances before the selected day, plus the selected day's own entries so
+    #   the user sees the effect of their changes immediately.
+    # - Future days (calendar) never count, so a future day adds nothing.
+    base_credits, _last = credit_base(db, selected_day, multi=multi, cid=cid)
+    credits = dict(base_credits)
+    if selected_day <= date.today():
+        for who, n in day_credits(existing).items():
+            credits[who] = credits.get(who, 0) + n
+
+    active = [k for k, v in roles_form.items() if v != "O"]
+    no_carpool_day = len(active) < 2
+
+    explicit_driver = next((k for k, v in roles_form.items() if v == "D"), None)
+    suggestion = None
+    driver_is_explicit = False
+
+    if not no_carpool_day:
+        if explicit_driver is not None:
+            suggestion = explicit_driver
+            driver_is_explicit = True
+        else:
+            suggestion = suggest_driver(db, selected_day, roles_form, multi=multi, cid=cid)
+
+    return {
+        "credits": credits,
+        "suggestion": suggestion,
+        "suggestion_name": _member_name(db, suggestion, multi=multi, cid=cid) if suggestion is not None else None,
+        "driver_is_explicit": driver_is_explicit,
+        "no_carpool": no_carpool_day,
+    }
+
+def can_edit_day(selected_day: date) -> bool:
+    """Days older than a week are locked for everyone but admins; archived days for everyone."""
+    if selected_day <= (date.today() - timedelta(days=7)) and not session.get("is_admin"):
+        return False
+    cid = session.get("carpool_id")
+    return not (cid and is_archived(get_db(cid), cid, selected_day))
+
+def locked_message(selected_day: date) -> str:
+    cid = session.get("carpool_id")
+    if cid and is_archived(get_db(cid), cid, selected_day):
+        return f"{selected_day.year} is archived and read-only."
+    return "Editing locked for days older than 7 days (admin only)."
+
+def save_entries(db, rows, *, multi: bool, cid: int | None):
+    """
+    Upsert (day, who, role) rows with one batched statement in a single
+    transaction; derived data (ride stats, versions) is refreshed once.
+    """
+    if not rows:
+        return
+    username = session.get('username', 'unknown')
+    with transaction(db):
+        if multi:
+            # Fetch the actual member_keys from carpool_memberships
+            keys = {
+                r["user_id"]: r["member_key"]
+                for r in db.execute(
+                    "SELECT user_id, member_key FROM carpool_memberships WHERE carpool_id=?", (cid,)
+                ).fetchall()
+            }
+            log_upserts(db, cid, rows, username)
+            db.executemany(
+                """
+                INSERT INTO entries(carpool_id, day, user_id, member_key, role, update_user, update_ts, update_date)
+                VALUES(?,?,?,?,?,?,CURRENT_TIMESTAMP, DATE('now'))
+                ON CONFLICT(carpool_id, day, user_id) DO UPDATE SET
+                  role=excluded.role,
+                  member_key=excluded.member_key,
+                  update_user=excluded.update_user,
+                  update_ts=CURRENT_TIMESTAMP,
+                  update_date=DATE('now')
+                """,
+                [(cid, day.isoformat(), user_id, keys.get(user_id) or f"u{user_id}", role, username)
+                 for day, user_id, role in rows]
+            )
+            entries_changed(db, cid, sorted({day for day, _who, _role in rows}))
+        else:
+            db.executemany(
+                """
+                INSERT INTO entries(day, member_key, role, update_user, update_ts, update_date)
+                VALUES(?,?,?,?,CURRENT_TIMESTAMP, DATE('now'))
+                ON CONFLICT(day, member_key) DO UPDATE SET
+                  role=excluded.role,
+                  update_user=excluded.update_user,
+                  update_ts=CURRENT_TIMESTAMP,
+                  update_date=DATE('now')
+                """,
+                [(day.isoformat(), member_key, role, username) for day, member_key, role in rows]
+            )
+
+def save_roles(db, writes, *, multi: bool, cid: int | None, selected_day: date):
+    """Upsert (who, role) pairs for one day in a single transaction."""
+    save_entries(db, [(selected_day, who, role) for who, role in writes], multi=multi, cid=cid)
+
 @todaybp.route("/switch", methods=["POST"])
 @login_required
 def switch():
@@ -211,13 +427,8 @@ def today():
     cid = session.get("carpool_id") if multi else None
     if multi and not cid:
         # Auto-select first if available, else show empty state
-        first = db.execute("""
-            SELECT c.id, c.name
-            FROM carpools c
-            JOIN carpool_memberships cm ON cm.carpool_id=c.id
-            WHERE cm.user_id=? AND cm.active=1 AND c.active=1
-            ORDER BY c.name LIMIT 1
-        """, (uid,)).fetchone()
+        options = get_user_carpools(uid)
+        first = options[0] if options else None
         if first:
             session["carpool_id"] = int(first["id"])
             session["carpool_name"] = first["name"]
@@ -229,45 +440,22 @@ def today():
                 members=[], roles={}, credits={},
                 suggestion_name=None, driver_is_explicit=False,
                 can_edit=False, no_carpool=True,
-                multi=multi, carpool_options=[]
+                multi=multi, **get_navbar_context()
             )
+    db = get_db(cid)
+    # Read before the page's data, so the live stream resumes from here
+    live_version = carpool_version(db, cid) if multi else 0
 
     # Members + today's roles
-    if multi:
-        members = db.execute("""
-            SELECT cm.user_id, cm.member_key, cm.display_name
-            FROM carpool_memberships cm
-            WHERE cm.carpool_id=? AND cm.active=1
-            ORDER BY cm.display_name
-        """, (cid,)).fetchall()
-        existing = {
-            r["user_id"]: r["role"]
-            for r in db.execute(
-                "SELECT user_id, role FROM entries WHERE carpool_id=? AND day LIKE ?",
-                (cid, f"{selected_day.isoformat()}%",)
-            ).fetchall()
-        }
-        roles_form = {m["user_id"]: existing.get(m["user_id"], "R") for m in members}
-    else:
-        members = db.execute(
-            "SELECT key AS member_key, name AS display_name FROM members WHERE active=1 ORDER BY key"
-        ).fetchall()
-        existing = {
-            r["member_key"]: r["role"]
-            for r in db.execute(
-                "SELECT member_key, role FROM entries WHERE day LIKE ?",
-                (f"{selected_day.isoformat()}%",)
-            ).fetchall()
-        }
-        roles_form = {m["member_key"]: existing.get(m["member_key"], "R") for m in members}
+    members, existing, roles_form = load_day(db, multi=multi, cid=cid, selected_day=selected_day)
 
     # Lock old days
-    can_edit = not (selected_day <= (date.today() - timedelta(days=7)) and not session.get("is_admin"))
+    can_edit = can_edit_day(selected_day)
 
     # Save roles
     if request.method == "POST" and request.form.get("action") == "save_roles":
         if not can_edit:
-            flash("Editing locked for days older than 7 days (admin only).", "error")
+            flash(locked_message(selected_day), "error")
             return redirect(url_for("todaybp.today", day=selected_day.isoformat()))
 
         if multi:
@@ -287,125 +475,187 @@ def today():
             flash("No changes to save.")
             return redirect(url_for("todaybp.today", day=selected_day.isoformat()))
 
-        if multi:
-            for user_id, role in writes:
-                # Fetch the actual member_key from carpool_memberships
-                mk_row = db.execute(
-                    "SELECT member_key FROM carpool_memberships WHERE carpool_id=? AND user_id=?",
-                    (cid, user_id)
-                ).fetchone()
-                
-                if mk_row and mk_row["member_key"]:
-                    member_key = mk_row["member_key"]
-                else:
-                    member_key = f"u{user_id}"
-                
-                db.execute(
-                    """
-                    INSERT INTO entries(carpool_id, day, user_id, member_key, role, update_user, update_ts, update_date)
-                    VALUES(?,?,?,?,?,?,CURRENT_TIMESTAMP, DATE('now'))
-                    ON CONFLICT(carpool_id, day, user_id) DO UPDATE SET
-                      role=excluded.role,
-                      member_key=excluded.member_key,
-                      update_user=excluded.update_user,
-                      update_ts=CURRENT_TIMESTAMP,
-                      update_date=DATE('now')
-                    """,
-                    (cid, selected_day.isoformat(), user_id, member_key, role, session.get('username', 'unknown'))
-                )
-        else:
-            for member_key, role in writes:
-                db.execute(
-                    """
-                    INSERT INTO entries(day, member_key, role, update_user, update_ts, update_date)
-                    VALUES(?,?,?,?,CURRENT_TIMESTAMP, DATE('now'))
-                    ON CONFLICT(day, member_key) DO UPDATE SET
-                      role=excluded.role,
-                      update_user=excluded.update_user,
-                      update_ts=CURRENT_TIMESTAMP,
-                      update_date=DATE('now')
-                    """,
-                    (selected_day.isoformat(), member_key, role, session.get('username', 'unknown'))
-                )
-        db.commit()
+        save_roles(db, writes, multi=multi, cid=cid, selected_day=selected_day)
         flash("Saved.")
         return redirect(url_for("todaybp.today", day=selected_day.isoformat()))
 
-    # Credits calculation
-    # - For past/future dates: show credits BEFORE that day (matches CESpool)
-    # - For TODAY: include today's entries so changes are reflected immediately
-    if multi:
-        rows_prev = db.execute(
-            "SELECT day, user_id AS who, role FROM entries WHERE carpool_id=?",
-            (cid,)
-        ).fetchall()
-    else:
-        rows_prev = db.execute("SELECT day, member_key AS who, role FROM entries").fetchall()
-    
-    # Credits calculation:
-    # - Always include the selected day so the user sees the effect of their changes immediately.
-    # - compute_credits_all will internally filter out any days > date.today() (calendar future),
-    #   ensuring future plans don't affect the balance.
-    rows_filtered = [r for r in rows_prev if day_to_date(r["day"]) <= selected_day]
-    
-    credits = compute_credits_all(rows_filtered, who_field="who", cutoff_date=None)
-
-    active = [k for k, v in roles_form.items() if v != "O"]
-    no_carpool_day = len(active) < 2
-
-    explicit_driver = next((k for k, v in roles_form.items() if v == "D"), None)
-    suggestion_name = None
-    driver_is_explicit = False
-
-    if not no_carpool_day:
-        if explicit_driver is not None:
-            if multi:
-                name = db.execute(
-                    "SELECT display_name FROM carpool_memberships WHERE carpool_id=? AND user_id=?",
-                    (cid, explicit_driver)
-                ).fetchone()
-                suggestion_name = (name["display_name"] if name else str(explicit_driver))
-            else:
-                name = db.execute("SELECT name FROM members WHERE key=?", (explicit_driver,)).fetchone()
-                suggestion_name = (name["name"] if name else str(explicit_driver))
-            driver_is_explicit = True
-        else:
-            pick = suggest_driver(db, selected_day, roles_form, multi=multi, cid=cid)
-            if pick is not None:
-                if multi:
-                    name = db.execute(
-                        "SELECT display_name FROM carpool_memberships WHERE carpool_id=? AND user_id=?",
-                        (cid, pick)
-                    ).fetchone()
-                    suggestion_name = (name["display_name"] if name else str(pick))
-                else:
-                    name = db.execute("SELECT name FROM members WHERE key=?", (pick,)).fetchone()
-                    suggestion_name = (name["name"] if name else str(pick))
-
-    if multi:
-        members_ctx = [{"user_id": m["user_id"], "member_key": m["member_key"], "display_name": m["display_name"]} for m in members]
-    else:
-        members_ctx = [{"key": m["member_key"], "name": m["display_name"]} for m in members]
-
-    if multi:
-        carpool_options = db.execute("""
-            SELECT c.id, c.name
-            FROM carpools c
-            JOIN carpool_memberships cm ON cm.carpool_id=c.id
-            WHERE cm.user_id=? AND cm.active=1 AND c.active=1
-            ORDER BY c.name
-        """, (uid,)).fetchall()
+    summary = day_summary(db, selected_day, existing, roles_form, multi=multi, cid=cid)
 
     return render_template_string(
         TODAY_TMPL,
         selected_day=selected_day.isoformat(),
-        members=members_ctx,
+        members=members_context(members, multi=multi),
         roles=roles_form,
-        credits=credits,
-        suggestion_name=suggestion_name,
-        driver_is_explicit=driver_is_explicit,
+        credits=summary["credits"],
+        suggestion_name=summary["suggestion_name"],
+        driver_is_explicit=summary["driver_is_explicit"],
         can_edit=can_edit,
-        no_carpool=no_carpool_day,
+        no_carpool=summary["no_carpool"],
         multi=multi,
-        carpool_options=carpool_options
+        live_version=live_version,
+        live_streams=LIVE_MAX_STREAMS > 0,
+        **get_navbar_context()
     )
+
+@todaybp.route("/today/role", methods=["POST"])
+@login_required
+def set_role():
+    """
+    One role change from the Today page (form fields day, who, role).
+    Returns the day's credits and driver as JSON so the page updates in place:
+    the balances before the day come from credit_base()'s cache and only the
+    day's own contribution is recomputed.
+    """
+    db = get_db()
+    multi = _is_multi_mode(db)
+    selected_day = parse_day(request.form.get("day") or "")
+    cid = session.get("carpool_id") if multi else None
+    if multi and not cid:
+        return jsonify(error="No NerdPool selected."), 400
+    db = get_db(cid)
+    if not can_edit_day(selected_day):
+        return jsonify(error=locked_message(selected_day)), 403
+
+    role = request.form.get("role")
+    if role not in ROLE_CHOICES:
+        return jsonify(error="Bad role value"), 400
+
+    with transaction(db):
+        members, existing, roles_form = load_day(db, multi=multi, cid=cid, selected_day=selected_day)
+        who = request.form.get("who", "")
+        if multi:
+            who = int(who) if who.isdigit() else None
+        if who not in roles_form:
+            return jsonify(error="Not an active member of this NerdPool."), 400
+
+        old = dict(existing)
+        if existing.get(who) != role:
+            base = credit_base(db, selected_day, multi=multi, cid=cid)
+            save_roles(db, [(who, role)], multi=multi, cid=cid, selected_day=selected_day)
+            if multi:
+                _keep_credit_base(db, cid, selected_day, base)
+            existing[who] = role
+            roles_form[who] = role
+
+    summary = day_summary(db, selected_day, existing, roles_form, multi=multi, cid=cid)
+
+    delta = {}
+    if selected_day <= date.today():
+        before, after = day_credits(old), day_credits(existing)
+        delta = {
+            str(w): after.get(w, 0) - before.get(w, 0)
+            for w in set(before) | set(after)
+            if after.get(w, 0) != before.get(w, 0)
+        }
+
+    return jsonify(
+        day=selected_day.isoformat(),
+        who=who,
+        role=role,
+        delta=delta,
+        **_summary_json(summary, roles_form),
+    )
+
+def _summary_json(summary, roles_form: dict) -> dict:
+    """The parts of day_summary() the Today page script patches in place."""
+    return {
+        "credits": {str(w): summary["credits"].get(w, 0) for w in roles_form},
+        "driver": None if summary["suggestion"] is None else {
+            "who": summary["suggestion"],
+            "name": summary["suggestion_name"],
+            "explicit": summary["driver_is_explicit"],
+        },
+        "no_carpool": summary["no_carpool"],
+    }
+
+# ------------ Live updates (Server-Sent Events) ------------
+# Opt-in (constants.LIVE_MAX_STREAMS): each open stream holds a request thread,
+# so they are capped below the process's thread count; with the default 0 the
+# route is off and the page polls /api/v1/today with its ETag instead.
+# Streams poll PRAGMA data_version (free, no table read) and only look at
+# the carpool's entries version when the database changed, which also picks
+# up writes made by other workers. Streams end after LIVE_MAX_SECONDS and
+# the browser reconnects with Last-Event-ID, so dead clients never pin a slot.
+LIVE_POLL_SECONDS = 1.0
+LIVE_HEARTBEAT_SECONDS = 15.0
+LIVE_MAX_SECONDS = 300.0
+LIVE_RETRY_MS = 3000
+
+_live_slots = threading.BoundedSemaphore(max(LIVE_MAX_STREAMS, 1))
+
+def _sse(event: str, data: dict, event_id=None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def _live_events(cid: int, selected_day: date, version: int):
+    # stream_with_context keeps the request's g.db open until the stream ends
+    db = get_db(cid)
+    day_iso = selected_day.isoformat()
+    data_version = None
+    now = time.monotonic()
+    deadline, next_ping = now + LIVE_MAX_SECONDS, now + LIVE_HEARTBEAT_SECONDS
+    yield f"retry: {LIVE_RETRY_MS}\n\n"
+    while time.monotonic() < deadline:
+        dv = db.execute("PRAGMA data_version").fetchone()[0]
+        if dv != data_version:
+            data_version = dv
+            current, days = changes_since(db, cid, version)
+            if current != version:
+                version = current
+                payload = {"version": current, "days": days}
+                # Only days up to the viewed one move its credits or roles
+                if days is None or days[0] <= day_iso:
+                    _members, existing, roles_form = load_day(db, multi=True, cid=cid, selected_day=selected_day)
+                    summary = day_summary(db, selected_day, existing, roles_form, multi=True, cid=cid)
+                    payload.update(_summary_json(summary, roles_form))
+                    payload["roles"] = {str(w): r for w, r in roles_form.items()}
+                yield _sse("entries", payload, current)
+                next_ping = time.monotonic() + LIVE_HEARTBEAT_SECONDS
+        if time.monotonic() >= next_ping:
+            yield ": ping\n\n"
+            next_ping = time.monotonic() + LIVE_HEARTBEAT_SECONDS
+        time.sleep(LIVE_POLL_SECONDS)
+
+@todaybp.route("/today/live")
+@login_required
+def live():
+    """
+    SSE stream for the Today page (?day=YYYY-MM-DD): an `entries` event with
+    the changed days, and the viewed day's roles/credits/driver when they
+    could have moved, each time the selected carpool's entries change.
+    Starts after ?since=<version> (or Last-Event-ID) when given. 404 unless
+    NP_LIVE_MAX_STREAMS enables it.
+    """
+    if not LIVE_MAX_STREAMS:
+        return ("Live updates are off", 404)
+    db = get_db()
+    cid = session.get("carpool_id") if _is_multi_mode(db) else None
+    if not cid:
+        return ("No NerdPool selected", 404)
+    if not _live_slots.acquire(blocking=False):
+        resp = Response("Too many live connections", status=503, mimetype="text/plain")
+        resp.headers["Retry-After"] = "30"
+        return resp
+
+    released = []
+    def _release():
+        if not released:
+            released.append(True)
+            _live_slots.release()
+
+    try:
+        selected_day = parse_day(request.args.get("day") or date.today().isoformat())
+        # A reconnect after a refused or closed stream passes the version it has seen
+        last_id = request.headers.get("Last-Event-ID") or request.args.get("since", "")
+        version = int(last_id) if last_id.isdigit() else carpool_version(get_db(cid), cid)
+        resp = Response(
+            stream_with_context(_live_events(int(cid), selected_day, version)),
+            mimetype="text/event-stream",
+        )
+    except Exception:
+        _release()
+        raise
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # don't let a proxy buffer the stream
+    resp.call_on_close(_release)
+    return resp
@@ -0,0 +1,112 @@
+# schedule_patterns.py
+"""
+Recurring weekly roles per membership ("Eric is off on Fridays").
+
+Patterns are stored as one row per (member, weekday, date span) in
+weekly_patterns and never written into `entries`. Readers overlay them at
+query time: for any day a pattern covers, a member without an explicit entry
+gets the pattern's role, exactly as if that entry had been saved. Explicit
+rows always win.
+
+A pattern only applies from its start_day, so adding or changing one never
+rewrites past credits. Changing a member's week ends their current patterns
+the day before the new ones start.
+"""
+from datetime import date, datetime, timedelta
+
+from db import transaction
+from entry_store import entries_changed
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def _to_date(s) -> date:
+    return s if isinstance(s, date) else datetime.strptime(str(s)[:10], "%Y-%m-%d").date()
+
+def load_patterns(db, carpool_id):
+    """All patterns of a carpool, oldest start first (later starts win on overlap)."""
+    if carpool_id is None:
+        return []
+    return load_patterns_by_carpool(db, [carpool_id]).get(int(carpool_id), [])
+
+def load_patterns_by_carpool(db, carpool_ids) -> dict:
+    """load_patterns() for several carpools with one query: {carpool_id: [rows]}."""
+    out = {}
+    if not carpool_ids:
+        return out
+    marks = ",".join("?" * len(carpool_ids))
+    for p in db.execute(f"""
+        SELECT carpool_id, user_id, weekday, role, start_day, end_day
+        FROM weekly_patterns
+        WHERE carpool_id IN ({marks})
+        ORDER BY start_day, id
+    """, tuple(int(c) for c in carpool_ids)).fetchall():
+        out.setdefault(p["carpool_id"], []).append(p)
+    return out
+
+def pattern_roles(patterns, lo: date | None, hi: date) -> dict:
+    """{(day_iso, user_id): role} for every day in [lo, hi) a pattern covers."""
+    out = {}
+    for p in patterns:
+        start = _to_date(p["start_day"])
+        if lo is not None and lo > start:
+            start = lo
+        end = hi
+        if p["end_day"]:
+            end = min(end, _to_date(p["end_day"]) + timedelta(days=1))
+        d = start + timedelta(days=(p["weekday"] - start.weekday()) % 7)
+        while d < end:
+            out[(d.isoformat(), p["user_id"])] = p["role"]
+            d += timedelta(days=7)
+    return out
+
+def overlay(rows, patterns, lo: date | None, hi: date, who_field: str = "who"):
+    """
+    `rows` (explicit entries with day/<who_field>/role) plus a virtual row for
+    each pattern day in [lo, hi) that has no explicit entry for that member.
+    """
+    if not patterns:
+        return rows
+    explicit = {(str(r["day"])[:10], r[who_field]) for r in rows}
+    out = list(rows)
+    for (day, who), role in pattern_roles(patterns, lo, hi).items():
+        if (day, who) not in explicit:
+            out.append({"day": day, who_field: who, "role": role})
+    return out
+
+def member_week(db, carpool_id, user_id, on: date) -> dict:
+    """{weekday: role} of the member's patterns in force on `on` (or starting later)."""
+    week = {}
+    for p in db.execute("""
+        SELECT weekday, role FROM weekly_patterns
+        WHERE carpool_id=? AND user_id=? AND (end_day IS NULL OR end_day >= ?)
+        ORDER BY start_day, id
+    """, (carpool_id, user_id, on.isoformat())).fetchall():
+        week[p["weekday"]] = p["role"]
+    return week
+
+def _end_patterns(db, carpool_id, user_id, last_day: date) -> int:
+    dropped = db.execute(
+        "DELETE FROM weekly_patterns WHERE carpool_id=? AND user_id=? AND start_day > ?",
+        (carpool_id, user_id, last_day.isoformat())
+    ).rowcount
+    return dropped + db.execute(
+        "UPDATE weekly_patterns SET end_day=? WHERE carpool_id=? AND user_id=? AND (end_day IS NULL OR end_day > ?)",
+        (last_day.isoformat(), carpool_id, user_id, last_day.isoformat())
+    ).rowcount
+
+def end_patterns(db, carpool_id, user_id, last_day: date):
+    """Stop a member's patterns after `last_day`; ones that had not started are dropped."""
+    with transaction(db):
+        if _end_patterns(db, carpool_id, user_id, last_day):
+            entries_changed(db, carpool_id, None, ride_stats=False)
+
+def set_member_week(db, carpool_id, user_id, week: dict, start: date):
+    """Replace a member's weekly pattern from `start` on; week = {weekday: role}."""
+    with transaction(db):
+        _end_patterns(db, carpool_id, user_id, start - timedelta(days=1))
+        db.executemany(
+            "INSERT INTO weekly_patterns(carpool_id, user_id, weekday, role, start_day) VALUES (?,?,?,?,?)",
+            [(carpool_id, user_id, wd, role, start.isoformat()) for wd, role in sorted(week.items())]
+        )
+        entries_changed(db, carpool_id, None, ride_stats=False)
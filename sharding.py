@@ -0,0 +1,263 @@
+# sharding.py
+"""
+Optional per-carpool database files ("shards").
+
+Every carpool's entries normally share the main DB, and with it one write
+lock: a busy carpool's morning saves queue up behind each other and hold up
+every other carpool's. A sharded carpool keeps its rows of db.SHARD_TABLES
+(entries, the event journal, ride stats, patterns, archive bookkeeping and
+its data counters) in shards/carpool<id>.db next to the main DB. Users,
+carpools, memberships and everything else stay in the main DB, which is the
+catalog: carpool_shards lists the sharded carpools, and db.get_db(carpool_id)
+returns the shard's connection with the catalog attached, so the same
+queries run on either. Saves to different shards don't wait on each other.
+
+`manage.py shard` moves carpools out, `manage.py unshard` moves them back.
+Both copy and count-check the rows before switching carpool_shards and
+deleting the originals. Run them with the app stopped: a request that has
+already looked up where a carpool lives would write to the old place.
+"""
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from db import (SHARD_TABLES, transaction, db_file, shards_dir, shard_paths, open_shard, forget_shards,
+                _connect)
+from entry_store import entries_changed, log_upserts
+from entry_import import _UPSERT
+
+# Strips table-level FOREIGN KEY clauses: they can't point into the attached catalog
+_FOREIGN_KEY = re.compile(
+    r",\s*FOREIGN KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)"
+    r"(\s+ON\s+(DELETE|UPDATE)\s+(CASCADE|RESTRICT|NO ACTION|SET NULL|SET DEFAULT))*",
+    re.IGNORECASE,
+)
+
+# The carpool's rows of a shard table; cache_versions has no carpool_id
+_OWNED = "carpool_id = ?"
+_OWNED_VERSIONS = "(name = 'entries:' || ? OR name LIKE 'entry_events:%')"
+
+
+def _file_name(cid: int) -> str:
+    return f"carpool{int(cid)}.db"
+
+def _where(table: str) -> str:
+    return _OWNED_VERSIONS if table == "cache_versions" else _OWNED
+
+def shard_schema(db) -> str:
+    """CREATE statements for the shard tables and their indexes, copied from the catalog."""
+    marks = ",".join("?" * len(SHARD_TABLES))
+    rows = db.execute(f"""
+        SELECT sql FROM main.sqlite_master
+        WHERE tbl_name IN ({marks}) AND sql IS NOT NULL
+        ORDER BY type = 'index', name
+    """, SHARD_TABLES).fetchall()
+    return ";\n".join(_FOREIGN_KEY.sub("", r[0]) for r in rows) + ";"
+
+def _counts(db, schema: str, cid: int) -> dict:
+    return {t: db.execute(f"SELECT COUNT(*) FROM {schema}.{t} WHERE {_where(t)}", (cid,)).fetchone()[0]
+            for t in SHARD_TABLES}
+
+def is_sharded(db, cid) -> bool:
+    return db.execute("SELECT 1 FROM carpool_shards WHERE carpool_id=?", (int(cid),)).fetchone() is not None
+
+
+def shard_carpool(db, cid) -> dict:
+    """
+    Move a carpool's rows into its own file. `db` is the catalog.
+    Returns {table: rows moved}.
+    """
+    cid = int(cid)
+    if is_sharded(db, cid):
+        raise ValueError(f"carpool {cid} is already sharded")
+    os.makedirs(shards_dir(db), exist_ok=True)
+    path = os.path.join(shards_dir(db), _file_name(cid))
+    for leftover in (path, path + "-wal", path + "-shm"):
+        # An interrupted run left a copy the catalog never switched to
+        if os.path.exists(leftover):
+            os.remove(leftover)
+
+    # The catalog write lock keeps the carpool's rows still while they are copied
+    with transaction(db):
+        want = _counts(db, "main", cid)
+        shard = open_shard(db_file(db), path, cid)
+        try:
+            shard.executescript(shard_schema(db))
+            with transaction(shard):
+                for t in SHARD_TABLES:
+                    shard.execute(f"INSERT INTO main.{t} SELECT * FROM catalog.{t} WHERE {_where(t)}", (cid,))
+            got = _counts(shard, "main", cid)
+        finally:
+            shard.close()
+        if got != want:
+            raise RuntimeError(f"carpool {cid}: shard copy has {got}, expected {want}")
+        # The shard is committed; switching is one catalog transaction
+        db.execute("INSERT INTO carpool_shards(carpool_id, path) VALUES (?,?)", (cid, _file_name(cid)))
+        for t in SHARD_TABLES:
+            if t != "cache_versions":
+                db.execute(f"DELETE FROM {t} WHERE carpool_id=?", (cid,))
+        db.execute("DELETE FROM cache_versions WHERE name = 'entries:' || ?", (cid,))
+    forget_shards()
+    return want
+
+def unshard_carpool(db, cid) -> dict:
+    """
+    Move a sharded carpool's rows back into the catalog and delete its file.
+    Returns {table: rows moved}.
+    """
+    cid = int(cid)
+    path = shard_paths(db).get(cid)
+    if path is None:
+        raise ValueError(f"carpool {cid} is not sharded")
+    forget_shards()
+    db.execute("ATTACH DATABASE ? AS shard", (path,))
+    try:
+        # BEGIN IMMEDIATE locks the attached shard as well, so nothing writes to it meanwhile
+        with transaction(db):
+            want = _counts(db, "shard", cid)
+            top = db.execute("SELECT COALESCE(MAX(id), 0) FROM main.entry_events").fetchone()[0]
+            for t in SHARD_TABLES:
+                cols = [r[1] for r in db.execute(f"PRAGMA shard.table_info({t})").fetchall()]
+                if t == "cache_versions":
+                    db.execute(f"""
+                        INSERT INTO main.cache_versions(name, version)
+                        SELECT name, version FROM shard.cache_versions WHERE {_OWNED_VERSIONS}
+                        ON CONFLICT(name) DO UPDATE SET version = MAX(version, excluded.version)
+                    """, (cid,))
+                elif t == "entry_events":
+                    # Ids above the catalog's, in the same order: sync clients replay the
+                    # carpool's journal rather than miss events behind their cursor
+                    rest = ", ".join(c for c in cols if c != "id")
+                    db.execute(f"""
+                        INSERT INTO main.entry_events(id, {rest})
+                        SELECT id + ?, {rest} FROM shard.entry_events WHERE carpool_id=? ORDER BY id
+                    """, (top, cid))
+                elif t in ("entries", "weekly_patterns"):
+                    # Row ids are only unique within a file; the catalog assigns new ones in order
+                    names = ", ".join(c for c in cols if c != "id")
+                    db.execute(f"""
+                        INSERT INTO main.{t}({names}) SELECT {names} FROM shard.{t} WHERE carpool_id=? ORDER BY id
+                    """, (cid,))
+                else:
+                    db.execute(f"INSERT INTO main.{t} SELECT * FROM shard.{t} WHERE carpool_id=?", (cid,))
+            got = _counts(db, "main", cid)
+            # The catalog may hold journal counters the shard never saw
+            if any(got[t] != want[t] for t in SHARD_TABLES if t != "cache_versions"):
+                raise RuntimeError(f"carpool {cid}: catalog has {got}, expected {want}")
+            db.execute("DELETE FROM carpool_shards WHERE carpool_id=?", (cid,))
+            # Moved rows got new ids; open pages and ETags reload
+            entries_changed(db, cid, None, ride_stats=False)
+    finally:
+        db.execute("DETACH DATABASE shard")
+    for f in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(f):
+            os.remove(f)
+    return want
+
+def drop_shard(db, cid):
+    """Forget a purged carpool's shard and delete its file (no-op if it has none)."""
+    path = shard_paths(db).get(int(cid))
+    if path is None:
+        return
+    forget_shards()
+    db.execute("DELETE FROM carpool_shards WHERE carpool_id=?", (int(cid),))
+    for f in (path, path + "-wal", path + "-shm"):
+        if os.path.exists(f):
+            os.remove(f)
+
+
+# --- Benchmark -----------------------------------------------------------------
+def _bench_catalog(db, path: str, carpools: int, members: int):
+    """A new DB with the live schema and `carpools` carpools of `members` users each."""
+    conn = _connect(path)
+    for (sql,) in db.execute("""
+        SELECT sql FROM main.sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+        ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END
+    """).fetchall():
+        conn.execute(sql)
+    with transaction(conn):
+        for cid in range(1, carpools + 1):
+            conn.execute("INSERT INTO carpools(id, name) VALUES (?,?)", (cid, f"Bench {cid}"))
+            for n in range(members):
+                uid = (cid - 1) * members + n + 1
+                conn.execute("INSERT INTO users(id, username, password_hash) VALUES (?,?,'')", (uid, f"bench{uid}"))
+                conn.execute("""
+                    INSERT INTO carpool_memberships(carpool_id, user_id, member_key, display_name)
+                    VALUES (?,?,?,?)
+                """, (cid, uid, f"B{uid}", f"Bench {uid}"))
+    conn.close()
+
+def _saver(connect, cid: int, members: int, deadline: float, latencies: list):
+    """Save one role at a time, like the Today page, until `deadline`."""
+    conn = connect(cid)
+    start, n = date(2020, 1, 1), 0
+    try:
+        while time.perf_counter() < deadline:
+            day = (start + timedelta(days=n // members)).isoformat()
+            uid = (cid - 1) * members + n % members + 1
+            role = "D" if n % members == 0 else "R"
+            t0 = time.perf_counter()
+            with transaction(conn):
+                key = conn.execute(
+                    "SELECT member_key FROM carpool_memberships WHERE carpool_id=? AND user_id=?", (cid, uid)
+                ).fetchone()[0]
+                log_upserts(conn, cid, [(day, uid, role)], "bench")
+                conn.execute(_UPSERT, (cid, day, uid, key, role, "bench"))
+                entries_changed(conn, cid, [day])
+            latencies.append(time.perf_counter() - t0)
+            n += 1
+    finally:
+        conn.close()
+
+def _run_savers(connect, carpools: int, members: int, seconds: float) -> list:
+    """Latencies of every save made by one thread per carpool in `seconds`."""
+    deadline = time.perf_counter() + seconds
+    per_thread = [[] for _ in range(carpools)]
+    threads = [threading.Thread(target=_saver, args=(connect, cid, members, deadline, per_thread[cid - 1]))
+               for cid in range(1, carpools + 1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(x for lat in per_thread for x in lat)
+
+def bench_writes(db, carpools: int = 8, members: int = 6, seconds: float = 5.0, report=print) -> list:
+    """
+    Concurrent saves, one thread (connection) per carpool, into a single file
+    and into one shard per carpool with a shared catalog; the schema is read
+    from `db`. Returns [(measure, single, sharded)].
+    """
+    # Next to the live DB, so the files sit on the same disk
+    with tempfile.TemporaryDirectory(prefix="bench-shards-", dir=os.path.dirname(db_file(db))) as tmp:
+        single = os.path.join(tmp, "single.db")
+        catalog = os.path.join(tmp, "catalog.db")
+        for path in (single, catalog):
+            _bench_catalog(db, path, carpools, members)
+        ddl = shard_schema(db)
+        for cid in range(1, carpools + 1):
+            shard = open_shard(catalog, os.path.join(tmp, _file_name(cid)), cid)
+            shard.executescript(ddl)
+            shard.close()
+
+        runs = [
+            _run_savers(lambda cid: _connect(single), carpools, members, seconds),
+            _run_savers(lambda cid: open_shard(catalog, os.path.join(tmp, _file_name(cid)), cid),
+                        carpools, members, seconds),
+        ]
+    pct = lambda lat, p: 1000 * lat[min(int(len(lat) * p), len(lat) - 1)] if lat else 0.0
+    cases = [
+        ("saves", lambda lat: len(lat)),
+        ("saves/s", lambda lat: len(lat) / seconds),
+        ("p50 latency (ms)", lambda lat: pct(lat, 0.50)),
+        ("p95 latency (ms)", lambda lat: pct(lat, 0.95)),
+        ("max latency (ms)", lambda lat: pct(lat, 1.0)),
+    ]
+    results = []
+    for name, f in cases:
+        a, b = f(runs[0]), f(runs[1])
+        results.append((name, a, b))
+        report(f"{name:<20} {a:>12,.1f} {b:>12,.1f}" if isinstance(a, float) else f"{name:<20} {a:>12,} {b:>12,}")
+    return results
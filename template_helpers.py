@@ -5,24 +5,30 @@ This ensures the navbar always has the necessary variables to display properly.
 """
 from flask import session
 from db import get_db
+from cache import VersionedCache
 
-def get_navbar_context():
+# Carpool selector options per user. Membership and carpool edits call
+# invalidate_carpool_options(); other workers follow via the shared version.
+carpool_options_cache = VersionedCache("carpool_options", maxsize=1024, ttl=300.0, recheck=2.0)
+
+def invalidate_carpool_options(db, user_id=None):
+    """Forget one user's carpool list (or everyone's, e.g. after a carpool change)."""
+    carpool_options_cache.invalidate(db, None if user_id is None else int(user_id))
+
+def get_user_carpools(user_id):
     """
-    Returns a dict with all context variables needed for the navbar to render properly.
-    Should be called by every route that renders a template with BASE_TMPL.
-    
-    Returns:
-        dict: {
-            'carpool_options': list of {id, name} dicts for carpool selector,
-            'is_admin': bool indicating if current user is admin
-        }
+    Returns the user's active carpools as a list of {id, name} dicts, ordered by name.
+    Served from carpool_options_cache; the database is only hit on a miss.
     """
+    if not user_id:
+        return []
+    carpool_options_cache.sync(get_db)
+    options = carpool_options_cache.get(int(user_id))
+    if options is not None:
+        return options
+
     db = get_db()
-    user_id = session.get("user_id")
-    is_admin = bool(session.get("is_admin"))
-    
-    carpool_options = []
-    
+    options = []
     # Check if multi-carpool mode is available
     try:
         # Check if the necessary tables exist
@@ -31,20 +37,34 @@ def get_navbar_context():
             WHERE type='table' AND name IN ('carpools', 'carpool_memberships')
         """).fetchall()
         
-        if len(tables) == 2 and user_id:
+        if len(tables) == 2:
             # Fetch user's carpools
-            carpool_options = db.execute("""
+            options = [dict(id=r["id"], name=r["name"]) for r in db.execute("""
                 SELECT c.id, c.name
                 FROM carpools c
                 JOIN carpool_memberships cm ON cm.carpool_id = c.id
-                WHERE cm.user_id = ? AND cm.active = 1
+                WHERE cm.user_id = ? AND cm.active = 1 AND c.active = 1
                 ORDER BY c.name
-            """, (user_id,)).fetchall()
+            """, (user_id,)).fetchall()]
     except Exception:
         # If there's any error (e.g., tables don't exist), just return empty list
-        pass
+        return []
+
+    carpool_options_cache.set(int(user_id), options)
+    return options
+
+def get_navbar_context():
+    """
+    Returns a dict with all context variables needed for the navbar to render properly.
+    Should be called by every route that renders a template with BASE_TMPL.
     
+    Returns:
+        dict: {
+            'carpool_options': list of {id, name} dicts for carpool selector,
+            'is_admin': bool indicating if current user is admin
+        }
+    """
     return {
-        'carpool_options': carpool_options,
-        'is_admin': is_admin
+        'carpool_options': get_user_carpools(session.get("user_id")),
+        'is_admin': bool(session.get("is_admin"))
     }
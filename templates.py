@@ -113,6 +113,10 @@ BASE_TMPL = r"""
     {% endif %}
 
     <a class="btn btn-sm" href="{{ url_for('todaybp.today') }}">Schedule</a>
+    <a class="btn btn-sm" href="{{ url_for('calendarbp.month_view') }}">Calendar</a>
+    {% if carpool_options and carpool_options|length > 1 %}
+      <a class="btn btn-sm" href="{{ url_for('dashboardbp.dashboard') }}">My NerdPools</a>
+    {% endif %}
     {% if not is_admin %}
       <a class="btn btn-sm" href="{{ url_for('historybp.history') }}">History</a>
     {% endif %}
@@ -129,6 +133,25 @@ BASE_TMPL = r"""
   const burger = document.getElementById('burger');
   const nav = document.getElementById('navLinks');
   if (burger && nav) burger.onclick = () => nav.classList.toggle('show');
+
+  // <input data-typeahead="/url" list="id">: fill the datalist from /url?q=...
+  let typeaheadTimer = null;
+  document.addEventListener('input', (ev) => {
+    const inp = ev.target;
+    if (!inp.dataset || !inp.dataset.typeahead) return;
+    clearTimeout(typeaheadTimer);
+    const q = inp.value.trim();
+    const list = document.getElementById(inp.getAttribute('list'));
+    if (!q || !list) return;
+    typeaheadTimer = setTimeout(() => {
+      fetch(inp.dataset.typeahead + '?q=' + encodeURIComponent(q), {credentials: 'same-origin'})
+        .then(r => r.ok ? r.json() : [])
+        .then(names => {
+          list.replaceChildren(...names.map(n => Object.assign(document.createElement('option'), {value: n})));
+        })
+        .catch(() => {});
+    }, 150);
+  });
 </script>
 
 
@@ -257,9 +280,7 @@ TODAY_TMPL = r"""
             window.location.href = '/today?day=' + this.value;
           });
         </script>
-          {% if no_carpool %}
-            <span class="badge" title="Fewer than two active">No NerdPool Today</span>
-          {% endif %}
+          <span class="badge" id="noCarpoolBadge" title="Fewer than two active" {{ '' if no_carpool else 'style=display:none' }}>No NerdPool Today</span>
         </div>
 
         
@@ -280,13 +301,13 @@ TODAY_TMPL = r"""
                 <tr>
                   <td>{{ label }}</td>
                   <td>
-                    <select class="form-select" name="{{ field }}" {{ 'disabled' if not can_edit else '' }}>
+                    <select class="form-select role-select" name="{{ field }}" data-who="{{ key_for_roles }}" {{ 'disabled' if not can_edit else '' }}>
                       <option value="D" {{ 'selected' if current=='D' else '' }}>Driver</option>
                       <option value="R" {{ 'selected' if current=='R' else '' }}>Rider</option>
                       <option value="O" {{ 'selected' if current=='O' else '' }}>Off</option>
                     </select>
                   </td>
-                  <td style="text-align:right;"><span class="muted">{{ credit_val }}</span></td>
+                  <td style="text-align:right;"><span class="muted" data-credit-for="{{ key_for_roles }}">{{ credit_val }}</span></td>
                 </tr>
               {% endfor %}
               {% if not members %}
@@ -296,14 +317,103 @@ TODAY_TMPL = r"""
           </table>
         </div>
         
-            {% if suggestion_name %}
-                <div class="callout {{ 'callout-success' if driver_is_explicit else 'callout-info' }}">
-                <!-- <div class="title">{{ 'Driver set' if driver_is_explicit else 'Suggested driver' }}</div> -->
-                <strong>{{ suggestion_name }}</strong> {{ 'is driving.' if driver_is_explicit else 'should drive.' }}
-                </div>
-            {% endif %}
+            <div id="driverCallout" class="callout {{ 'callout-success' if driver_is_explicit else 'callout-info' }}" {{ '' if suggestion_name else 'style=display:none' }}>
+            <!-- <div class="title">{{ 'Driver set' if driver_is_explicit else 'Suggested driver' }}</div> -->
+            <strong>{{ suggestion_name or '' }}</strong> <span>{{ 'is driving.' if driver_is_explicit else 'should drive.' }}</span>
+            </div>
         
       </form>
+
+      <script>
+        // Patch credits, roles and the driver callout from a JSON day summary
+        function applyDay(data) {
+          if (data.credits) {
+            Object.keys(data.credits).forEach(function(who) {
+              var cell = document.querySelector('[data-credit-for="' + who + '"]');
+              if (cell) cell.textContent = data.credits[who];
+            });
+          }
+          if (data.roles) {
+            Object.keys(data.roles).forEach(function(who) {
+              var sel = document.querySelector('.role-select[data-who="' + who + '"]');
+              if (sel && sel !== document.activeElement) sel.value = data.roles[who];
+            });
+          }
+          if (data.no_carpool === undefined) return;
+          document.getElementById('noCarpoolBadge').style.display = data.no_carpool ? '' : 'none';
+          var callout = document.getElementById('driverCallout');
+          if (data.driver) {
+            callout.className = 'callout ' + (data.driver.explicit ? 'callout-success' : 'callout-info');
+            callout.querySelector('strong').textContent = data.driver.name;
+            callout.querySelector('span').textContent = data.driver.explicit ? 'is driving.' : 'should drive.';
+            callout.style.display = '';
+          } else {
+            callout.style.display = 'none';
+          }
+        }
+
+        {% if can_edit %}
+        // Save each role change as it happens; the Save button still works as a full form post.
+        document.querySelectorAll('.role-select').forEach(function(sel) {
+          sel.addEventListener('change', function() {
+            var body = new FormData();
+            body.append('day', document.getElementById('dayInput').value);
+            body.append('who', sel.dataset.who);
+            body.append('role', sel.value);
+            fetch('{{ url_for("todaybp.set_role") }}', {method: 'POST', body: body, credentials: 'same-origin'})
+              .then(function(r) { return r.json().then(function(j) { return [r.ok, j]; }); })
+              .then(function(res) {
+                if (!res[0]) { alert(res[1].error || 'Save failed'); return; }
+                applyDay(res[1]);
+              })
+              .catch(function() { alert('Save failed; use the Save button.'); });
+          });
+        });
+        {% endif %}
+
+        {% if multi and session.get('carpool_id') and not live_streams %}
+        // Pick up other members' changes by polling the day's JSON; a 304 (same ETag) costs next to nothing
+        (function() {
+          var etag = null;
+          setInterval(function() {
+            if (document.hidden) return;
+            var headers = etag ? {'If-None-Match': etag} : {};
+            fetch('{{ url_for("apibp.today", day=selected_day) }}', {headers: headers, cache: 'no-store', credentials: 'same-origin'})
+              .then(function(r) {
+                if (r.status !== 200) return;
+                etag = r.headers.get('ETag');
+                return r.json().then(function(j) {
+                  var credits = {}, roles = {};
+                  j.members.forEach(function(m) { credits[m.id] = m.credits; roles[m.id] = m.role; });
+                  applyDay({credits: credits, roles: roles, driver: j.driver, no_carpool: j.no_carpool});
+                });
+              })
+              .catch(function() {});
+          }, 20000);
+        })();
+        {% endif %}
+
+        {% if multi and session.get('carpool_id') and live_streams %}
+        // Live updates when another member changes roles
+        if (window.EventSource) {
+          var liveSince = {{ live_version }}, liveDelay = 5000;
+          (function connect() {
+            var live = new EventSource('{{ url_for("todaybp.live", day=selected_day) }}&since=' + liveSince);
+            live.addEventListener('open', function() { liveDelay = 5000; });
+            live.addEventListener('entries', function(e) {
+              if (e.lastEventId) liveSince = e.lastEventId;
+              applyDay(JSON.parse(e.data));
+            });
+            live.onerror = function() {
+              // A 503 (too many streams) closes it for good: reopen with backoff, not a page reload
+              if (live.readyState !== EventSource.CLOSED) return;
+              setTimeout(connect, liveDelay + Math.random() * 1000);
+              liveDelay = Math.min(liveDelay * 2, 300000);
+            };
+          })();
+        }
+        {% endif %}
+      </script>
     </div>
   </div>
 {% endblock %}